@@ -1,38 +1,258 @@
-from flask import Flask, render_template, request, jsonify
-from recording import rtsp_manager, rtsp_stats
+from flask import Flask, g, render_template, request, jsonify, Response, send_file, stream_with_context
+from recording import (catalog, event_files, highlights, live, metrics, motion, preroll, preview_cache, ptz, relay,
+                       retention, rtsp_manager, stats_backends, stats_history, stats_monitor, store)
+from recording.scheduler import Scheduler
+from concurrent.futures import ThreadPoolExecutor
 import json
+import os
+import threading
+import time
 from datetime import datetime
 
 app = Flask(__name__)
 
-# In-memory store for scheduled recordings
-# A scheduled recording will have: camera_ids (list), start_time, end_time, and type (manual/event)
-scheduled_recordings = []
-
-# Example camera list (this should be dynamically populated based on your camera management system)
-streams = [
-    {'id': 1, 'name': 'Camera 1', 'uri': 'rtsp://192.168.12.111:554/1'},
-    {'id': 2, 'name': 'Camera 2', 'uri': 'rtsp://192.168.12.243:554/1'},
-    {'id': 3, 'name': 'Camera 3', 'uri': 'rtsp://192.168.12.220:554/1'}
-]
-
-# Example event list (this should be dynamically populated from your events management system)
-events = [
-    {'id': 1, 'name': 'Event 1', 'start': '2025-04-01T10:00:00', 'end': '2025-04-01T12:00:00'},
-    {'id': 2, 'name': 'Event 2', 'start': '2025-04-02T14:00:00', 'end': '2025-04-02T16:00:00'}
-]
+# hls.js release used by the live view (keep in step with test_tools/vendor_hls.py)
+HLS_VERSION = '1.5.20'
+
+REQUEST_SECONDS = metrics.Histogram('ptz_http_request_duration_seconds', 'Flask request latency',
+                                    ['method', 'endpoint', 'status'])
+SCHEDULER_LAG = metrics.Histogram('ptz_scheduler_lag_seconds', 'Delay between a schedule instant and its action',
+                                  ['action'], buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5))
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.before_request
+def ensure_background():
+    # Under `flask run` or a WSGI server nothing calls start_background() up
+    # front; the reloader's watcher process never serves, so this is safe
+    if not background_started:
+        start_background()
+
+@app.after_request
+def observe_request_latency(response):
+    # Label by route pattern (not the raw path) so the series stay bounded
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.labels(request.method, endpoint, response.status_code).observe(time.perf_counter() - started)
+    return response
+
+# Scheduled starts and stops run here, not on the scheduler thread: a preset
+# recall waits for the camera to arrive and settle, which would hold up every
+# other schedule due at the same instant
+camera_pool = ThreadPoolExecutor(max_workers=rtsp_manager.BULK_WORKERS, thread_name_prefix='schedule-camera')
+camera_jobs = {}  # { camera_id: Future of the camera's latest queued start/stop }
+camera_jobs_lock = threading.Lock()
+
+def queue_camera_job(camera_id, fn, *args):
+    # Jobs of one camera run in order, so a stop never overtakes its start
+    def run(previous):
+        if previous is not None:
+            previous.exception()  # wait; the previous job reported its own error
+        try:
+            fn(camera_id, *args)
+        except Exception as e:
+            print(f"Scheduled {fn.__name__} for camera {camera_id} failed: {e}")
+
+    with camera_jobs_lock:
+        future = camera_pool.submit(run, camera_jobs.get(camera_id))
+        camera_jobs[camera_id] = future
+
+    def forget(done):
+        with camera_jobs_lock:
+            if camera_jobs.get(camera_id) is done:
+                del camera_jobs[camera_id]
+    future.add_done_callback(forget)
+    return future
+
+def start_scheduled_camera(camera_id, schedule):
+    # Called by the scheduler at a schedule's start instant
+    queue_camera_job(camera_id, start_camera_for_schedule, schedule)
+
+def stop_scheduled_camera(camera_id, schedule):
+    # Called by the scheduler once the last schedule covering the camera ends
+    queue_camera_job(camera_id, stop_camera_for_schedule, schedule)
+
+def start_camera_for_schedule(camera_id, schedule):
+    stream = store.get_stream(camera_id)
+    if stream:
+        settings = schedule.get('settings') or {}
+        camera_settings = settings.get(str(camera_id), settings)
+        if camera_settings.get('preset') is None:
+            rtsp_manager.start_recording(camera_id, stream['uri'], camera_settings)
+            return
+        # Frame the camera on its preset before the first segment is written
+        try:
+            ptz.record_at_preset(camera_id, stream['uri'], camera_settings['preset'], camera_settings)
+        except Exception as e:
+            print(f"Preset recall for camera {camera_id} failed, not recording: {e}")
+
+def stop_camera_for_schedule(camera_id, schedule):
+    settings = schedule.get('settings') or {}
+    camera_settings = settings.get(str(camera_id), settings)
+    stream = store.get_stream(camera_id)
+    if not stream or camera_settings.get('stop_preset') is None:
+        rtsp_manager.stop_recording(camera_id)
+        return
+    try:
+        ptz.stop_at_preset(camera_id, stream['uri'], camera_settings['stop_preset'])
+    except Exception as e:
+        print(f"Preset recall for camera {camera_id} after recording failed: {e}")
+        if camera_id in rtsp_manager.active_recordings:
+            rtsp_manager.stop_recording(camera_id)  # never leave a schedule recording past its end
+
+# Scheduled recordings: camera_ids (list), start_time, end_time, and type (manual/event)
+scheduler = Scheduler(start_scheduled_camera, stop_scheduled_camera,
+                      on_fire=lambda action, schedule, lag: SCHEDULER_LAG.labels(action).observe(lag))
+
+background_started = False
+background_lock = threading.Lock()
+
+def start_background():
+    # Called by the serving process, never on import: the debug reloader
+    # imports this module in two processes, and each would fire the schedules.
+    # Safe to call more than once; only the first call starts anything.
+    global background_started
+    with background_lock:
+        if background_started:
+            return
+        background_started = True
+
+    # Reload the recording plan that has not finished yet
+    for saved in store.list_schedules(ending_after=time.time()):
+        try:
+            scheduler.add(saved['schedule_id'], saved['camera_ids'], saved['start_time'], saved['end_time'],
+                          type=saved['type'], settings=saved['settings'])
+        except ValueError as e:
+            print(f"Not reloading schedule {saved['schedule_id']}: {e}")  # ended while loading
+    scheduler.start()
+
+    # Pick up footage recorded while the app was not running, then start enforcing retention
+    retention.start(catalog.start())
+
+def add_schedule(schedule_id, camera_ids, start_time, end_time, type, settings):
+    # The scheduler validates the times; the store lets a restart reload the plan
+    scheduler.add(schedule_id, camera_ids, start_time, end_time, type=type, settings=settings)
+    store.save_schedule(schedule_id, camera_ids, start_time, end_time, type, settings)
+
+def schedule_to_json(schedule):
+    live = scheduler.get(schedule['schedule_id'])
+    result = {k: schedule[k] for k in ('schedule_id', 'camera_ids', 'start_time', 'end_time', 'type')}
+    result['state'] = live['state'] if live else 'done'
+    return result
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    # Serve the vendored hls.js once test_tools/vendor_hls.py has added it, else the same pinned release
+    hls_vendored = os.path.exists(os.path.join(app.static_folder, 'js', 'vendor', 'hls.min.js'))
+    return render_template('index.html', hls_vendored=hls_vendored, hls_version=HLS_VERSION)
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    # Prometheus text exposition format
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/api/streams', methods=['GET'])
 def get_streams():
-    return jsonify(streams)
+    return jsonify(store.list_streams())
+
+@app.route('/api/streams', methods=['POST'])
+def add_stream_route():
+    data = request.get_json()
+    if not data.get('name') or not data.get('uri'):
+        return jsonify({'error': 'Missing data'}), 400
+    return jsonify(store.add_stream(data['name'], data['uri'])), 201
+
+@app.route('/api/streams/<int:stream_id>', methods=['PUT'])
+def update_stream_route(stream_id):
+    data = request.get_json()
+    if not data.get('name') or not data.get('uri'):
+        return jsonify({'error': 'Missing data'}), 400
+    stream = store.update_stream(stream_id, data['name'], data['uri'])
+    if not stream:
+        return jsonify({'error': 'Stream not found'}), 404
+    ptz.close(stream_id)  # the PTZ host may follow the new URI
+    return jsonify(stream)
+
+@app.route('/api/streams/<int:stream_id>', methods=['DELETE'])
+def delete_stream_route(stream_id):
+    if not store.delete_stream(stream_id):
+        return jsonify({'error': 'Stream not found'}), 404
+    ptz.close(stream_id)
+    return jsonify({'message': f'Stream {stream_id} deleted successfully'})
+
+def event_query_args():
+    # Search and sort shared by the event list and the export
+    sort = request.args.get('sort', 'start')
+    if sort not in store.EVENT_SORTS:
+        raise ValueError(f"sort must be one of {', '.join(store.EVENT_SORTS)}")
+    return {'search': request.args.get('search', '').strip() or None, 'sort': sort,
+            'order': 'desc' if request.args.get('order') == 'desc' else 'asc'}
 
 @app.route('/api/events', methods=['GET'])
 def get_events():
-    return jsonify(events)
+    # One page of events: ?search=&sort=start|end|name|duration&order=asc|desc&offset=&limit=
+    try:
+        query = event_query_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    limit = min(max(request.args.get('limit', 100, type=int), 1), 500)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    return jsonify(store.query_events(offset=offset, limit=limit, **query))
+
+@app.route('/api/events/import', methods=['POST'])
+def import_events_route():
+    # The file is the raw request body (or a multipart "file"); ?format=csv|json|ics
+    upload = request.files.get('file')
+    stream = upload.stream if upload else request.stream
+    fmt = request.args.get('format') or event_files.format_for(upload.filename if upload else None)
+    try:
+        report = event_files.import_events(stream, fmt)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if report['error'] and not report['imported']:
+        return jsonify(dict(report, error=f"Import failed: {report['error']}")), 400
+    return jsonify(report)
+
+@app.route('/api/events/export', methods=['GET'])
+def export_events_route():
+    # Streamed download of the events matching the list's search and sort
+    fmt = request.args.get('format', 'csv')
+    if fmt not in event_files.EXPORTERS:
+        return jsonify({'error': f"format must be one of {', '.join(event_files.FORMATS)}"}), 400
+    try:
+        query = event_query_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    exporter, mimetype = event_files.EXPORTERS[fmt]
+    chunks = exporter(store.iter_events(**query))
+    return Response(stream_with_context(chunks), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=events.{fmt}'})
+
+@app.route('/api/events', methods=['POST'])
+def add_event_route():
+    data = request.get_json()
+    if not data.get('name') or not data.get('start') or not data.get('end'):
+        return jsonify({'error': 'Missing data'}), 400
+    return jsonify(store.add_event(data['name'], data['start'], data['end'], data.get('imageUrl'))), 201
+
+@app.route('/api/events/<int:event_id>', methods=['PUT'])
+def update_event_route(event_id):
+    data = request.get_json()
+    if not data.get('name') or not data.get('start') or not data.get('end'):
+        return jsonify({'error': 'Missing data'}), 400
+    event = store.update_event(event_id, data['name'], data['start'], data['end'], data.get('imageUrl'))
+    if not event:
+        return jsonify({'error': 'Event not found'}), 404
+    return jsonify(event)
+
+@app.route('/api/events/<int:event_id>', methods=['DELETE'])
+def delete_event_route(event_id):
+    if not store.delete_event(event_id):
+        return jsonify({'error': 'Event not found'}), 404
+    return jsonify({'message': f'Event {event_id} deleted successfully'})
 
 @app.route('/api/start_recording', methods=['POST'])
 def start_recording_route():
@@ -40,6 +260,7 @@ def start_recording_route():
     stream_ids = data.get('streamIds')
     start_time = data.get('startTime')
     end_time = data.get('endTime')
+    settings = data.get('settings') or {}
 
     if not stream_ids or not start_time or not end_time:
         return jsonify({'error': 'Missing data'}), 400
@@ -47,23 +268,13 @@ def start_recording_route():
     # Treat all selected cameras as one group for manual scheduling
     schedule_id = f"{start_time}-{end_time}-{','.join(map(str, stream_ids))}"
 
-    # Start recording for each selected camera
-    for stream_id in stream_ids:
-        stream = next((s for s in streams if s['id'] == stream_id), None)
-        if stream:
-            # Start recording for the selected camera
-            rtsp_manager.start_recording(stream_id, stream['uri'])
-
-            # Add the scheduled recording to the list (treat cameras as one entity for manual scheduling)
-            scheduled_recordings.append({
-                'schedule_id': schedule_id,
-                'camera_ids': stream_ids,  # Store all cameras for this schedule
-                'start_time': start_time,
-                'end_time': end_time,
-                'type': 'manual'
-            })
+    # The scheduler starts and stops the recordings at the requested times
+    try:
+        add_schedule(schedule_id, stream_ids, start_time, end_time, 'manual', settings)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-    return jsonify({'message': 'Recording(s) scheduled successfully'})
+    return jsonify({'message': 'Recording(s) scheduled successfully', 'scheduleId': schedule_id})
 
 @app.route('/api/schedule_event', methods=['POST'])
 def schedule_event_route():
@@ -74,42 +285,48 @@ def schedule_event_route():
     if not event_id or not camera_ids:
         return jsonify({'error': 'Missing data'}), 400
 
-    event = next((e for e in events if e['id'] == event_id), None)
+    event = store.get_event(event_id)
     if not event:
         return jsonify({'error': 'Event not found'}), 404
 
     schedule_id = f"event-{event_id}"
 
     # Schedule recording based on the event's start and end times
-    scheduled_recordings.append({
-        'schedule_id': schedule_id,
-        'camera_ids': camera_ids,
-        'start_time': event['start'],
-        'end_time': event['end'],
-        'type': 'event'
-    })
-
-    # Start recording for each selected camera
-    for camera_id in camera_ids:
-        camera = next((s for s in streams if s['id'] == camera_id), None)
-        if camera:
-            rtsp_manager.start_recording(camera_id, camera['uri'])
-
-    return jsonify({'message': 'Event recording(s) scheduled successfully'})
+    try:
+        add_schedule(schedule_id, camera_ids, event['start'], event['end'], 'event',
+                     data.get('settings') or {})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({'message': 'Event recording(s) scheduled successfully', 'scheduleId': schedule_id})
 
 @app.route('/api/scheduled_recordings', methods=['GET'])
 def list_scheduled_recordings():
-    # Return a list of all scheduled recordings (manual and event)
-    return jsonify(scheduled_recordings)
+    # Return all scheduled recordings (manual and event), optionally only those
+    # overlapping ?start=&end= and/or covering ?camera=
+    start = request.args.get('start')
+    end = request.args.get('end')
+    camera_id = request.args.get('camera', type=int)
+    try:
+        if start and end:
+            schedules = store.schedules_overlapping(start, end, camera_id)
+        else:
+            schedules = store.list_schedules()
+            if camera_id is not None:
+                schedules = [s for s in schedules if camera_id in s['camera_ids']]
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify([schedule_to_json(s) for s in schedules])
 
 @app.route('/api/delete_recording', methods=['POST'])
 def delete_recording():
     data = request.get_json()
     schedule_id = data.get('scheduleId')
 
-    # Find and remove the recording by schedule ID
-    global scheduled_recordings
-    scheduled_recordings = [rec for rec in scheduled_recordings if rec['schedule_id'] != schedule_id]
+    # Remove the schedule; cameras it was recording are stopped
+    removed = scheduler.remove(schedule_id)
+    if not store.delete_schedule(schedule_id) and not removed:
+        return jsonify({'error': 'Scheduled recording not found'}), 404
 
     return jsonify({'message': f'Recording with Schedule ID {schedule_id} deleted successfully'})
 
@@ -124,22 +341,470 @@ def edit_recording():
     if not schedule_id or not new_start_time or not new_end_time or not new_camera_ids:
         return jsonify({'error': 'Missing data'}), 400
 
-    # Find and update the scheduled recording
-    recording = next((rec for rec in scheduled_recordings if rec['schedule_id'] == schedule_id), None)
-    if not recording:
+    # Reschedule; running cameras keep recording if the new window still covers now
+    saved = store.get_schedule(schedule_id)
+    if not saved:
         return jsonify({'error': 'Scheduled recording not found'}), 404
+    try:
+        add_schedule(schedule_id, new_camera_ids, new_start_time, new_end_time, saved['type'], saved['settings'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({'message': 'Scheduled recording updated successfully'})
+
+@app.route('/api/preview/<int:stream_id>', methods=['GET'])
+def get_preview(stream_id):
+    stream = store.get_stream(stream_id)
+    if not stream:
+        return jsonify({'error': 'Stream not found'}), 404
+
+    # Latest keyframe JPEG from memory; every viewer shares one decoder
+    jpeg, etag, updated = preview_cache.get_preview(stream_id, stream['uri'])
+    if jpeg is None:
+        return jsonify({'error': 'Preview not available yet'}), 503, {'Retry-After': '1'}
+    headers = {
+        'ETag': etag,
+        'Cache-Control': 'no-cache',
+        'X-Preview-Time': f'{updated:.3f}',
+    }
+    if request.headers.get('If-None-Match') == etag:
+        return Response(status=304, headers=headers)
+    return Response(jpeg, mimetype='image/jpeg', headers=headers)
+
+@app.route('/api/relays', methods=['GET'])
+def list_relays():
+    # Upstream camera connections and the buffers of their consumers
+    return jsonify(relay.list_relays())
+
+@app.route('/api/recorder_health', methods=['GET'])
+def recorder_health():
+    # Per-recorder state, ffmpeg progress, restarts and stall counters
+    return jsonify(rtsp_manager.recording_health())
+
+@app.route('/api/recorders/<any(start, stop, restart):action>', methods=['POST'])
+def bulk_recorders(action):
+    # Start/stop/restart many cameras now; one NDJSON line per camera as it finishes, then a summary
+    data = request.get_json(silent=True) or {}
+    stream_ids = data.get('streamIds')
+    if not stream_ids:
+        return jsonify({'error': 'Missing streamIds'}), 400
+    streams = {stream['id']: stream['uri'] for stream in store.list_streams()}
+    try:
+        targets = {int(i): streams.get(int(i)) for i in stream_ids}
+    except (TypeError, ValueError):
+        return jsonify({'error': 'streamIds must be camera IDs'}), 400
+    unknown = [i for i, uri in targets.items() if uri is None]
+    for stream_id in unknown:
+        del targets[stream_id]
+
+    def generate():
+        began = time.monotonic()
+        failed = len(unknown)
+        for stream_id in unknown:
+            yield json.dumps({'streamId': stream_id, 'action': action, 'ok': False,
+                              'error': 'Stream not found', 'seconds': 0}) + '\n'
+        for result in rtsp_manager.bulk_control(action, targets, data.get('settings')):
+            failed += not result['ok']
+            yield json.dumps(result) + '\n'
+        yield json.dumps({'done': True, 'ok': len(targets) + len(unknown) - failed, 'failed': failed,
+                          'seconds': round(time.monotonic() - began, 3)}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/segments', methods=['GET'])
+def list_segments_route():
+    stream_id = request.args.get('streamId', type=int)
+    if stream_id is None:
+        return jsonify({'error': 'Missing streamId parameter'}), 400
+    return jsonify(rtsp_manager.list_segments(stream_id, request.args.get('location')))
+
+def parse_local_time(value):
+    # Segment names use local time, so convert aware timestamps to naive local ones
+    when = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if when.tzinfo:
+        when = when.astimezone().replace(tzinfo=None)
+    return when
+
+def parse_time_arg(name):
+    # A query argument given as POSIX seconds or as a (local) ISO date
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return parse_local_time(value).timestamp()
+
+@app.route('/api/recordings', methods=['GET'])
+def list_recordings():
+    # One page of the recording catalog; pass "next" back as cursor for the following page
+    stream_ids = request.args.get('streamId')
+    try:
+        stream_ids = [int(i) for i in stream_ids.split(',') if i] if stream_ids else None
+        start, end = parse_time_arg('start'), parse_time_arg('end')
+        page = store.query_segments(stream_ids, start, end, request.args.get('codec'),
+                                    request.args.get('cursor'),
+                                    min(max(request.args.get('limit', 100, type=int), 1), 500),
+                                    request.args.get('order', 'desc') != 'asc')
+    except ValueError:
+        return jsonify({'error': 'Invalid streamId, start, end or cursor'}), 400
+    page['codecs'] = store.segment_codecs()
+    return jsonify(page)
+
+@app.route('/api/recordings/<int:segment_id>/download', methods=['GET'])
+def download_recording(segment_id):
+    segment = store.get_segment(segment_id)
+    if not segment or not os.path.exists(segment['path']):
+        return jsonify({'error': 'Recording not found'}), 404
+    return send_file(os.path.abspath(segment['path']), as_attachment=True)
+
+@app.route('/api/recordings/sync', methods=['POST'])
+def sync_recordings():
+    # Catalog the footage of another recordings directory (or rescan the default one)
+    data = request.json or {}
+    try:
+        added = catalog.sync(data.get('location'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'added': added, 'removed': catalog.prune()})
+
+@app.route('/api/retention', methods=['GET'])
+def retention_status():
+    # Quotas, running per-camera usage and what retention has deleted so far
+    return jsonify(retention.status())
+
+@app.route('/api/retention', methods=['PUT'])
+def update_retention():
+    try:
+        policy = retention.set_policy(request.json or {})
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(policy)
+
+def live_stream(stream_id):
+    # The LL-HLS packager of a camera, started by the first viewer
+    stream = store.get_stream(stream_id)
+    if not stream:
+        return None, (jsonify({'error': 'Stream not found'}), 404)
+    try:
+        return live.get_stream(stream_id, stream['uri']), None
+    except RuntimeError as e:
+        return None, (jsonify({'error': str(e)}), 503)
+
+@app.route('/api/live', methods=['GET'])
+def list_live_streams():
+    # Cameras currently packaged for live view
+    return jsonify(live.list_streams())
+
+@app.route('/live/<int:stream_id>/index.m3u8', methods=['GET'])
+def live_playlist(stream_id):
+    packager, error = live_stream(stream_id)
+    if error:
+        return error
+    # Blocking playlist reload: wait until the requested segment/part exists
+    playlist = packager.playlist(request.args.get('_HLS_msn', type=int), request.args.get('_HLS_part', type=int))
+    if playlist is None:
+        return jsonify({'error': 'Live stream is starting'}), 503
+    return Response(playlist, mimetype='application/vnd.apple.mpegurl', headers={'Cache-Control': 'no-cache'})
+
+@app.route('/live/<int:stream_id>/init.mp4', methods=['GET'])
+def live_init(stream_id):
+    packager, error = live_stream(stream_id)
+    if error:
+        return error
+    data = packager.get_init()
+    if data is None:
+        return jsonify({'error': 'Live stream is starting'}), 503
+    return Response(data, mimetype='video/mp4')
+
+@app.route('/live/<int:stream_id>/part/<int:msn>/<int:part>.m4s', methods=['GET'])
+def live_part(stream_id, msn, part):
+    packager, error = live_stream(stream_id)
+    if error:
+        return error
+    data = packager.get_part(msn, part)  # blocks for preload hints
+    if data is None:
+        return jsonify({'error': 'Part not available'}), 404
+    return Response(data, mimetype='video/iso.segment', headers={'Cache-Control': 'max-age=60'})
+
+@app.route('/live/<int:stream_id>/segment/<int:msn>.m4s', methods=['GET'])
+def live_segment(stream_id, msn):
+    packager, error = live_stream(stream_id)
+    if error:
+        return error
+    data = packager.get_segment(msn)
+    if data is None:
+        return jsonify({'error': 'Segment not available'}), 404
+    return Response(data, mimetype='video/iso.segment', headers={'Cache-Control': 'max-age=60'})
+
+def ptz_controller(stream_id):
+    # The PTZ command pipeline of a camera, connected on first use
+    stream = store.get_stream(stream_id)
+    if not stream:
+        return None, (jsonify({'error': 'Stream not found'}), 404)
+    try:
+        return ptz.get_controller(stream_id, stream['uri']), None
+    except ValueError as e:
+        return None, (jsonify({'error': str(e)}), 400)
 
-    recording['start_time'] = new_start_time
-    recording['end_time'] = new_end_time
-    recording['camera_ids'] = new_camera_ids  # Update camera IDs
+def ptz_axis(data, key):
+    # Joystick axes are -1..1; anything else is clamped
+    try:
+        return max(-1.0, min(1.0, float(data.get(key) or 0)))
+    except (TypeError, ValueError):
+        return 0.0
+
+@app.route('/api/ptz/<int:stream_id>/config', methods=['GET'])
+def get_ptz_config(stream_id):
+    stream = store.get_stream(stream_id)
+    if not stream:
+        return jsonify({'error': 'Stream not found'}), 404
+    config = ptz.get_config(stream_id, stream['uri'])
+    config.pop('password', None)
+    return jsonify(config)
+
+@app.route('/api/ptz/<int:stream_id>/config', methods=['PUT'])
+def update_ptz_config(stream_id):
+    if not store.get_stream(stream_id):
+        return jsonify({'error': 'Stream not found'}), 404
+    try:
+        config = ptz.set_config(stream_id, request.get_json() or {})
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    config.pop('password', None)
+    return jsonify(config)
+
+@app.route('/api/ptz/<int:stream_id>/move', methods=['POST'])
+def ptz_move(stream_id):
+    # Latest joystick state; returns at once, bursts are coalesced per camera
+    controller, error = ptz_controller(stream_id)
+    if error:
+        return error
+    data = request.get_json() or {}
+    accepted = True
+    if 'pan' in data or 'tilt' in data:
+        accepted = controller.move('pan_tilt', ptz_axis(data, 'pan'), ptz_axis(data, 'tilt')) and accepted
+    if 'zoom' in data:
+        accepted = controller.move('zoom', ptz_axis(data, 'zoom')) and accepted
+    if 'focus' in data:
+        accepted = controller.move('focus', ptz_axis(data, 'focus')) and accepted
+    if not accepted:
+        return jsonify({'error': 'Camera is moving to a preset for a recording'}), 409
+    return jsonify({'message': 'ok'}), 202
+
+@app.route('/api/ptz/<int:stream_id>/stop', methods=['POST'])
+def ptz_stop(stream_id):
+    controller, error = ptz_controller(stream_id)
+    if error:
+        return error
+    if not controller.stop_motion():
+        return jsonify({'error': 'Camera is moving to a preset for a recording'}), 409
+    return jsonify({'message': 'ok'}), 202
+
+@app.route('/api/ptz/<int:stream_id>/<any(home, autofocus):action>', methods=['POST'])
+def ptz_action(stream_id, action):
+    controller, error = ptz_controller(stream_id)
+    if error:
+        return error
+    if controller.command(action) is None:
+        return jsonify({'error': 'Camera is moving to a preset for a recording'}), 409
+    return jsonify({'message': 'ok'}), 202
+
+@app.route('/api/ptz/<int:stream_id>/preset/<int:preset>', methods=['POST', 'PUT'])
+def ptz_preset(stream_id, preset):
+    # POST recalls the preset (waiting until the camera got there), PUT saves the current position
+    stream = store.get_stream(stream_id)
+    if not stream:
+        return jsonify({'error': 'Stream not found'}), 404
+    try:
+        if request.method == 'PUT':
+            done = ptz.save_preset(stream_id, stream['uri'], preset)
+        else:
+            done = ptz.recall_preset(stream_id, stream['uri'], preset)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Camera did not execute the preset: {e}'}), 502
+    if not done:
+        return jsonify({'error': 'Camera is moving to a preset for a recording'}), 409
+    return jsonify({'message': f'Preset {preset} {"saved" if request.method == "PUT" else "recalled"}'})
+
+@app.route('/api/ptz/<int:stream_id>/preset/<int:preset>/record', methods=['POST'])
+def ptz_record_at_preset(stream_id, preset):
+    # Recall a preset and start recording once the camera is there
+    stream = store.get_stream(stream_id)
+    if not stream:
+        return jsonify({'error': 'Stream not found'}), 404
+    settings = (request.get_json(silent=True) or {}).get('settings') or {}
+    try:
+        started = ptz.record_at_preset(stream_id, stream['uri'], preset, settings)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Camera did not reach preset {preset}, not recording: {e}'}), 502
+    if not started:
+        return jsonify({'error': 'Recording could not be started'}), 409
+    return jsonify({'message': f'Recording stream {stream_id} from preset {preset}'})
+
+@app.route('/api/ptz/<int:stream_id>/stop_recording', methods=['POST'])
+def ptz_stop_recording(stream_id):
+    # Stop recording, then optionally park the camera on {"preset": n}
+    stream = store.get_stream(stream_id)
+    if not stream:
+        return jsonify({'error': 'Stream not found'}), 404
+    preset = (request.get_json(silent=True) or {}).get('preset')
+    try:
+        stopped = ptz.stop_at_preset(stream_id, stream['uri'], preset)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Recording stopped, but the camera did not reach preset {preset}: {e}'}), 502
+    if not stopped:
+        return jsonify({'error': 'No active recording'}), 409
+    return jsonify({'message': f'Stopped recording stream {stream_id}'})
+
+@app.route('/api/seek', methods=['GET'])
+def seek_recording():
+    # Resolve a wall-clock time to (segment file, keyframe byte offset)
+    stream_id = request.args.get('streamId', type=int)
+    when = request.args.get('time')
+    if stream_id is None or not when:
+        return jsonify({'error': 'Missing streamId or time parameter'}), 400
+    try:
+        when = parse_local_time(when)
+    except ValueError:
+        return jsonify({'error': 'Invalid time'}), 400
+    position = rtsp_manager.seek(stream_id, when, request.args.get('location'))
+    if position is None:
+        return jsonify({'error': 'No recording at that time'}), 404
+    return jsonify(position)
+
+@app.route('/api/highlights', methods=['POST'])
+def create_highlight():
+    # Queue a stream-copy clip of a camera between two times
+    data = request.json or {}
+    stream_id = data.get('streamId')
+    if stream_id is None or not data.get('start') or not data.get('end'):
+        return jsonify({'error': 'Missing streamId, start or end'}), 400
+    try:
+        job = highlights.submit_clip(int(stream_id), parse_local_time(data['start']),
+                                     parse_local_time(data['end']), data.get('name'), data.get('location'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(job), 202
+
+@app.route('/api/highlights', methods=['GET'])
+def list_highlights():
+    return jsonify(highlights.list_jobs())
+
+@app.route('/api/highlights/<int:job_id>', methods=['GET'])
+def get_highlight(job_id):
+    job = highlights.get_job(job_id)
+    if not job:
+        return jsonify({'error': 'Highlight not found'}), 404
+    return jsonify(job)
+
+@app.route('/api/highlights/<int:job_id>/download', methods=['GET'])
+def download_highlight(job_id):
+    job = highlights.get_job(job_id)
+    if not job or job['state'] != 'done':
+        return jsonify({'error': 'Highlight not ready'}), 404
+    return send_file(os.path.abspath(job['path']), mimetype='video/mp4', as_attachment=True)
+
+@app.route('/api/motion', methods=['GET'])
+def list_motion_watchers():
+    return jsonify(motion.list_watchers())
+
+@app.route('/api/motion/<int:stream_id>', methods=['POST'])
+def watch_motion(stream_id):
+    # Start motion detection; "record" starts a recording for every motion event
+    stream = store.get_stream(stream_id)
+    if not stream:
+        return jsonify({'error': 'Stream not found'}), 404
+    data = request.json or {}
+    try:
+        return jsonify(motion.watch(stream_id, stream['uri'], bool(data.get('record')), data.get('settings')))
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 503
+
+@app.route('/api/motion/<int:stream_id>', methods=['DELETE'])
+def unwatch_motion(stream_id):
+    if not motion.unwatch(stream_id):
+        return jsonify({'error': 'Motion detection is not running for this stream'}), 404
+    return jsonify({'message': 'Motion detection stopped'})
+
+@app.route('/api/motion/events', methods=['GET'])
+def list_motion_events():
+    return jsonify(motion.list_events(request.args.get('streamId', type=int),
+                                      request.args.get('since', type=float)))
+
+@app.route('/api/triggers', methods=['GET'])
+def trigger_status():
+    # Armed cameras with their pre-roll memory use, and trigger recordings
+    return jsonify(preroll.status())
+
+def parse_stream_ids(data):
+    # The "streamIds" list of a request body as ints; raises ValueError for anything else
+    stream_ids = data.get('streamIds') or []
+    if not isinstance(stream_ids, list):
+        raise ValueError('streamIds must be a list of camera IDs')
+    try:
+        return [int(i) for i in stream_ids]
+    except (TypeError, ValueError):
+        raise ValueError('streamIds must be camera IDs')
 
-    # You can also update the recordings in the RTSP manager if needed
-    for camera_id in new_camera_ids:
-        camera = next((s for s in streams if s['id'] == camera_id), None)
-        if camera:
-            rtsp_manager.start_recording(camera_id, camera['uri'])
+@app.route('/api/triggers/arm', methods=['POST'])
+def arm_triggers():
+    data = request.json or {}
+    try:
+        seconds = float(data.get('seconds') or preroll.PREROLL_SECONDS)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'seconds must be a number'}), 400
+    if seconds <= 0:
+        return jsonify({'error': 'seconds must be positive'}), 400
+    try:
+        stream_ids = parse_stream_ids(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    armed = []
+    for stream_id in stream_ids:
+        stream = store.get_stream(stream_id)
+        if stream:
+            armed.append(preroll.arm(stream['id'], stream['uri'], seconds))
+    return jsonify(armed)
 
-    return jsonify({'message': 'Scheduled recording updated successfully'})
+@app.route('/api/triggers/disarm', methods=['POST'])
+def disarm_triggers():
+    try:
+        stream_ids = parse_stream_ids(request.json or {})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'disarmed': [i for i in stream_ids if preroll.disarm(i)]})
+
+@app.route('/api/triggers/fire', methods=['POST'])
+def fire_trigger():
+    # Save each camera's pre-roll followed by the post-roll of live footage
+    data = request.json or {}
+    try:
+        post_roll = float(data.get('postRoll') or preroll.POST_ROLL)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'postRoll must be a number'}), 400
+    if post_roll < 0:
+        return jsonify({'error': 'postRoll must not be negative'}), 400
+    try:
+        stream_ids = parse_stream_ids(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    fired = []
+    for stream_id in stream_ids:
+        stream = store.get_stream(stream_id)
+        if stream:
+            fired.append(preroll.fire(stream['id'], stream['uri'], data.get('label'), post_roll,
+                                      data.get('settings')))
+    if not fired:
+        return jsonify({'error': 'No valid streams selected'}), 400
+    return jsonify(fired)
 
 @app.route('/api/rtspStats', methods=['GET'])
 def get_rtsp_stats():
@@ -148,13 +813,74 @@ def get_rtsp_stats():
     if not uri:
         return jsonify({'error': 'Missing URI parameter'}), 400
     
-    # Call the rtsp_stats module's function to gather stats
+    # Return the latest cached snapshot; a background monitor keeps it fresh
     try:
-        stats = rtsp_stats.run_monitoring_cycle(rtsp_url=uri)  # Assuming this function returns stats as a dictionary
-        # Return stats as JSON to the frontend
+        stats = stats_monitor.get_snapshot(uri)
         return jsonify(stats)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/stats/backends', methods=['GET'])
+def list_stats_backends():
+    # Which measurement backends can run on this host, in order of preference
+    return jsonify(stats_backends.list_backends())
+
+@app.route('/api/stats/history', methods=['GET'])
+def get_stats_history():
+    # Numeric time series of a stream (POSIX start/end, default: the last hour)
+    uri = request.args.get('uri')
+    if not uri:
+        return jsonify({'error': 'Missing URI parameter'}), 400
+    names = request.args.get('metrics')
+    result = stats_history.history(uri, request.args.get('start', type=float),
+                                   request.args.get('end', type=float),
+                                   names.split(',') if names else None,
+                                   request.args.get('resolution', type=int))
+    if result is None:
+        return jsonify({'error': 'No history for this stream'}), 404
+    result['memory'] = stats_history.memory_usage()
+    return jsonify(result)
+
+@app.route('/api/stats/stream', methods=['GET'])
+def stream_rtsp_stats():
+    # One Server-Sent Events connection carries stats for every subscribed URI
+    uris = list(dict.fromkeys(request.args.getlist('uri')))
+    if not uris:
+        return jsonify({'error': 'Missing URI parameter'}), 400
+
+    def generate():
+        sent = {uri: {} for uri in uris}
+        for uri in uris:
+            stats_monitor.acquire(uri)
+        try:
+            last_message = 0
+            while True:
+                deltas = {}
+                for uri in uris:
+                    snapshot = stats_monitor.get_snapshot(uri)
+                    delta = stats_monitor.changed_fields(sent[uri], snapshot)
+                    if delta:
+                        deltas[uri] = delta
+                        sent[uri].update(delta)
+                now = time.time()
+                if deltas:
+                    yield f"data: {json.dumps({'time': now, 'stats': deltas})}\n\n"
+                    last_message = now
+                elif now - last_message > 15:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ": keepalive\n\n"
+                    last_message = now
+                stats_monitor.wait_for_update(timeout=5)
+        finally:
+            for uri in uris:
+                stats_monitor.release(uri)
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
+
 if __name__ == '__main__':
+    # With the reloader on, only its child process (WERKZEUG_RUN_MAIN set) serves requests;
+    # start the child's schedules now rather than on its first request
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background()
     app.run(debug=True)
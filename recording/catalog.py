@@ -0,0 +1,119 @@
+# recording/catalog.py
+
+import csv
+import glob
+import os
+import threading
+from datetime import datetime
+
+from recording import retention, rtsp_manager, segment_index, store
+
+# Files checked per batch when pruning catalog rows whose file was deleted by hand
+PRUNE_BATCH = 1000
+
+_sync_thread = None
+_sync_lock = threading.Lock()
+
+
+def _row(stream_id, segment):
+    start = datetime.fromisoformat(segment["start"]).timestamp()
+    try:
+        size = os.path.getsize(segment["path"])
+    except OSError:
+        size = None
+    return {"stream_id": stream_id, "path": segment["path"], "start_ts": start,
+            "end_ts": start + segment["duration"], "duration": segment["duration"], "size": size}
+
+
+def segment_finished(stream_id, segment):
+    """Catalog a segment as soon as its recorder closes it (codec follows once probed)."""
+    store.add_segments([_row(stream_id, segment)])
+
+
+def segment_indexed(stream_id, path, stream_info):
+    """Store the codec and size found by the keyframe indexer's probe."""
+    store.set_segment_info(path, stream_info.get("codec"), stream_info.get("width"), stream_info.get("height"))
+
+
+rtsp_manager.segment_listeners.append(segment_finished)
+rtsp_manager.index_listeners.append(segment_indexed)
+
+
+def sync(location=None):
+    """
+    Catch up with the CSV segment lists of a recordings directory, e.g.
+    footage recorded while the app was not running. Only the bytes appended
+    since the previous sync are read, so calling this on a large tree that
+    has not changed costs one stat() per CSV file. The location must be
+    inside the recordings directory, since retention enforces quotas on
+    everything cataloged. Returns the number of segments added.
+    """
+    root = os.path.realpath(rtsp_manager.DEFAULT_SETTINGS["location"])
+    location = location or rtsp_manager.DEFAULT_SETTINGS["location"]
+    if os.path.commonpath([root, os.path.realpath(location)]) != root:
+        raise ValueError(f"location must be inside the recordings directory {root}")
+    added = 0
+    for camera_dir in sorted(glob.glob(os.path.join(location, "camera_*"))):
+        try:
+            stream_id = int(os.path.basename(camera_dir).split("_", 1)[1])
+        except ValueError:
+            continue
+        for index_file in sorted(glob.glob(os.path.join(camera_dir, "index", "*.csv"))):
+            position = store.get_source_position(index_file)
+            try:
+                if os.path.getsize(index_file) <= position:
+                    continue
+                with open(index_file, "rb") as f:
+                    f.seek(position)
+                    data = f.read()
+            except OSError:
+                continue
+            complete = data[:data.rfind(b"\n") + 1]  # the last row may still be half written
+            rows = []
+            for row in csv.reader(complete.decode("utf-8", "replace").splitlines()):
+                segment = rtsp_manager.parse_index_row(camera_dir, row)
+                if segment and os.path.exists(segment["path"]):
+                    rows.append(_row(stream_id, segment))
+            store.add_segments(rows)
+            retention.segments_cataloged(rows)
+            store.set_source_position(index_file, position + len(complete))
+            # One probe fills in the codec and (re)writes the keyframe index
+            for row in rows:
+                segment_index.submit(row["path"], row["start_ts"],
+                                     on_indexed=lambda path, info, i=stream_id: segment_indexed(i, path, info))
+            added += len(rows)
+    return added
+
+
+def prune():
+    """Forget cataloged segments whose file no longer exists. Returns the number removed."""
+    removed = 0
+    cursor = None
+    while True:
+        page = store.query_segments(cursor=cursor, limit=PRUNE_BATCH, newest_first=False, count=False)
+        missing = [s["path"] for s in page["segments"] if not os.path.exists(s["path"])]
+        if missing:
+            removed += store.delete_segments(missing)
+            retention.segments_removed(missing)
+        cursor = page["next"]
+        if cursor is None:
+            return removed
+
+
+def start(location=None):
+    """Sync and prune the catalog in the background (called at startup)."""
+    global _sync_thread
+
+    def run():
+        try:
+            added = sync(location)
+            removed = prune()
+            print(f"Recording catalog: {added} segments added, {removed} missing files removed")
+        except Exception as e:
+            print(f"Recording catalog sync failed: {e}")
+
+    with _sync_lock:
+        if _sync_thread is None or not _sync_thread.is_alive():
+            _sync_thread = threading.Thread(target=run, name="catalog-sync", daemon=True)
+            _sync_thread.start()
+    return _sync_thread
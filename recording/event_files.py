@@ -0,0 +1,260 @@
+# recording/event_files.py
+
+import csv
+import io
+import json
+from datetime import date, datetime, timezone
+from zoneinfo import ZoneInfo
+
+from recording import store
+from recording.scheduler import parse_time
+
+FORMATS = ("csv", "json", "ics")
+
+# Events written to the database per transaction while importing
+IMPORT_BATCH = 500
+
+# Error messages kept in an import report (the rest are only counted)
+MAX_ERRORS = 20
+
+# Largest single JSON event accepted (an event may carry a data: URL image)
+MAX_JSON_ITEM = 16 * 1024 * 1024
+
+READ_SIZE = 64 * 1024
+
+CSV_COLUMNS = ("id", "name", "start", "end")
+
+# File name extensions of each format
+EXTENSIONS = {"csv": "csv", "json": "json", "ndjson": "json", "ics": "ics", "ical": "ics"}
+
+
+def format_for(filename, default=None):
+    """Return the import/export format matching a file name's extension, or default."""
+    extension = (filename or "").rsplit(".", 1)[-1].lower()
+    return EXTENSIONS.get(extension, default)
+
+# -- parsing ----------------------------------------------------------------------
+# Each parser reads a binary stream incrementally and yields (position, row)
+# where position is the line (CSV, ICS) or item number (JSON) for error reports.
+
+def parse_csv(stream):
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    reader = csv.reader(text)
+    header = [h.strip().lower() for h in next(reader, [])]
+    if not {"name", "start", "end"} <= set(header):
+        raise ValueError("the CSV header must have name, start and end columns")
+    keys = ["imageUrl" if h == "imageurl" else h for h in header]
+    for row in reader:
+        if any(cell.strip() for cell in row):
+            yield reader.line_num, dict(zip(keys, row))
+
+
+def parse_json(stream):
+    """Items of a JSON array (or one JSON object per line), decoded one at a time."""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig")
+    decoder = json.JSONDecoder()
+    buffer, index, item, eof = "", 0, 0, False
+    while True:
+        if index >= len(buffer) and not eof:
+            chunk = text.read(READ_SIZE)
+            eof = not chunk
+            buffer, index = buffer[index:] + chunk, 0
+            continue
+        if index >= len(buffer):
+            return
+        if buffer[index] in " \t\r\n,[]":
+            index += 1
+            continue
+        try:
+            value, end = decoder.raw_decode(buffer, index)
+        except json.JSONDecodeError as e:
+            if eof or len(buffer) - index > MAX_JSON_ITEM:
+                raise ValueError(f"invalid JSON after item {item}: {e.msg}") from None
+            chunk = text.read(READ_SIZE)  # the item continues in the next chunk
+            eof = not chunk
+            buffer, index = buffer[index:] + chunk, 0
+            continue
+        item += 1
+        index = end
+        yield item, value
+
+
+def _ics_time(value, params):
+    # DTSTART/DTEND values: 20250401T100000Z (UTC), 20250401T100000 (floating/TZID) or 20250401 (all day)
+    value = value.strip()
+    if "T" not in value:
+        return date(int(value[:4]), int(value[4:6]), int(value[6:8])).isoformat() + "T00:00:00"
+    when = datetime.strptime(value.rstrip("Z"), "%Y%m%dT%H%M%S")
+    if value.endswith("Z"):
+        when = when.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+    elif "TZID" in params:
+        try:
+            when = when.replace(tzinfo=ZoneInfo(params["TZID"])).astimezone().replace(tzinfo=None)
+        except (KeyError, ValueError):
+            pass  # unknown zone: keep the wall-clock time
+    return when.isoformat(timespec="seconds")
+
+
+def _ics_unescape(value):
+    return (value.replace("\\n", "\n").replace("\\N", "\n").replace("\\,", ",")
+            .replace("\\;", ";").replace("\\\\", "\\"))
+
+
+def parse_ics(stream):
+    """VEVENTs of an iCalendar file, with folded lines joined."""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    event = None
+    line_number = start_line = 0
+
+    def unfolded():
+        nonlocal line_number
+        pending = None
+        for raw in text:
+            line_number += 1
+            raw = raw.rstrip("\r\n")
+            if raw[:1] in (" ", "\t") and pending is not None:
+                pending += raw[1:]
+                continue
+            if pending is not None:
+                yield pending
+            pending = raw
+        if pending is not None:
+            yield pending
+
+    for line in unfolded():
+        name, _, value = line.partition(":")
+        name, *param_list = name.split(";")
+        params = dict(p.split("=", 1) for p in param_list if "=" in p)
+        name = name.upper()
+        if name == "BEGIN" and value.upper() == "VEVENT":
+            event, start_line = {}, line_number
+        elif event is None:
+            continue
+        elif name == "END" and value.upper() == "VEVENT":
+            yield start_line, event
+            event = None
+        elif name == "SUMMARY":
+            event["name"] = _ics_unescape(value)
+        elif name in ("DTSTART", "DTEND"):
+            try:
+                event["start" if name == "DTSTART" else "end"] = _ics_time(value, params)
+            except ValueError:
+                event["start" if name == "DTSTART" else "end"] = value
+
+
+PARSERS = {"csv": parse_csv, "json": parse_json, "ics": parse_ics}
+
+
+def validate(row):
+    """Return an event ready for store.add_events(), or raise ValueError saying what is wrong."""
+    if not isinstance(row, dict):
+        raise ValueError("expected an object with name, start and end")
+    name = str(row.get("name") or "").strip() or "Untitled"
+    start = str(row.get("start") or "").strip()
+    end = str(row.get("end") or "").strip()
+    if not start or not end:
+        raise ValueError("missing start or end")
+    try:
+        start_ts, end_ts = parse_time(start), parse_time(end)
+    except ValueError:
+        raise ValueError(f"unreadable time {start!r} - {end!r}") from None
+    if end_ts <= start_ts:
+        raise ValueError("end must be after start")
+    return {"name": name, "start": start, "end": end, "imageUrl": row.get("imageUrl") or None}
+
+
+def import_events(stream, fmt, batch_size=IMPORT_BATCH):
+    """
+    Parse, validate and insert the events of an uploaded file without
+    holding more than one batch in memory. IDs in the file are ignored, so
+    every valid row becomes a new event. Invalid rows are skipped; a file
+    that cannot be read further ends the import, keeping the rows before it.
+    Returns {"imported": n, "skipped": n, "errors": ["line 3: ...", ...],
+    "error": None or the reason the file could not be read to the end}.
+    """
+    if fmt not in PARSERS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    unit = "item" if fmt == "json" else "line"
+    report = {"imported": 0, "skipped": 0, "errors": [], "error": None}
+    batch = []
+    try:
+        for position, row in PARSERS[fmt](stream):
+            try:
+                batch.append(validate(row))
+            except ValueError as e:
+                report["skipped"] += 1
+                if len(report["errors"]) < MAX_ERRORS:
+                    report["errors"].append(f"{unit} {position}: {e}")
+                continue
+            if len(batch) >= batch_size:
+                report["imported"] += store.add_events(batch)
+                batch = []
+    except ValueError as e:  # includes undecodable text
+        report["error"] = str(e)
+    if batch:
+        report["imported"] += store.add_events(batch)
+    return report
+
+# -- export -----------------------------------------------------------------------
+# Each writer takes the batches of store.iter_events() and yields text chunks.
+
+def export_csv(batches):
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow(CSV_COLUMNS)
+    for events in batches:
+        writer.writerows([event[c] for c in CSV_COLUMNS] for event in events)
+        yield out.getvalue()
+        out.seek(0)
+        out.truncate()
+    yield out.getvalue()
+
+
+def export_json(batches):
+    separator = "[\n"
+    for events in batches:
+        yield separator + ",\n".join(json.dumps(event) for event in events)
+        separator = ",\n"
+    yield "[]\n" if separator == "[\n" else "\n]\n"
+
+
+def _ics_escape(value):
+    return (str(value).replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def _ics_fold(line):
+    # Content lines longer than 75 characters continue on lines starting with a space
+    parts = [line[:75]] + [" " + line[i:i + 74] for i in range(75, len(line), 74)]
+    return "\r\n".join(parts) + "\r\n"
+
+
+def _ics_datetime(value):
+    when = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if when.tzinfo:
+        return when.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    return when.strftime("%Y%m%dT%H%M%S")  # floating: the camera's local time, like the app
+
+
+def export_ics(batches):
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    yield "BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//ptzOpticorder//Events//EN\r\n"
+    for events in batches:
+        chunk = []
+        for event in events:
+            try:
+                start, end = _ics_datetime(event["start"]), _ics_datetime(event["end"])
+            except ValueError:
+                continue  # an unreadable time cannot be expressed in iCalendar
+            chunk += ["BEGIN:VEVENT\r\n", _ics_fold(f"UID:event-{event['id']}@ptzopticorder"),
+                      f"DTSTAMP:{stamp}\r\n", f"DTSTART:{start}\r\n", f"DTEND:{end}\r\n",
+                      _ics_fold(f"SUMMARY:{_ics_escape(event['name'])}"), "END:VEVENT\r\n"]
+        yield "".join(chunk)
+    yield "END:VCALENDAR\r\n"
+
+
+EXPORTERS = {
+    "csv": (export_csv, "text/csv"),
+    "json": (export_json, "application/json"),
+    "ics": (export_ics, "text/calendar"),
+}
@@ -0,0 +1,197 @@
+# recording/highlights.py
+
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from recording import process_manager, rtsp_manager, segment_index, store
+
+# Where finished clips are written
+HIGHLIGHTS_DIR = os.path.join(rtsp_manager.DEFAULT_SETTINGS["location"], "highlights")
+
+# Clips cut at the same time; remuxing is I/O bound, so a few are plenty
+MAX_WORKERS = 3
+
+# Upper bound on a single remux (in seconds)
+CLIP_TIMEOUT = 600
+
+# Dictionary of clip jobs by job ID, loaded from the store on first use
+jobs = {}  # { job_id: job dict }
+jobs_lock = threading.Lock()
+_job_ids = None
+_executor = None
+
+
+def _load_jobs():
+    """
+    Fill the jobs dictionary from the store once. Caller holds jobs_lock.
+    Jobs a previous run left queued or running can never finish.
+    """
+    global _job_ids
+    if _job_ids is not None:
+        return
+    interrupted = []
+    for job in store.list_highlight_jobs():
+        job["progress"] = 1.0 if job["state"] == "done" else 0.0
+        if job["state"] in ("queued", "running"):
+            job.update(state="failed", error="Interrupted by a restart")
+            interrupted.append(job)
+        jobs[job["id"]] = job
+    for job in interrupted:
+        store.save_highlight_job(job)
+    _job_ids = itertools.count(max(jobs, default=0) + 1)
+
+
+def _get_executor():
+    global _executor
+    with jobs_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="highlight")
+    return _executor
+
+
+def plan_clip(stream_id, start, end, location=None):
+    """
+    Work out which parts of which segments make up the clip [start, end)
+    (datetimes). Each part starts on the keyframe at or before the requested
+    time so the stream can be copied without re-encoding.
+    Returns a list of dictionaries with "path", "inpoint" and "outpoint"
+    (seconds into the segment; None means the segment's own boundary).
+    Segments come from the recording catalog, or from a scan of the CSV
+    segment lists when an explicit location is given.
+    """
+    if location is None:
+        segments = store.query_segments([stream_id], start.timestamp(), end.timestamp(), limit=100000,
+                                        newest_first=False, count=False)["segments"]
+    else:
+        segments = rtsp_manager.list_segments(stream_id, location)
+    parts = []
+    for segment in segments:
+        seg_start = datetime.fromisoformat(segment["start"])
+        seg_end = datetime.fromisoformat(segment["end"])
+        if seg_end <= start or seg_start >= end or not os.path.exists(segment["path"]):
+            continue
+        inpoint = outpoint = None
+        if start > seg_start:
+            record = segment_index.lookup(segment["path"], seg_start.timestamp(), start.timestamp())
+            inpoint = record[2] if record else (start - seg_start).total_seconds()
+        if end < seg_end:
+            outpoint = (end - seg_start).total_seconds()
+        parts.append({"path": segment["path"], "inpoint": inpoint, "outpoint": outpoint})
+    return parts
+
+
+def write_concat_list(path, parts):
+    """Write an ffconcat script stitching the parts together."""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("ffconcat version 1.0\n")
+        for part in parts:
+            escaped = os.path.abspath(part["path"]).replace("\\", "/").replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+            if part["inpoint"] is not None:
+                f.write(f"inpoint {part['inpoint']:.3f}\n")
+            if part["outpoint"] is not None:
+                f.write(f"outpoint {part['outpoint']:.3f}\n")
+
+
+def build_clip_cmd(concat_list, output):
+    """Build the FFmpeg command remuxing the concat script into one MP4 (stream copy)."""
+    return [
+        process_manager.FFMPEG, "-hide_banner", "-nostdin", "-nostats", "-progress", "pipe:1",
+        "-y", "-f", "concat", "-safe", "0", "-i", concat_list,
+        "-map", "0", "-c", "copy", "-movflags", "+faststart",
+        output
+    ]
+
+
+def _update(job, **fields):
+    with jobs_lock:
+        job.update(fields)
+        saved = dict(job)
+    if set(fields) != {"progress"}:  # progress changes many times a second; only keep the outcome
+        store.save_highlight_job(saved)
+
+
+def _run_job(job, location):
+    _update(job, state="running", started=time.time())
+    start = datetime.fromisoformat(job["start"])
+    end = datetime.fromisoformat(job["end"])
+    length = (end - start).total_seconds()
+    concat_list = job["path"] + ".ffconcat"
+    try:
+        parts = plan_clip(job["stream_id"], start, end, location)
+        if not parts:
+            _update(job, state="failed", error="No recording covers that time range")
+            return
+        os.makedirs(os.path.dirname(job["path"]), exist_ok=True)
+        write_concat_list(concat_list, parts)
+
+        def on_progress(line):
+            key, _, value = line.partition("=")
+            if key == "out_time_us" and value.strip().isdigit():
+                _update(job, progress=min(1.0, int(value) / 1_000_000 / length))
+
+        result = process_manager.run(build_clip_cmd(concat_list, job["path"]), key=job["stream_id"],
+                                     timeout=CLIP_TIMEOUT, on_stdout_line=on_progress)
+        if result.ok:
+            _update(job, state="done", progress=1.0, segments=len(parts),
+                    size=os.path.getsize(job["path"]))
+        else:
+            _update(job, state="failed", error=result.stderr.splitlines()[-1] if result.stderr
+                    else f"ffmpeg exited with code {result.returncode}")
+    except Exception as e:
+        _update(job, state="failed", error=str(e))
+    finally:
+        _update(job, finished=time.time())
+        if os.path.exists(concat_list):
+            os.remove(concat_list)
+
+
+def submit_clip(stream_id, start, end, name=None, location=None):
+    """
+    Queue a clip of a camera between two datetimes.
+    Returns a copy of the job dictionary; poll get_job() for progress.
+    """
+    if end <= start:
+        raise ValueError("end must be after start")
+    with jobs_lock:
+        _load_jobs()
+        job_id = next(_job_ids)
+    file_name = f"camera_{stream_id}_{start.strftime(rtsp_manager.SEGMENT_TIME_FORMAT)}_{job_id}.mp4"
+    job = {
+        "id": job_id,
+        "stream_id": stream_id,
+        "name": name or f"Camera {stream_id} {start.isoformat(timespec='seconds')}",
+        "start": start.isoformat(timespec="seconds"),
+        "end": end.isoformat(timespec="seconds"),
+        "path": os.path.join(HIGHLIGHTS_DIR, file_name),
+        "state": "queued",
+        "progress": 0.0,
+        "error": None,
+        "created": time.time(),
+        "started": None,
+        "finished": None,
+    }
+    with jobs_lock:
+        jobs[job_id] = job
+    store.save_highlight_job(job)
+    _get_executor().submit(_run_job, job, location)
+    return get_job(job_id)
+
+
+def get_job(job_id):
+    """Return a copy of one job, or None."""
+    with jobs_lock:
+        _load_jobs()
+        job = jobs.get(job_id)
+        return dict(job) if job else None
+
+
+def list_jobs():
+    """Return copies of all jobs, newest first."""
+    with jobs_lock:
+        _load_jobs()
+        return sorted((dict(job) for job in jobs.values()), key=lambda j: j["id"], reverse=True)
@@ -0,0 +1,64 @@
+# recording/lazy.py
+
+import importlib
+import importlib.util
+import sys
+import threading
+
+# Result of available() by module name (find_spec walks sys.path, so it is only done once)
+_available = {}
+_lock = threading.Lock()
+
+
+def available(name):
+    """Return True if the module can be imported, without importing it."""
+    with _lock:
+        if name not in _available:
+            try:
+                _available[name] = name in sys.modules or importlib.util.find_spec(name) is not None
+            except (ImportError, ValueError):
+                _available[name] = False
+        return _available[name]
+
+
+class _Missing:
+    """Stands in for a module that is not installed; any use raises ImportError."""
+
+    def __init__(self, name, feature):
+        self._name = name
+        self._feature = feature
+
+    def __getattr__(self, attribute):
+        raise ImportError(f"{self._feature} needs the '{self._name}' package, which is not installed")
+
+
+class _LazyModule:
+    """Imports the real module on first attribute access and then gets out of the way."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attribute):
+        module = self._module
+        if module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+                module = self._module
+        return getattr(module, attribute)
+
+
+def load(name, feature=None):
+    """
+    Return a module proxy that imports `name` the first time one of its
+    attributes is used, so importing the caller stays cheap. If the package
+    is missing, the proxy raises ImportError (naming `feature`) on use instead
+    of at import time.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    if not available(name):
+        return _Missing(name, feature or "This feature")
+    return _LazyModule(name)
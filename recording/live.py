@@ -0,0 +1,389 @@
+# recording/live.py
+
+import collections
+import math
+import struct
+import subprocess
+import threading
+import time
+from datetime import datetime, timezone
+
+from recording import process_manager, relay
+
+# Target length of one partial segment (fMP4 fragment) in seconds
+PART_SECONDS = 0.2
+
+# A new segment starts at the first keyframe after this many seconds
+SEGMENT_SECONDS = 1.0
+
+# Complete segments kept in memory (and listed in the playlist)
+KEEP_SEGMENTS = 6
+
+# Complete segments whose parts are still listed (LL-HLS only needs the recent ones)
+PART_SEGMENTS = 2
+
+# Longest a blocking playlist or part request waits (in seconds)
+BLOCK_TIMEOUT = 6
+
+# Stop packaging a camera when nobody asked for it for this long (in seconds)
+IDLE_TIMEOUT = 30
+
+# Relay buffer for one packager (in bytes)
+LIVE_BUFFER = 8 * 1024 * 1024
+
+# Running packagers by stream ID
+streams = {}  # { stream_id: LiveStream }
+streams_lock = threading.Lock()
+
+process_manager.PROCESSES.labels("live").set_function(lambda: len(streams))
+
+SAMPLE_IS_NON_SYNC = 0x00010000
+
+
+def build_package_cmd():
+    """
+    Build the FFmpeg command remuxing the relay's MPEG-TS into fragmented MP4
+    on stdout: one init segment, then a moof/mdat pair about every
+    PART_SECONDS, always starting a new fragment on a keyframe. Video only
+    (stream copy): camera audio is often a codec browsers cannot play.
+    """
+    return [
+        process_manager.FFMPEG, "-hide_banner", "-nostdin", "-loglevel", "error",
+        "-f", "mpegts", "-i", "pipe:0",
+        "-map", "0:v:0", "-c:v", "copy", "-an",
+        "-f", "mp4",
+        "-movflags", "+empty_moov+default_base_moof+frag_keyframe",
+        "-frag_duration", str(int(PART_SECONDS * 1_000_000)),
+        "-flush_packets", "1",
+        "pipe:1"
+    ]
+
+
+# -- ISO BMFF parsing -----------------------------------------------------------
+
+def iter_boxes(data, start=0, end=None):
+    """Yield (type, payload_start, box_end) for the boxes in data[start:end]."""
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", data, pos)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            return
+        yield kind.decode("latin-1"), pos + header, pos + size
+        pos += size
+
+
+def find_box(data, path, start=0, end=None):
+    """Return (payload_start, box_end) of the first box along a path like "moov/trak/mdia/mdhd", or None."""
+    first, _, rest = path.partition("/")
+    for kind, payload, box_end in iter_boxes(data, start, end):
+        if kind == first:
+            return find_box(data, rest, payload, box_end) if rest else (payload, box_end)
+    return None
+
+
+def parse_init(moov):
+    """Return (timescale, default_duration, default_flags) of the video track of a moov box's payload."""
+    mdhd = find_box(moov, "trak/mdia/mdhd")
+    timescale = 90000
+    if mdhd:
+        version = moov[mdhd[0]]
+        timescale = struct.unpack_from(">I", moov, mdhd[0] + (20 if version == 1 else 12))[0]
+    trex = find_box(moov, "mvex/trex")
+    duration = flags = 0
+    if trex:
+        duration, _, flags = struct.unpack_from(">III", moov, trex[0] + 12)
+    return timescale, duration, flags
+
+
+def parse_fragment(moof, default_duration=0, default_flags=0):
+    """
+    Return (duration in timescale units, starts_with_keyframe) of a moof
+    box's payload, from its tfhd defaults and trun sample table.
+    """
+    tfhd = find_box(moof, "traf/tfhd")
+    if tfhd:
+        flags = struct.unpack_from(">I", moof, tfhd[0])[0] & 0xFFFFFF
+        pos = tfhd[0] + 8  # version/flags, track_ID
+        if flags & 0x1:
+            pos += 8
+        if flags & 0x2:
+            pos += 4
+        if flags & 0x8:
+            default_duration = struct.unpack_from(">I", moof, pos)[0]
+            pos += 4
+        if flags & 0x10:
+            pos += 4
+        if flags & 0x20:
+            default_flags = struct.unpack_from(">I", moof, pos)[0]
+    trun = find_box(moof, "traf/trun")
+    if not trun:
+        return 0, False
+    flags = struct.unpack_from(">I", moof, trun[0])[0] & 0xFFFFFF
+    count = struct.unpack_from(">I", moof, trun[0] + 4)[0]
+    pos = trun[0] + 8
+    if flags & 0x1:
+        pos += 4
+    first_flags = None
+    if flags & 0x4:
+        first_flags = struct.unpack_from(">I", moof, pos)[0]
+        pos += 4
+    fields = [bit for bit in (0x100, 0x200, 0x400, 0x800) if flags & bit]
+    duration = 0
+    for i in range(count):
+        for bit in fields:
+            value = struct.unpack_from(">I", moof, pos)[0]
+            pos += 4
+            if bit == 0x100:
+                duration += value
+            elif bit == 0x400 and i == 0 and first_flags is None:
+                first_flags = value
+    if not flags & 0x100:
+        duration = count * default_duration
+    if first_flags is None:
+        first_flags = default_flags
+    return duration, not first_flags & SAMPLE_IS_NON_SYNC
+
+
+# -- packaging ------------------------------------------------------------------
+
+class Segment:
+    """One HLS segment: parts are (bytes, seconds, independent) tuples."""
+
+    def __init__(self, msn, started):
+        self.msn = msn
+        self.started = started
+        self.parts = []
+        self.duration = 0.0
+        self.complete = False
+
+    def data(self):
+        return b"".join(part[0] for part in self.parts)
+
+
+class LiveStream(threading.Thread):
+    """
+    Packages one camera into LL-HLS: a stream-copy FFmpeg reads the camera's
+    relay, and every fMP4 fragment it writes becomes a part of the current
+    segment as soon as it is complete. Parts are served from memory, and
+    playlist requests can block until a given part exists (_HLS_msn/_HLS_part).
+    """
+
+    def __init__(self, stream_id, uri):
+        super().__init__(name=f"live-{stream_id}", daemon=True)
+        self.stream_id = stream_id
+        self.uri = uri
+        self.init = None
+        self.timescale = 90000
+        self.defaults = (0, 0)
+        self.segments = collections.deque(maxlen=KEEP_SEGMENTS)
+        self.current = None
+        self.next_msn = 0
+        self.part_target = PART_SECONDS
+        self.target_duration = SEGMENT_SECONDS
+        self.process = None
+        self.stopped = False
+        self.last_access = time.time()
+        self.cond = threading.Condition()
+
+    # -- producer
+
+    def run(self):
+        consumer = relay.attach(self.uri, f"live-{self.stream_id}", LIVE_BUFFER)
+        try:
+            self.process = subprocess.Popen(build_package_cmd(), stdin=subprocess.PIPE,
+                                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        except OSError as e:
+            print(f"Failed to start live packaging for stream {self.stream_id}: {e}")
+            consumer.close()
+            self.stop()
+            return
+        relay.feed_process(consumer, self.process)
+        # read1() blocks while the camera sends nothing, so the loop alone may never see it go idle
+        process_manager.kill_when(self.process,
+                                  lambda: self.stopped or time.time() - self.last_access > IDLE_TIMEOUT)
+        buffer = bytearray()
+        header = bytearray()
+        moof = None
+        try:
+            while not self.stopped:
+                chunk = self.process.stdout.read1(65536)
+                if not chunk:
+                    break
+                buffer += chunk
+                # Hand out every complete top-level box
+                while len(buffer) >= 8:
+                    size, kind = struct.unpack_from(">I4s", buffer, 0)
+                    if size == 1:
+                        if len(buffer) < 16:
+                            break
+                        size = struct.unpack_from(">Q", buffer, 8)[0]
+                    if size < 8 or len(buffer) < size:
+                        break
+                    box = bytes(buffer[:size])
+                    del buffer[:size]
+                    if kind in (b"ftyp", b"moov"):
+                        header += box
+                        if kind == b"moov":
+                            self.timescale, *self.defaults = parse_init(box[8:])
+                            with self.cond:
+                                self.init = bytes(header)
+                                self.cond.notify_all()
+                    elif kind == b"moof":
+                        moof = box
+                    elif kind == b"mdat" and moof is not None:
+                        duration, key = parse_fragment(moof[8:], *self.defaults)
+                        self._add_part(moof + box, duration / self.timescale, key)
+                        moof = None
+                if time.time() - self.last_access > IDLE_TIMEOUT:
+                    break
+        finally:
+            self.stop()
+
+    def _add_part(self, data, duration, independent):
+        with self.cond:
+            current = self.current
+            if current is None or (independent and current.duration >= SEGMENT_SECONDS):
+                if current is None and not independent:
+                    return  # players must start on a keyframe
+                if current is not None:
+                    current.complete = True
+                    self.segments.append(current)
+                    self.target_duration = max(self.target_duration, current.duration)
+                self.current = current = Segment(self.next_msn, time.time())
+                self.next_msn += 1
+            current.parts.append((data, duration, independent))
+            current.duration += duration
+            self.part_target = max(self.part_target, duration)
+            self.cond.notify_all()
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+        if self.process and self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        with streams_lock:
+            if streams.get(self.stream_id) is self:
+                del streams[self.stream_id]
+
+    # -- consumers (called from request threads)
+
+    def _find(self, msn):
+        """Return the segment with this media sequence number, or None. Caller holds cond."""
+        if self.current is not None and self.current.msn == msn:
+            return self.current
+        if self.segments and self.segments[0].msn <= msn <= self.segments[-1].msn:
+            return self.segments[msn - self.segments[0].msn]
+        return None
+
+    def _has(self, msn, part):
+        if self.current is None:
+            return False
+        if msn < self.current.msn:
+            return True
+        return msn == self.current.msn and part is not None and len(self.current.parts) > part
+
+    def _wait(self, predicate, timeout=BLOCK_TIMEOUT):
+        self.last_access = time.time()
+        with self.cond:
+            self.cond.wait_for(lambda: self.stopped or predicate(), timeout)
+            return not self.stopped and predicate()
+
+    def get_init(self):
+        """Return the fMP4 init segment, waiting for FFmpeg to write it; None on timeout."""
+        return self.init if self._wait(lambda: self.init is not None) else None
+
+    def get_part(self, msn, index):
+        """Return one part's bytes, blocking until it exists (preload hints); None if it never will."""
+        if not self._wait(lambda: self._has(msn, index)):
+            return None
+        with self.cond:
+            segment = self._find(msn)
+            return segment.parts[index][0] if segment and index < len(segment.parts) else None
+
+    def get_segment(self, msn):
+        """Return a complete segment's bytes, or None."""
+        if not self._wait(lambda: self._has(msn, None)):
+            return None
+        with self.cond:
+            segment = self._find(msn)
+            return segment.data() if segment and segment.complete else None
+
+    def playlist(self, msn=None, part=None):
+        """
+        Return the LL-HLS media playlist. With msn (and part), block until
+        that segment (part) exists, as asked by a player's blocking reload.
+        Returns None if nothing has been packaged in time.
+        """
+        if msn is not None:
+            ready = self._wait(lambda: self._has(msn, part))
+        else:
+            ready = self._wait(lambda: self.current is not None)
+        if not ready and self.current is None:
+            return None
+        with self.cond:
+            part_target = math.ceil(self.part_target * 1000) / 1000
+            segments = list(self.segments) + [self.current]
+            lines = [
+                "#EXTM3U",
+                "#EXT-X-VERSION:9",
+                f"#EXT-X-TARGETDURATION:{math.ceil(self.target_duration)}",
+                f"#EXT-X-SERVER-CONTROL:CAN-BLOCK-RELOAD=YES,PART-HOLD-BACK={3 * part_target:.3f}",
+                f"#EXT-X-PART-INF:PART-TARGET={part_target:.3f}",
+                f"#EXT-X-MEDIA-SEQUENCE:{segments[0].msn}",
+                '#EXT-X-MAP:URI="init.mp4"',
+            ]
+            for segment in segments:
+                started = datetime.fromtimestamp(segment.started, timezone.utc)
+                lines.append(f"#EXT-X-PROGRAM-DATE-TIME:{started.isoformat(timespec='milliseconds')}")
+                if segment.msn >= self.current.msn - PART_SEGMENTS:
+                    for i, (_, duration, independent) in enumerate(segment.parts):
+                        lines.append(f'#EXT-X-PART:DURATION={duration:.3f},URI="part/{segment.msn}/{i}.m4s"'
+                                     + (",INDEPENDENT=YES" if independent else ""))
+                if segment.complete:
+                    lines += [f"#EXTINF:{segment.duration:.3f},", f"segment/{segment.msn}.m4s"]
+            lines.append(f'#EXT-X-PRELOAD-HINT:TYPE=PART,URI="part/{self.current.msn}/{len(self.current.parts)}.m4s"')
+        return "\n".join(lines) + "\n"
+
+    def info(self):
+        with self.cond:
+            return {"stream_id": self.stream_id, "uri": relay.redact_uri(self.uri), "segments": len(self.segments),
+                    "part_target": self.part_target, "target_duration": self.target_duration,
+                    "idle": time.time() - self.last_access}
+
+
+def get_stream(stream_id, uri):
+    """
+    Return the running packager for a camera, starting it if needed.
+    Raises RuntimeError if live view is unavailable (it needs the relay).
+    """
+    if not relay.ENABLED or not uri.startswith("rtsp://"):
+        raise RuntimeError("Live view needs the shared relay (PTZ_RELAY=1) and an rtsp:// camera")
+    replaced = None
+    with streams_lock:
+        stream = streams.get(stream_id)
+        if stream is not None and stream.uri != uri:
+            replaced, stream = stream, None
+        if stream is None or stream.stopped:
+            stream = LiveStream(stream_id, uri)
+            streams[stream_id] = stream
+            stream.start()
+    if replaced is not None:
+        replaced.stop()
+    stream.last_access = time.time()
+    return stream
+
+
+def list_streams():
+    """Return a list of dictionaries describing the running packagers."""
+    with streams_lock:
+        items = list(streams.values())
+    return [stream.info() for stream in items]
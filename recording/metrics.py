@@ -0,0 +1,206 @@
+# recording/metrics.py
+
+import bisect
+import math
+import threading
+import time
+
+# Default histogram buckets (in seconds)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Every metric created in the process, in creation order
+registry = []
+registry_lock = threading.Lock()
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class _Value:
+    """A single counter or gauge sample. Its own lock keeps increments cheap and exact."""
+    __slots__ = ("value", "lock", "function")
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+        self.function = None
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        """Read the value from function() at scrape time instead (for existing state)."""
+        self.function = function
+
+    def get(self):
+        if self.function is not None:
+            try:
+                return float(self.function())
+            except Exception:
+                return math.nan
+        return self.value
+
+
+class _HistogramValue:
+    __slots__ = ("upper_bounds", "counts", "sum", "lock")
+
+    def __init__(self, upper_bounds):
+        self.upper_bounds = upper_bounds
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.upper_bounds, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    """Context manager observing the elapsed wall-clock time."""
+
+    def __init__(self, target):
+        self.target = target
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.target.observe(time.perf_counter() - self.start)
+
+
+class Metric:
+    """
+    Base class of a metric family. Label values are positional and their
+    children are created on first use; hot loops should keep the child
+    returned by labels() instead of looking it up every time.
+    """
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        self.lock = threading.Lock()
+        with registry_lock:
+            registry.append(self)
+
+    def _new_child(self):
+        return _Value()
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        child = self.children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self.lock:
+                child = self.children.setdefault(key, self._new_child())
+        return child
+
+    def remove(self, *values):
+        """Forget one label combination (e.g. a deleted camera)."""
+        with self.lock:
+            self.children.pop(tuple(str(v) for v in values), None)
+
+    def samples(self):
+        with self.lock:
+            items = list(self.children.items())
+        for key, child in items:
+            yield self.name, key, (), child.get()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, key, extra, value in self.samples():
+            lines.append(f"{name}{_format_labels(self.labelnames, key, extra)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """A value that only goes up (bytes, restarts, requests)."""
+    kind = "counter"
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    """A value that goes up and down (processes, buffered bytes)."""
+    kind = "gauge"
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def set_function(self, function):
+        self.labels().set_function(function)
+
+
+class Histogram(Metric):
+    """Counts observations into cumulative buckets (latencies, lag)."""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.upper_bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.upper_bounds)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self, *values):
+        """Return a context manager that observes how long its block takes."""
+        return self.labels(*values).time()
+
+    def samples(self):
+        with self.lock:
+            items = list(self.children.items())
+        for key, child in items:
+            with child.lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.upper_bounds + (math.inf,), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", key, (("le", _format_value(float(bound))),), cumulative
+            yield f"{self.name}_sum", key, (), total
+            yield f"{self.name}_count", key, (), cumulative
+
+
+def render():
+    """Return every registered metric in the Prometheus text exposition format."""
+    with registry_lock:
+        metrics = list(registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,358 @@
+# recording/motion.py
+
+import collections
+import itertools
+import subprocess
+import threading
+import time
+
+from recording import lazy, metrics, process_manager, relay, rtsp_manager
+
+# Only imported once a camera is watched
+np = lazy.load("numpy", "Motion detection")
+
+# Analysis resolution: 160x90 grayscale is plenty to see motion and costs 14 KB a frame
+FRAME_WIDTH = 160
+FRAME_HEIGHT = 90
+FRAME_BYTES = FRAME_WIDTH * FRAME_HEIGHT
+
+# Frames analyzed per second and camera (the decoder drops the rest)
+SAMPLE_FPS = 2
+
+# A pixel has changed when it differs by more than this (0-255 gray levels)
+PIXEL_THRESHOLD = 25
+
+# Fraction of changed pixels that counts as motion
+MOTION_RATIO = 0.01
+
+# Background learning rate per analyzed frame (exponential moving average)
+BACKGROUND_ALPHA = 0.05
+
+# Consecutive motion frames needed to start an event
+START_FRAMES = 2
+
+# Seconds without motion before an event ends
+END_AFTER = 5
+
+# Motion events kept in memory
+EVENT_HISTORY = 1000
+
+# Relay buffer for a motion decoder (in bytes)
+MOTION_BUFFER = 2 * 1024 * 1024
+
+# Delay before restarting a decoder that exited (in seconds)
+RESTART_DELAY = 2
+
+# Dictionary of watched cameras by stream ID
+watchers = {}  # { stream_id: CameraWatcher }
+watchers_lock = threading.Lock()
+
+# Recent motion events, oldest first
+events = collections.deque(maxlen=EVENT_HISTORY)
+events_lock = threading.Lock()
+_event_ids = itertools.count(1)
+_engine = None
+
+# Unwatched cameras whose open event the engine thread still has to end
+_retired = []  # [CameraWatcher], guarded by watchers_lock
+
+process_manager.PROCESSES.labels("motion").set_function(lambda: len(watchers))
+MOTION_EVENTS = metrics.Counter("ptz_motion_events_total", "Motion events started per camera", ["stream_id"])
+BATCH_SECONDS = metrics.Histogram("ptz_motion_batch_seconds", "Time to analyze one batch of frames")
+
+
+def build_decode_cmd(source, from_relay=False):
+    """
+    Build the FFmpeg command decoding a camera into SAMPLE_FPS raw gray
+    frames of FRAME_WIDTH x FRAME_HEIGHT on stdout. Each decoder runs in
+    its own process on one thread, so the cameras spread across all cores.
+    Non-reference frames are never decoded: the fps filter would drop most
+    of them anyway. (Keyframes only would be cheaper still, but with a GOP
+    of several seconds the fps filter would repeat one picture and the
+    frame-to-frame difference could never see motion.)
+    """
+    cmd = [process_manager.FFMPEG, "-hide_banner", "-nostdin", "-loglevel", "error",
+           "-threads", "1", "-skip_frame", "nonref", "-skip_loop_filter", "all", "-flags2", "fast"]
+    if from_relay:
+        cmd += ["-f", "mpegts", "-i", "pipe:0"]
+    else:
+        if source.startswith("rtsp://"):
+            cmd += ["-rtsp_transport", "tcp"]
+        cmd += ["-i", source]
+    cmd += [
+        "-an", "-vf", f"fps={SAMPLE_FPS},scale={FRAME_WIDTH}:{FRAME_HEIGHT}:flags=fast_bilinear,format=gray",
+        "-f", "rawvideo", "pipe:1"
+    ]
+    return cmd
+
+
+class MotionModel:
+    """
+    Background models of many cameras kept in one array so every analysis
+    step is a handful of vectorized NumPy operations over all cameras.
+    """
+
+    def __init__(self, capacity=8):
+        self.slots = {}  # { camera key: row in the arrays }
+        self.backgrounds = np.zeros((capacity, FRAME_HEIGHT, FRAME_WIDTH), np.float32)
+        self.previous = np.zeros((capacity, FRAME_HEIGHT, FRAME_WIDTH), np.float32)
+        self.primed = np.zeros(capacity, bool)
+
+    def _rows(self, keys):
+        for key in keys:
+            if key not in self.slots:
+                self.slots[key] = len(self.slots)
+        needed = len(self.slots)
+        if needed > len(self.primed):
+            grow = max(needed, 2 * len(self.primed)) - len(self.primed)
+            pad = np.zeros((grow, FRAME_HEIGHT, FRAME_WIDTH), np.float32)
+            self.backgrounds = np.concatenate([self.backgrounds, pad])
+            self.previous = np.concatenate([self.previous, pad])
+            self.primed = np.concatenate([self.primed, np.zeros(grow, bool)])
+        return np.array([self.slots[key] for key in keys])
+
+    def reset(self, key):
+        """Forget a camera's background (e.g. after its decoder restarted)."""
+        if key in self.slots:
+            self.primed[self.slots[key]] = False
+
+    def update(self, keys, frames):
+        """
+        Analyze one frame per camera. frames is a uint8 array of shape
+        (len(keys), FRAME_HEIGHT, FRAME_WIDTH).
+        Returns an array with the fraction of moving pixels per camera.
+        """
+        rows = self._rows(keys)
+        frames = frames.astype(np.float32)
+        background = self.backgrounds[rows]
+        previous = self.previous[rows]
+        fresh = ~self.primed[rows]
+        background[fresh] = frames[fresh]
+        previous[fresh] = frames[fresh]
+
+        # Moving pixels differ from both the background and the previous frame,
+        # which ignores objects that have come to rest and slow lighting changes
+        moving = (np.abs(frames - background) > PIXEL_THRESHOLD) & \
+                 (np.abs(frames - previous) > PIXEL_THRESHOLD)
+        ratios = moving.mean(axis=(1, 2))
+
+        background += BACKGROUND_ALPHA * (frames - background)
+        self.backgrounds[rows] = background
+        self.previous[rows] = frames
+        self.primed[rows] = True
+        return ratios
+
+
+class CameraWatcher(threading.Thread):
+    """
+    Runs the low-rate decoder of one camera and keeps its newest frame
+    for the engine. Also tracks the camera's motion event state.
+    """
+
+    def __init__(self, stream_id, uri, record=False, settings=None):
+        super().__init__(name=f"motion-{stream_id}", daemon=True)
+        self.stream_id = stream_id
+        self.uri = uri
+        self.record = record
+        self.settings = settings
+        self.frame = None
+        self.frame_count = 0
+        self.restarted = False
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        # Event state (only touched by the engine thread, see unwatch())
+        self.hits = 0
+        self.event = None
+        self.last_motion = None
+        self.ratio = 0.0
+        self.started_recording = False
+
+    def _decode(self):
+        from_relay = relay.ENABLED and self.uri.startswith("rtsp://")
+        process = subprocess.Popen(build_decode_cmd(self.uri, from_relay),
+                                   stdin=subprocess.PIPE if from_relay else subprocess.DEVNULL,
+                                   stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        if from_relay:
+            relay.feed_process(relay.attach(self.uri, f"motion-{self.stream_id}", MOTION_BUFFER), process)
+        with self.lock:
+            self.restarted = True
+        try:
+            while not self.stop_event.is_set():
+                data = process.stdout.read(FRAME_BYTES)
+                if len(data) < FRAME_BYTES:
+                    break
+                with self.lock:
+                    self.frame = data
+                    self.frame_count += 1
+        finally:
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                self._decode()
+            except OSError as e:
+                print(f"Motion decoder for stream {self.stream_id} failed: {e}")
+            self.stop_event.wait(RESTART_DELAY)
+
+    def take_frame(self):
+        """Return (frame bytes or None, restarted) and clear both."""
+        with self.lock:
+            frame, restarted = self.frame, self.restarted
+            self.frame, self.restarted = None, False
+            return frame, restarted
+
+    def info(self):
+        return {"stream_id": self.stream_id, "uri": relay.redact_uri(self.uri), "record": self.record,
+                "frames": self.frame_count, "ratio": round(float(self.ratio), 4),
+                "in_motion": self.event is not None}
+
+
+def _start_event(watcher, now):
+    event = {"id": next(_event_ids), "stream_id": watcher.stream_id,
+             "start": now, "end": None, "peak": float(watcher.ratio)}
+    watcher.event = event
+    MOTION_EVENTS.labels(watcher.stream_id).inc()
+    with events_lock:
+        events.append(event)
+    print(f"Motion started on stream {watcher.stream_id}")
+    if watcher.record and watcher.stream_id not in rtsp_manager.active_recordings:
+        watcher.started_recording = True
+        threading.Thread(target=rtsp_manager.start_recording, daemon=True,
+                         args=(watcher.stream_id, watcher.uri, watcher.settings)).start()
+
+
+def _end_event(watcher, now):
+    with events_lock:
+        watcher.event["end"] = now
+    watcher.event = None
+    print(f"Motion ended on stream {watcher.stream_id}")
+    if watcher.started_recording:
+        watcher.started_recording = False
+        # Stopping waits for ffmpeg to close its segment; keep the engine running meanwhile
+        threading.Thread(target=rtsp_manager.stop_recording, args=(watcher.stream_id,), daemon=True).start()
+
+
+def _track(watcher, ratio, now):
+    """Advance the event state machine of one camera."""
+    watcher.ratio = ratio
+    if ratio >= MOTION_RATIO:
+        watcher.hits += 1
+        watcher.last_motion = now
+        if watcher.event is None and watcher.hits >= START_FRAMES:
+            _start_event(watcher, now)
+        elif watcher.event is not None:
+            with events_lock:
+                watcher.event["peak"] = max(watcher.event["peak"], float(ratio))
+    else:
+        watcher.hits = 0
+        if watcher.event is not None and now - watcher.last_motion > END_AFTER:
+            _end_event(watcher, now)
+
+
+def _run_engine():
+    """Analyze the newest frame of every camera in one batch, SAMPLE_FPS times a second."""
+    global _engine
+    model = MotionModel()
+    while True:
+        tick = time.time()
+        with watchers_lock:
+            items = list(watchers.values())
+            retired, _retired[:] = list(_retired), []
+            if not items:
+                _engine = None
+        for watcher in retired:
+            if watcher.event is not None:
+                _end_event(watcher, tick)
+        if not items:
+            return
+        try:
+            _analyze(model, items, tick)
+        except Exception as e:
+            # One bad frame or listener must not stop detection on every camera
+            print(f"Motion analysis failed: {e}")
+        time.sleep(max(0.0, 1.0 / SAMPLE_FPS - (time.time() - tick)))
+
+
+def _analyze(model, items, tick):
+    """Run one batch: the newest frame of every camera through the model, then the event state."""
+    keys, frames, ready = [], [], []
+    for watcher in items:
+        frame, restarted = watcher.take_frame()
+        if restarted:
+            model.reset(watcher.stream_id)
+        if frame is not None:
+            keys.append(watcher.stream_id)
+            frames.append(np.frombuffer(frame, np.uint8).reshape(FRAME_HEIGHT, FRAME_WIDTH))
+            ready.append(watcher)
+    if keys:
+        with BATCH_SECONDS.time():
+            ratios = model.update(keys, np.stack(frames))
+        for watcher, ratio in zip(ready, ratios):
+            _track(watcher, ratio, tick)
+    for watcher in items:
+        # Cameras without a new frame still need their events closed
+        if watcher not in ready and watcher.event is not None:
+            _track(watcher, 0.0, tick)
+
+
+def watch(stream_id, uri, record=False, settings=None):
+    """
+    Start motion detection on a camera. With record, a motion event starts
+    a recording (with the given settings) that stops when the event ends.
+    Returns the watcher's info dictionary.
+    Raises RuntimeError if NumPy is not installed.
+    """
+    global _engine
+    if not lazy.available("numpy"):
+        raise RuntimeError("Motion detection needs the 'numpy' package")
+    with watchers_lock:
+        watcher = watchers.get(stream_id)
+        if watcher is not None and watcher.uri != uri:
+            watcher.stop_event.set()
+            _retired.append(watcher)
+            watcher = None
+        if watcher is None:
+            watcher = CameraWatcher(stream_id, uri, record, settings)
+            watchers[stream_id] = watcher
+            watcher.start()
+        watcher.record, watcher.settings = record, settings
+        if _engine is None:
+            _engine = threading.Thread(target=_run_engine, name="motion-engine", daemon=True)
+            _engine.start()
+    return watcher.info()
+
+
+def unwatch(stream_id):
+    """Stop motion detection on a camera. Returns True if it was watched."""
+    with watchers_lock:
+        watcher = watchers.pop(stream_id, None)
+        if watcher is None:
+            return False
+        # The engine thread owns the event state; it ends the event on its next tick
+        _retired.append(watcher)
+    watcher.stop_event.set()
+    return True
+
+
+def list_watchers():
+    """Return a list of dictionaries describing the watched cameras."""
+    with watchers_lock:
+        items = list(watchers.values())
+    return [watcher.info() for watcher in items]
+
+
+def list_events(stream_id=None, since=None):
+    """
+    Return motion events, oldest first, optionally for one camera and/or
+    only those still running or ended after the POSIX time since.
+    """
+    with events_lock:
+        found = [dict(event) for event in events]
+    if stream_id is not None:
+        found = [e for e in found if e["stream_id"] == stream_id]
+    if since is not None:
+        found = [e for e in found if e["end"] is None or e["end"] >= since]
+    return found
@@ -0,0 +1,345 @@
+# recording/preroll.py
+
+import collections
+import os
+import subprocess
+import threading
+import time
+from datetime import datetime
+
+from recording import process_manager, relay, rtsp_manager
+
+# Seconds of footage kept before a trigger
+PREROLL_SECONDS = 10
+
+# Hard cap on the pre-roll of one camera (in bytes)
+PREROLL_MAX_BYTES = 16 * 1024 * 1024
+
+# Seconds recorded after the last trigger
+POST_ROLL = 30
+
+TS_PACKET = relay.TS_PACKET
+PAT_PID = 0
+
+# MPEG-TS stream types of video codecs (MPEG-1/2, MPEG-4 part 2, H.264, HEVC)
+VIDEO_STREAM_TYPES = {0x01, 0x02, 0x10, 0x1B, 0x24}
+
+# Dictionary of armed cameras by stream ID
+buffers = {}  # { stream_id: PrerollBuffer }
+buffers_lock = threading.Lock()
+
+
+def packet_pid(chunk, offset):
+    """Return the PID of the MPEG-TS packet at the offset."""
+    return ((chunk[offset + 1] & 0x1F) << 8) | chunk[offset + 2]
+
+
+def keyframe_offset(chunk, pid):
+    """
+    Return the byte offset of the first MPEG-TS packet of the PID in the
+    chunk that starts a keyframe (payload start with the adaptation field's
+    random_access_indicator set), or -1.
+    """
+    for offset in range(0, len(chunk) - TS_PACKET + 1, TS_PACKET):
+        if chunk[offset] != 0x47 or packet_pid(chunk, offset) != pid:
+            continue
+        pusi = chunk[offset + 1] & 0x40
+        has_adaptation = chunk[offset + 3] & 0x20
+        if pusi and has_adaptation and chunk[offset + 4] > 0 and chunk[offset + 5] & 0x40:
+            return offset
+    return -1
+
+
+def _section(packet):
+    """Return (start, end) of the PSI section in a packet, without its CRC."""
+    start = 4
+    if packet[3] & 0x20:
+        start += 1 + packet[4]
+    start += 1 + packet[start]  # pointer field
+    section_length = ((packet[start + 1] & 0x0F) << 8) | packet[start + 2]
+    return start, min(start + 3 + section_length - 4, len(packet))
+
+
+def pmt_pid(pat_packet):
+    """Return the PID of the first program map table listed in a PAT packet, or None."""
+    try:
+        start, end = _section(pat_packet)
+        for entry in range(start + 8, end - 3, 4):
+            program = (pat_packet[entry] << 8) | pat_packet[entry + 1]
+            if program != 0:
+                return ((pat_packet[entry + 2] & 0x1F) << 8) | pat_packet[entry + 3]
+    except IndexError:
+        pass
+    return None
+
+
+def video_pid(pmt_packet):
+    """Return the PID of the first video stream listed in a PMT packet, or None."""
+    try:
+        start, end = _section(pmt_packet)
+        info_length = ((pmt_packet[start + 10] & 0x0F) << 8) | pmt_packet[start + 11]
+        entry = start + 12 + info_length
+        while entry + 5 <= end:
+            stream_type = pmt_packet[entry]
+            pid = ((pmt_packet[entry + 1] & 0x1F) << 8) | pmt_packet[entry + 2]
+            if stream_type in VIDEO_STREAM_TYPES:
+                return pid
+            entry += 5 + (((pmt_packet[entry + 3] & 0x0F) << 8) | pmt_packet[entry + 4])
+    except IndexError:
+        pass
+    return None
+
+
+class Gop:
+    """Chunks from one keyframe up to (not including) the next."""
+
+    def __init__(self, start):
+        self.start = start
+        self.chunks = []
+        self.bytes = 0
+
+    def append(self, chunk):
+        self.chunks.append(chunk)
+        self.bytes += len(chunk)
+
+
+class PrerollBuffer(threading.Thread):
+    """
+    Keeps the last PREROLL_SECONDS of one camera in memory as whole GOPs,
+    so a flush always starts on a keyframe. The oldest GOPs are dropped
+    to stay within max_bytes.
+    """
+
+    def __init__(self, stream_id, uri, seconds=PREROLL_SECONDS, max_bytes=PREROLL_MAX_BYTES):
+        super().__init__(name=f"preroll-{stream_id}", daemon=True)
+        self.stream_id = stream_id
+        self.uri = uri
+        self.seconds = seconds
+        self.max_bytes = max_bytes
+        self.gops = collections.deque()
+        self.bytes = 0
+        self.pat = None
+        self.pmt = None
+        self.pmt_pid = None
+        self.video_pid = None
+        self.taps = []  # consumers receiving the live stream after a flush
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.consumer = None
+
+    # relay.Consumer calls detach() on its owner when it is closed
+    def detach(self, tap):
+        with self.lock:
+            if tap in self.taps:
+                self.taps.remove(tap)
+
+    def _remember_tables(self, chunk):
+        # A flush must start with the program tables or the demuxer cannot find the video
+        for offset in range(0, len(chunk) - TS_PACKET + 1, TS_PACKET):
+            pid = packet_pid(chunk, offset)
+            if pid == PAT_PID:
+                self.pat = chunk[offset:offset + TS_PACKET]
+                self.pmt_pid = pmt_pid(self.pat)
+            elif pid == self.pmt_pid:
+                self.pmt = chunk[offset:offset + TS_PACKET]
+                self.video_pid = video_pid(self.pmt)
+
+    def add(self, chunk, now=None):
+        """Append a relay chunk (whole TS packets) and trim the buffer."""
+        now = time.time() if now is None else now
+        with self.lock:
+            self._remember_tables(chunk)
+            offset = keyframe_offset(chunk, self.video_pid) if self.video_pid is not None else -1
+            if offset >= 0:
+                if self.gops and offset:
+                    self.gops[-1].append(chunk[:offset])
+                    self.bytes += offset
+                self.gops.append(Gop(now))
+                self.gops[-1].append(chunk[offset:])
+                self.bytes += len(chunk) - offset
+            elif self.gops:
+                self.gops[-1].append(chunk)
+                self.bytes += len(chunk)
+            # Drop whole GOPs while the next one still reaches back far enough,
+            # and always when over the byte cap (then the newest GOP may go too)
+            while self.gops and (self.bytes > self.max_bytes or
+                                 (len(self.gops) > 1 and self.gops[1].start <= now - self.seconds)):
+                self.bytes -= self.gops.popleft().bytes
+            taps = list(self.taps)
+        for tap in taps:
+            tap.push(chunk)
+
+    def tap(self, name, max_bytes):
+        """
+        Return a consumer pre-loaded with the pre-roll (program tables
+        first) that then receives the live stream without gap or overlap,
+        plus the wall-clock time the pre-roll starts at.
+        """
+        with self.lock:
+            tables = [t for t in (self.pat, self.pmt) if t is not None]
+            chunks = [chunk for gop in self.gops for chunk in gop.chunks]
+            start = self.gops[0].start if self.gops else time.time()
+            tap = relay.Consumer(self, name, max_bytes + self.bytes)
+            for chunk in tables + chunks:
+                tap.push(chunk)
+            self.taps.append(tap)
+        return tap, start
+
+    def run(self):
+        self.consumer = relay.attach(self.uri, f"preroll-{self.stream_id}", relay.DEFAULT_BUFFER)
+        while not self.stop_event.is_set():
+            chunk = self.consumer.read(timeout=1)
+            if chunk is None:
+                # The relay went away; attach to a fresh one
+                self.consumer = relay.attach(self.uri, f"preroll-{self.stream_id}", relay.DEFAULT_BUFFER)
+            elif chunk:
+                self.add(chunk)
+        self.consumer.close()
+        with self.lock:
+            taps = list(self.taps)
+            self.gops.clear()
+            self.bytes = 0
+        for tap in taps:
+            tap.close()
+
+    def info(self):
+        with self.lock:
+            span = time.time() - self.gops[0].start if self.gops else 0.0
+            return {"stream_id": self.stream_id, "uri": relay.redact_uri(self.uri), "bytes": self.bytes,
+                    "max_bytes": self.max_bytes, "seconds": round(span, 1),
+                    "target_seconds": self.seconds, "gops": len(self.gops),
+                    "recording": len(self.taps)}
+
+
+# Dictionary of trigger recordings in progress by stream ID
+trigger_recordings = {}  # { stream_id: TriggerRecording }
+
+
+class TriggerRecording(threading.Thread):
+    """
+    Writes the pre-roll followed by the live stream into one file until
+    the post-roll deadline passes. Further triggers push the deadline out.
+    """
+
+    def __init__(self, buffer, label, post_roll, settings):
+        super().__init__(name=f"trigger-{buffer.stream_id}", daemon=True)
+        self.buffer = buffer
+        self.label = label
+        self.settings = rtsp_manager.resolve_settings(settings)
+        self.deadline = time.time() + post_roll
+        self.path = None
+        self.started = None
+        self.error = None
+
+    def extend(self, post_roll):
+        self.deadline = max(self.deadline, time.time() + post_roll)
+
+    def build_cmd(self, path):
+        ext, muxer, _ = rtsp_manager.SEGMENT_FORMATS[self.settings["format"]]
+        cmd = [process_manager.FFMPEG, "-hide_banner", "-nostdin", "-loglevel", "error",
+               "-f", "mpegts", "-i", "pipe:0", "-map", "0", "-c", "copy"]
+        if muxer == "mp4":
+            cmd += ["-movflags", "+frag_keyframe+empty_moov+default_base_moof"]
+        return cmd + ["-f", muxer, path]
+
+    def run(self):
+        stream_id = self.buffer.stream_id
+        tap, start = self.buffer.tap(f"trigger-{stream_id}", rtsp_manager.RECORDER_BUFFER)
+        self.started = datetime.fromtimestamp(start)
+        ext = rtsp_manager.SEGMENT_FORMATS[self.settings["format"]][0]
+        directory = os.path.join(rtsp_manager.camera_directory(stream_id, self.settings["location"]), "triggers")
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"camera_{stream_id}_"
+                                            f"{self.started.strftime(rtsp_manager.SEGMENT_TIME_FORMAT)}.{ext}")
+        try:
+            process = subprocess.Popen(self.build_cmd(self.path), stdin=subprocess.PIPE,
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        except OSError as e:
+            self.error = str(e)
+            tap.close()
+            return
+        feeder = relay.feed_process(tap, process)
+        while time.time() < self.deadline and process.poll() is None:
+            time.sleep(min(1.0, max(0.0, self.deadline - time.time())))
+        tap.close()  # ends the feeder, which closes stdin so ffmpeg finishes the file
+        feeder.join(timeout=5)
+        try:
+            _, stderr = process.communicate(timeout=10)
+            if process.returncode:
+                lines = stderr.decode("utf-8", "replace").strip().splitlines()
+                self.error = lines[-1] if lines else "ffmpeg failed"
+        except subprocess.TimeoutExpired:
+            process.kill()
+            self.error = "ffmpeg did not finish the file in time"
+        print(f"Trigger recording for stream {stream_id} written to {self.path}")
+
+    def info(self):
+        return {"stream_id": self.buffer.stream_id, "label": self.label, "path": self.path,
+                "started": self.started.isoformat(timespec="seconds") if self.started else None,
+                "ends_in": round(max(0.0, self.deadline - time.time()), 1),
+                "running": self.is_alive(), "error": self.error}
+
+
+def arm(stream_id, uri, seconds=PREROLL_SECONDS, max_bytes=PREROLL_MAX_BYTES):
+    """
+    Start buffering the last `seconds` of a camera so triggers can
+    include footage from before they fired. Returns the buffer's info.
+    """
+    with buffers_lock:
+        buffer = buffers.get(stream_id)
+        if buffer is not None and (buffer.uri != uri or not buffer.is_alive()):
+            buffer.stop_event.set()
+            buffer = None
+        if buffer is None:
+            buffer = PrerollBuffer(stream_id, uri, seconds, max_bytes)
+            buffers[stream_id] = buffer
+            buffer.start()
+        buffer.seconds, buffer.max_bytes = seconds, max_bytes
+    return buffer.info()
+
+
+def disarm(stream_id):
+    """Stop buffering a camera. Returns True if it was armed."""
+    with buffers_lock:
+        buffer = buffers.pop(stream_id, None)
+    if buffer is None:
+        return False
+    buffer.stop_event.set()
+    return True
+
+
+def fire(stream_id, uri, label=None, post_roll=POST_ROLL, settings=None):
+    """
+    Record the camera's pre-roll followed by `post_roll` seconds of live
+    footage into <location>/camera_<id>/triggers/. A camera that is
+    already writing a trigger recording just gets its post-roll extended.
+    Returns the trigger recording's info.
+    """
+    with buffers_lock:
+        buffer = buffers.get(stream_id)
+    if buffer is None:
+        arm(stream_id, uri)
+    elif buffer.uri != uri or not buffer.is_alive():
+        arm(stream_id, uri, buffer.seconds, buffer.max_bytes)  # restart it, keeping its pre-roll length
+    with buffers_lock:
+        recording = trigger_recordings.get(stream_id)
+        if recording is not None and recording.is_alive():
+            recording.extend(post_roll)
+        else:
+            recording = TriggerRecording(buffers[stream_id], label, post_roll, settings)
+            trigger_recordings[stream_id] = recording
+            recording.start()
+    return recording.info()
+
+
+def status():
+    """Return the armed cameras (with their memory use) and the trigger recordings."""
+    with buffers_lock:
+        armed = list(buffers.values())
+        recordings = list(trigger_recordings.values())
+    infos = [buffer.info() for buffer in armed]
+    return {
+        "armed": infos,
+        "total_bytes": sum(info["bytes"] for info in infos),
+        "recordings": [recording.info() for recording in recordings],
+    }
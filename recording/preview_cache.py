@@ -0,0 +1,158 @@
+# recording/preview_cache.py
+
+import subprocess
+import threading
+import time
+
+from recording import process_manager, relay
+
+# Width of the cached JPEG (height follows the aspect ratio)
+PREVIEW_WIDTH = 320
+
+# JPEG quality for ffmpeg's mjpeg encoder (2 = best, 31 = worst)
+JPEG_QUALITY = 6
+
+# Stop decoding a camera nobody asked a preview for in this long (in seconds)
+IDLE_TIMEOUT = 30
+
+# Delay before restarting a decoder that exited (in seconds)
+RESTART_DELAY = 2
+
+# Relay buffer for a preview decoder (in bytes)
+PREVIEW_BUFFER = 2 * 1024 * 1024
+
+JPEG_END = b"\xff\xd9"
+
+# Dictionary of running preview workers by stream ID
+workers = {}  # { stream_id: PreviewWorker }
+workers_lock = threading.Lock()
+
+process_manager.PROCESSES.labels("preview").set_function(lambda: len(workers))
+
+
+def split_jpegs(buffer):
+    """
+    Split complete JPEG images off the front of a byte buffer.
+    Returns a tuple (images, remainder).
+    """
+    images = []
+    while True:
+        end = buffer.find(JPEG_END)
+        if end < 0:
+            return images, buffer
+        start = buffer.find(b"\xff\xd8")
+        if 0 <= start < end:
+            images.append(bytes(buffer[start:end + 2]))
+        buffer = buffer[end + 2:]
+
+
+class PreviewWorker(threading.Thread):
+    """
+    Decodes only the keyframes of one camera into small JPEGs and keeps
+    the latest one in memory for every viewer.
+    """
+
+    def __init__(self, stream_id, uri):
+        super().__init__(name=f"preview-{stream_id}", daemon=True)
+        self.stream_id = stream_id
+        self.uri = uri
+        self.jpeg = None
+        self.etag = None
+        self.updated = None
+        self.sequence = 0
+        self.last_access = time.time()
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+
+    def build_cmd(self, from_relay):
+        # -skip_frame nokey makes the decoder ignore everything but keyframes
+        cmd = [process_manager.FFMPEG, "-hide_banner", "-nostdin", "-loglevel", "error", "-skip_frame", "nokey"]
+        if from_relay:
+            cmd += ["-f", "mpegts", "-i", "pipe:0"]
+        else:
+            if self.uri.startswith("rtsp://"):
+                cmd += ["-rtsp_transport", "tcp"]
+            cmd += ["-i", self.uri]
+        cmd += [
+            "-an", "-vf", f"scale={PREVIEW_WIDTH}:-2", "-fps_mode", "passthrough",
+            "-c:v", "mjpeg", "-q:v", str(JPEG_QUALITY), "-f", "image2pipe", "pipe:1"
+        ]
+        return cmd
+
+    def is_idle(self):
+        return time.time() - self.last_access > IDLE_TIMEOUT
+
+    def _store(self, jpeg):
+        with self.lock:
+            self.sequence += 1
+            self.jpeg = jpeg
+            self.etag = f'"{self.stream_id}-{self.sequence}"'
+            self.updated = time.time()
+
+    def _decode(self):
+        from_relay = relay.ENABLED and self.uri.startswith("rtsp://")
+        process = subprocess.Popen(self.build_cmd(from_relay),
+                                   stdin=subprocess.PIPE if from_relay else subprocess.DEVNULL,
+                                   stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        if from_relay:
+            relay.feed_process(relay.attach(self.uri, f"preview-{self.stream_id}", PREVIEW_BUFFER), process)
+        # read1() blocks while the camera sends nothing, so the loop alone may never see it go idle
+        process_manager.kill_when(process, lambda: self.stop_event.is_set() or self.is_idle())
+        buffer = b""
+        try:
+            while not self.stop_event.is_set() and not self.is_idle():
+                data = process.stdout.read1(65536)
+                if not data:
+                    break
+                images, buffer = split_jpegs(buffer + data)
+                if images:
+                    self._store(images[-1])
+        finally:
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            with workers_lock:
+                if self.is_idle():
+                    if workers.get(self.stream_id) is self:
+                        del workers[self.stream_id]
+                    break
+            try:
+                self._decode()
+            except OSError as e:
+                print(f"Preview decoder for stream {self.stream_id} failed: {e}")
+            self.stop_event.wait(RESTART_DELAY)
+
+    def latest(self):
+        """Return a tuple (jpeg, etag, updated) for the newest preview."""
+        with self.lock:
+            return self.jpeg, self.etag, self.updated
+
+
+def get_preview(stream_id, uri):
+    """
+    Return (jpeg, etag, updated) for the camera, starting its keyframe
+    decoder on first use. jpeg is None until the first keyframe arrives.
+    """
+    with workers_lock:
+        worker = workers.get(stream_id)
+        if worker is not None and (worker.uri != uri or not worker.is_alive()):
+            worker.stop_event.set()
+            worker = None
+        if worker is None:
+            worker = PreviewWorker(stream_id, uri)
+            workers[stream_id] = worker
+            worker.start()
+        worker.last_access = time.time()
+    return worker.latest()
+
+
+def stop_all():
+    """Stop every preview decoder (used on shutdown)."""
+    with workers_lock:
+        items = list(workers.values())
+        workers.clear()
+    for worker in items:
+        worker.stop_event.set()
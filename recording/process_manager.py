@@ -0,0 +1,268 @@
+# recording/process_manager.py
+
+import asyncio
+import collections
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+from recording import metrics
+
+# Directory holding ffmpeg/ffprobe; overrides PATH lookup when set
+FFMPEG_DIR = os.environ.get("PTZ_FFMPEG_DIR")
+
+# Fallback location used on Windows installs
+WINDOWS_FFMPEG_DIR = r"C:\ffmpeg\bin"
+
+# Upper bound on short-lived ffmpeg/ffprobe runs across all cameras
+MAX_CONCURRENT = int(os.environ.get("PTZ_MAX_PROCESSES", "16"))
+
+# Upper bound on concurrent runs against the same camera
+PER_CAMERA_LIMIT = 2
+
+# Time a process gets to exit after terminate() before it is killed (in seconds)
+KILL_GRACE = 2
+
+# Number of unparsed stderr lines kept in a result
+STDERR_LINES = 50
+
+
+def resolve_binary(name):
+    """
+    Return the path of an ffmpeg tool: PTZ_FFMPEG_DIR first, then PATH,
+    then the Windows install location.
+    """
+    candidates = []
+    if FFMPEG_DIR:
+        candidates += [os.path.join(FFMPEG_DIR, name), os.path.join(FFMPEG_DIR, name + ".exe")]
+    found = shutil.which(name)
+    if found:
+        candidates.append(found)
+    candidates.append(os.path.join(WINDOWS_FFMPEG_DIR, name + ".exe"))
+    for path in candidates:
+        if os.path.isfile(path):
+            return path
+    return name
+
+
+# Resolved once at import; every module spawns these paths
+FFMPEG = resolve_binary("ffmpeg")
+FFPROBE = resolve_binary("ffprobe")
+
+
+class ProcessResult:
+    """Outcome of run(): exit code, collected output and how the run ended."""
+
+    def __init__(self, returncode, stdout, stderr, timed_out=False, stopped_early=False):
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.timed_out = timed_out
+        self.stopped_early = stopped_early
+
+    @property
+    def ok(self):
+        return self.returncode == 0 and not self.timed_out
+
+
+_loop = None
+_loop_lock = threading.Lock()
+_global_slots = None
+_camera_slots = {}  # { key: asyncio.Semaphore }
+running = 0         # processes currently alive
+
+PROCESSES = metrics.Gauge("ptz_ffmpeg_processes", "Running ffmpeg/ffprobe processes by kind", ["kind"])
+PROCESSES.labels("oneshot").set_function(lambda: running)
+PROCESS_RUNS = metrics.Counter("ptz_process_runs_total", "Finished short-lived runs by outcome", ["outcome"])
+
+
+def get_loop():
+    """Return the shared event loop, starting its thread on first use."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="process-manager", daemon=True).start()
+    return _loop
+
+
+def _slots(key):
+    global _global_slots
+    if _global_slots is None:
+        _global_slots = asyncio.Semaphore(MAX_CONCURRENT)
+    if key is None:
+        return _global_slots, None
+    if key not in _camera_slots:
+        _camera_slots[key] = asyncio.Semaphore(PER_CAMERA_LIMIT)
+    return _global_slots, _camera_slots[key]
+
+
+async def _read_lines(stream, callback, keep):
+    """Feed every line to callback; returns True if the callback asked to stop."""
+    while True:
+        raw = await stream.readline()
+        if not raw:
+            return False
+        line = raw.decode("utf-8", "replace").rstrip("\r\n")
+        if callback is None:
+            keep.append(line)
+        elif callback(line):
+            return True
+
+
+async def _feed_stdin(writer, consumer):
+    """Copy relay consumer chunks into the process without blocking a thread."""
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Event()
+    consumer.on_data = lambda: loop.call_soon_threadsafe(ready.set)
+    try:
+        while True:
+            chunk = consumer.read(timeout=0)
+            if chunk is None:
+                break
+            if chunk:
+                writer.write(chunk)
+                await writer.drain()
+            else:
+                await ready.wait()
+                ready.clear()
+    except (BrokenPipeError, ConnectionResetError):
+        pass
+    finally:
+        consumer.close()
+        writer.close()
+
+
+async def _stop(process):
+    if process.returncode is not None:
+        return
+    try:
+        process.terminate()
+        await asyncio.wait_for(process.wait(), KILL_GRACE)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+    except ProcessLookupError:
+        pass
+
+
+async def run_process(cmd, key=None, timeout=None, on_stdout_line=None, on_stderr_line=None,
+                      stdin_consumer=None):
+    """
+    Run a command under the global and per-key concurrency limits.
+    stdout/stderr are streamed line by line to the callbacks as they arrive;
+    a callback returning True ends the run early. Without a callback the
+    lines are collected into the result. stdin_consumer is an optional relay
+    consumer whose bytes are written into the process.
+    Returns a ProcessResult.
+    """
+    global running
+    global_slots, key_slots = _slots(key)
+    async with global_slots:
+        if key_slots:
+            await key_slots.acquire()
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=subprocess.PIPE if stdin_consumer else subprocess.DEVNULL,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except OSError:
+            if key_slots:
+                key_slots.release()
+            if stdin_consumer:
+                stdin_consumer.close()
+            raise
+        running += 1
+        stdout_lines = []
+        stderr_lines = collections.deque(maxlen=STDERR_LINES)
+        feeder = None
+        if stdin_consumer:
+            feeder = asyncio.ensure_future(_feed_stdin(process.stdin, stdin_consumer))
+        readers = [
+            asyncio.ensure_future(_read_lines(process.stdout, on_stdout_line, stdout_lines)),
+            asyncio.ensure_future(_read_lines(process.stderr, on_stderr_line, stderr_lines)),
+        ]
+        timed_out = stopped_early = finished = False
+        try:
+            pending = set(readers)
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + timeout if timeout else None
+            while pending:
+                wait_for = None if deadline is None else max(0, deadline - loop.time())
+                done, pending = await asyncio.wait(pending, timeout=wait_for,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    timed_out = True
+                    break
+                if any(task.result() for task in done):
+                    stopped_early = True
+                    break
+            else:
+                finished = True
+        finally:
+            if not finished:
+                # Signalling polls (and reaps) the child, so only do it to end a run early
+                await _stop(process)
+            for task in readers:
+                task.cancel()
+            if feeder:
+                feeder.cancel()
+                stdin_consumer.close()
+            running -= 1
+            if key_slots:
+                key_slots.release()
+        await process.wait()
+        outcome = ("timeout" if timed_out else "stopped_early" if stopped_early
+                   else "ok" if process.returncode == 0 else "failed")
+        PROCESS_RUNS.labels(outcome).inc()
+        return ProcessResult(process.returncode, "\n".join(stdout_lines), "\n".join(stderr_lines),
+                             timed_out, stopped_early)
+
+
+def run(cmd, **kwargs):
+    """
+    Blocking wrapper around run_process() for threads and Flask handlers.
+    Callbacks run on the event loop thread, so they must not block.
+    """
+    future = asyncio.run_coroutine_threadsafe(run_process(cmd, **kwargs), get_loop())
+    return future.result()
+
+
+def spawn_until_ready(cmd, ready_marker, timeout=10):
+    """
+    Start a long-running process and return it once ready_marker shows up
+    on stderr (or the timeout expires) instead of sleeping a fixed time.
+    stderr keeps being drained so the pipe never fills up.
+    """
+    process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    ready = threading.Event()
+
+    def drain():
+        for raw in iter(process.stderr.readline, b""):
+            if ready_marker in raw.decode("utf-8", "replace"):
+                ready.set()
+        ready.set()
+
+    threading.Thread(target=drain, daemon=True).start()
+    ready.wait(timeout)
+    return process
+
+
+def kill_when(process, condition, interval=1):
+    """
+    Kill a long-running process from a watchdog thread as soon as
+    condition() returns True. A thread blocked reading the process's stdout
+    then sees EOF, so it never waits for output that may not come (a camera
+    that stopped sending) before noticing it should quit.
+    """
+    def watch():
+        while process.poll() is None:
+            if condition():
+                process.kill()
+                return
+            time.sleep(interval)
+
+    threading.Thread(target=watch, name=f"watchdog-{process.pid}", daemon=True).start()
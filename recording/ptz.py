@@ -0,0 +1,540 @@
+# recording/ptz.py
+
+import base64
+import collections
+import contextlib
+import http.client
+import socket
+import threading
+import time
+from concurrent.futures import Future
+from urllib.parse import urlsplit
+
+from recording import metrics, rtsp_manager, store
+
+# Per-camera overrides are saved in the settings table under this key:
+# { "<stream_id>": { "protocol", "host", "port", "username", "password", "settle" } }
+SETTINGS_KEY = "ptz"
+
+# Defaults per protocol; the host defaults to the one of the camera's RTSP URI
+DEFAULT_CONFIG = {
+    # Raw VISCA over TCP (PTZOptics, Lumens, ...); completions tell when a preset is reached
+    "visca": {"port": 5678, "settle": 0},
+    # PTZOptics style /cgi-bin/ptzctrl.cgi; there is no completion, so wait "settle" seconds after a recall
+    "http": {"port": 80, "settle": 2},
+}
+
+# VISCA speed ranges
+PAN_SPEED_MAX = 0x18
+TILT_SPEED_MAX = 0x14
+ZOOM_SPEED_MAX = 7
+
+# Highest preset number accepted by both protocols
+PRESET_MAX = 127
+
+# A VISCA camera executes at most this many commands at once (its two command sockets)
+VISCA_SOCKETS = 2
+
+# A command the camera has not acknowledged after this long is considered lost (seconds)
+ACK_TIMEOUT = 1
+
+# Longest a preset recall may take before the camera is considered stuck (seconds)
+PRESET_TIMEOUT = 20
+
+CONNECT_TIMEOUT = 3
+
+# Delay before reconnecting to a camera that dropped the connection (seconds)
+RECONNECT_DELAY = 2
+
+# VISCA error codes (reply 90 6y ee FF)
+VISCA_ERRORS = {
+    0x01: "message length error",
+    0x02: "syntax error",
+    0x03: "command buffer full",
+    0x04: "command canceled",
+    0x05: "no socket",
+    0x41: "command not executable",
+}
+
+# Dictionary of camera controllers by stream ID
+controllers = {}  # { stream_id: Controller }
+controllers_lock = threading.Lock()
+
+COMMAND_SECONDS = metrics.Histogram("ptz_command_seconds", "Time from a PTZ request to the camera's reply",
+                                    ["protocol", "command"],
+                                    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5, 20))
+COALESCED = metrics.Counter("ptz_commands_coalesced_total",
+                            "Motion updates replaced by a newer one before they were sent", ["camera"])
+
+
+def _speed(value, maximum):
+    """Scale a -1..1 joystick axis to a camera speed (1..maximum)."""
+    return max(1, min(maximum, round(abs(value) * maximum)))
+
+
+class ViscaBackend:
+    """
+    One persistent VISCA-over-IP connection. Commands are written without
+    waiting for the previous reply (up to VISCA_SOCKETS in flight); a
+    reader thread matches ACKs, completions and errors back to them.
+    Every command returns a Future resolved by its completion.
+    """
+    protocol = "visca"
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.sock = None
+        self.unacked = collections.deque()  # (future, sent_at) in the order they were written
+        self.executing = {}  # { socket number: future }
+        self.cond = threading.Condition()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=CONNECT_TIMEOUT)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # joystick packets are tiny
+        sock.settimeout(None)
+        self.sock = sock
+        threading.Thread(target=self._read, args=(sock,), name=f"visca-{self.host}", daemon=True).start()
+        print(f"PTZ connected to {self.host}:{self.port} (VISCA)")
+
+    def _read(self, sock):
+        buffer = b""
+        try:
+            while True:
+                data = sock.recv(4096)
+                if not data:
+                    break
+                buffer += data
+                while b"\xff" in buffer:
+                    packet, buffer = buffer.split(b"\xff", 1)
+                    self._reply(packet)
+        except OSError:
+            pass
+        self._disconnected(sock, ConnectionError(f"VISCA connection to {self.host} closed"))
+
+    def _reply(self, packet):
+        if len(packet) < 2:
+            return
+        kind, number = packet[1] & 0xF0, packet[1] & 0x0F
+        future = None
+        with self.cond:
+            if kind == 0x40:  # ACK: the oldest unacknowledged command now runs in socket <number>
+                if self.unacked:
+                    self.executing[number] = self.unacked.popleft()[0]
+            elif kind in (0x50, 0x60):  # completion or error; socket 0 means it was never accepted
+                future = self.executing.pop(number, None) if number else None
+                if future is None and self.unacked:
+                    future = self.unacked.popleft()[0]
+            self.cond.notify_all()
+        # Resolve outside the lock: done callbacks may queue the next command
+        if future is None:
+            return
+        if kind == 0x50:
+            future.set_result(bytes(packet[2:]))
+        else:
+            code = packet[2] if len(packet) > 2 else 0
+            future.set_exception(RuntimeError(f"VISCA {VISCA_ERRORS.get(code, hex(code))}"))
+
+    def _disconnected(self, sock, error):
+        with self.cond:
+            if self.sock is not sock:
+                return
+            self.sock = None
+            pending = [f for f, _ in self.unacked] + list(self.executing.values())
+            self.unacked.clear()
+            self.executing.clear()
+            self.cond.notify_all()
+        with contextlib.suppress(OSError):
+            sock.close()
+        for future in pending:
+            future.set_exception(error)
+
+    def send(self, packet):
+        """Write one command (e.g. b"\\x81\\x01\\x06\\x04\\xff"). Blocks only while the camera is busy."""
+        future = Future()
+        lost = []
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                while self.unacked and now - self.unacked[0][1] > ACK_TIMEOUT:
+                    lost.append(self.unacked.popleft()[0])
+                if len(self.unacked) + len(self.executing) < VISCA_SOCKETS:
+                    break
+                self.cond.wait(ACK_TIMEOUT / 4)
+            if self.sock is None:
+                self._connect()
+            sock = self.sock
+            self.unacked.append((future, time.monotonic()))
+        for lost_future in lost:
+            lost_future.set_exception(TimeoutError(f"no VISCA ACK from {self.host}"))
+        try:
+            sock.sendall(packet)
+        except OSError as e:
+            self._disconnected(sock, e)
+        return future
+
+    def pan_tilt(self, pan, tilt):
+        x = 0x03 if not pan else 0x01 if pan < 0 else 0x02
+        y = 0x03 if not tilt else 0x01 if tilt > 0 else 0x02
+        return self.send(bytes([0x81, 0x01, 0x06, 0x01, _speed(pan, PAN_SPEED_MAX),
+                                _speed(tilt, TILT_SPEED_MAX), x, y, 0xFF]))
+
+    def zoom(self, speed):
+        p = min(ZOOM_SPEED_MAX, round(abs(speed) * ZOOM_SPEED_MAX))
+        direction = 0x00 if not speed else 0x20 | p if speed > 0 else 0x30 | p
+        return self.send(bytes([0x81, 0x01, 0x04, 0x07, direction, 0xFF]))
+
+    def focus(self, speed):
+        p = min(ZOOM_SPEED_MAX, round(abs(speed) * ZOOM_SPEED_MAX))
+        direction = 0x00 if not speed else 0x20 | p if speed > 0 else 0x30 | p
+        return self.send(bytes([0x81, 0x01, 0x04, 0x08, direction, 0xFF]))
+
+    def autofocus(self):
+        return self.send(bytes([0x81, 0x01, 0x04, 0x38, 0x02, 0xFF]))
+
+    def home(self):
+        return self.send(bytes([0x81, 0x01, 0x06, 0x04, 0xFF]))
+
+    def recall(self, preset):
+        return self.send(bytes([0x81, 0x01, 0x04, 0x3F, 0x02, preset, 0xFF]))
+
+    def save(self, preset):
+        return self.send(bytes([0x81, 0x01, 0x04, 0x3F, 0x01, preset, 0xFF]))
+
+    def close(self):
+        sock = self.sock
+        if sock is not None:
+            self._disconnected(sock, ConnectionError("PTZ connection closed"))
+
+
+class HttpBackend:
+    """
+    PTZOptics style HTTP CGI control over one keep-alive connection. HTTP
+    has no completions, so a command is done once the camera answered.
+    """
+    protocol = "http"
+
+    def __init__(self, host, port, username=None, password=None):
+        self.host = host
+        self.port = port
+        self.conn = None
+        self.headers = {}
+        if username:
+            token = base64.b64encode(f"{username}:{password or ''}".encode()).decode()
+            self.headers["Authorization"] = f"Basic {token}"
+
+    def send(self, *args):
+        """GET /cgi-bin/ptzctrl.cgi?ptzcmd&<args>, reconnecting once if the camera closed the connection."""
+        future = Future()
+        path = "/cgi-bin/ptzctrl.cgi?ptzcmd&" + "&".join(str(a) for a in args)
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=CONNECT_TIMEOUT)
+            try:
+                self.conn.request("GET", path, headers=self.headers)
+                response = self.conn.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException) as e:
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise ConnectionError(f"PTZ request to {self.host} failed: {e}") from e
+                continue
+            if response.status != 200:
+                future.set_exception(RuntimeError(f"camera answered HTTP {response.status}"))
+            else:
+                future.set_result(None)
+            return future
+
+    def pan_tilt(self, pan, tilt):
+        if not pan and not tilt:
+            return self.send("ptzstop")
+        # Pan comes first in the diagonal commands: leftup, rightup, leftdown, rightdown
+        direction = ("left" if pan < 0 else "right" if pan > 0 else "") + \
+                    ("up" if tilt > 0 else "down" if tilt < 0 else "")
+        return self.send(direction, _speed(pan, PAN_SPEED_MAX), _speed(tilt, TILT_SPEED_MAX))
+
+    def zoom(self, speed):
+        if not speed:
+            return self.send("zoomstop")
+        return self.send("zoomin" if speed > 0 else "zoomout", round(abs(speed) * ZOOM_SPEED_MAX))
+
+    def focus(self, speed):
+        if not speed:
+            return self.send("focusstop")
+        return self.send("focusin" if speed > 0 else "focusout", round(abs(speed) * ZOOM_SPEED_MAX))
+
+    def autofocus(self):
+        return self.send("focusauto")
+
+    def home(self):
+        return self.send("home")
+
+    def recall(self, preset):
+        return self.send("poscall", preset)
+
+    def save(self, preset):
+        return self.send("posset", preset)
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+BACKENDS = {"visca": ViscaBackend, "http": HttpBackend}
+
+
+class Controller:
+    """
+    Sends the commands of one camera from a single thread. Continuous
+    motion (pan/tilt, zoom, focus) is kept as the latest requested state
+    per axis group: a burst of joystick updates that arrives while the
+    camera is still busy collapses into one command carrying the newest
+    state. One-shot commands (presets, home) are queued in order.
+    """
+
+    def __init__(self, stream_id, backend, settle=0):
+        self.stream_id = stream_id
+        self.backend = backend
+        self.settle = settle
+        self.seq = 0
+        self.latest = {}  # { group: (seq, args, requested_at) } not sent yet
+        self.sent = {}  # { group: args } last state written to the camera
+        self.oneshots = collections.deque()  # (seq, name, args, future, requested_at)
+        self.exclusive = False  # set while a preset + recording transaction owns the camera
+        self.transaction = threading.Lock()
+        self.cond = threading.Condition()
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, name=f"ptz-{stream_id}", daemon=True)
+        self.thread.start()
+
+    def move(self, group, *args, force=False):
+        """
+        Request a continuous motion state, e.g. move("pan_tilt", -0.5, 0) or
+        move("zoom", 0). Returns False while a transaction owns the camera.
+        """
+        with self.cond:
+            if self.exclusive and not force:
+                return False
+            if group in self.latest:
+                COALESCED.labels(str(self.stream_id)).inc()
+            self.seq += 1
+            self.latest[group] = (self.seq, args, time.monotonic())
+            self.cond.notify()
+        return True
+
+    def command(self, name, *args, force=False):
+        """Queue a one-shot command ("recall", "save", "home", "autofocus"). Returns a Future, or None if busy."""
+        with self.cond:
+            if self.exclusive and not force:
+                return None
+            self.seq += 1
+            future = Future()
+            self.oneshots.append((self.seq, name, args, future, time.monotonic()))
+            self.cond.notify()
+        return future
+
+    def stop_motion(self, force=False):
+        return all([self.move("pan_tilt", 0, 0, force=force), self.move("zoom", 0, force=force),
+                    self.move("focus", 0, force=force)])
+
+    @contextlib.contextmanager
+    def exclusive_section(self):
+        """Stop all motion and reject joystick input until the block ends."""
+        with self.transaction:
+            with self.cond:
+                self.exclusive = True
+            try:
+                self.stop_motion(force=True)
+                yield self
+            finally:
+                with self.cond:
+                    self.exclusive = False
+
+    def _take(self):
+        # Everything due, oldest request first, skipping states the camera already has
+        work = [(seq, group, args, None, at) for group, (seq, args, at) in self.latest.items()
+                if self.sent.get(group) != args]
+        work += [(seq, name, args, future, at) for seq, name, args, future, at in self.oneshots]
+        self.latest.clear()
+        self.oneshots.clear()
+        return sorted(work, key=lambda item: item[0])
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.stopped and not self.latest and not self.oneshots:
+                    self.cond.wait()
+                if self.stopped:
+                    return
+                work = self._take()
+            for seq, name, args, future, requested_at in work:
+                try:
+                    reply = getattr(self.backend, name)(*args)
+                except Exception as e:
+                    print(f"PTZ command {name} to camera {self.stream_id} failed: {e}")
+                    if future is not None:
+                        future.set_exception(e)
+                    else:
+                        self._resend(name, seq, args)
+                    time.sleep(RECONNECT_DELAY)
+                    continue
+                if future is None:
+                    self.sent[name] = args
+                reply.add_done_callback(lambda r, name=name, seq=seq, args=args, future=future, at=requested_at:
+                                        self._replied(r, name, seq, args, future, at))
+
+    def _resend(self, group, seq, args):
+        # Put a failed motion state back unless a newer one was requested meanwhile
+        with self.cond:
+            self.sent.pop(group, None)
+            self.latest.setdefault(group, (seq, args, time.monotonic()))
+            self.cond.notify()
+
+    def _replied(self, reply, name, seq, args, future, requested_at):
+        COMMAND_SECONDS.labels(self.backend.protocol, name).observe(time.monotonic() - requested_at)
+        error = reply.exception()
+        if future is not None:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(reply.result())
+        elif error is not None:
+            # The camera may still be moving with an older state: send the latest one again
+            if isinstance(error, (OSError, TimeoutError)) or "buffer full" in str(error):
+                self._resend(name, seq, args)
+            else:
+                print(f"PTZ command {name} to camera {self.stream_id} failed: {error}")
+
+    def close(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify()
+        self.backend.close()
+
+
+def get_config(stream_id, uri=None):
+    """
+    Return the PTZ settings of a camera: "protocol", "host", "port",
+    "username", "password" and "settle", with defaults filled in.
+    """
+    saved = (store.get_setting(SETTINGS_KEY) or {}).get(str(stream_id), {})
+    protocol = saved.get("protocol") or "visca"
+    config = {"protocol": protocol, "host": None, "username": None, "password": None}
+    config.update(DEFAULT_CONFIG[protocol])
+    config.update({k: v for k, v in saved.items() if v not in (None, "")})
+    if not config["host"] and uri:
+        config["host"] = urlsplit(uri).hostname
+    return config
+
+
+def set_config(stream_id, config):
+    """Validate and save the PTZ settings of a camera; its connection is reopened on next use."""
+    protocol = config.get("protocol") or "visca"
+    if protocol not in BACKENDS:
+        raise ValueError(f"protocol must be one of {', '.join(BACKENDS)}")
+    saved = {"protocol": protocol}
+    for key in ("host", "username", "password"):
+        if config.get(key):
+            saved[key] = str(config[key])
+    for key in ("port", "settle"):
+        if config.get(key) not in (None, ""):
+            saved[key] = float(config[key]) if key == "settle" else int(config[key])
+            if saved[key] < 0:
+                raise ValueError(f"{key} must not be negative")
+    all_configs = store.get_setting(SETTINGS_KEY) or {}
+    all_configs[str(stream_id)] = saved
+    store.set_setting(SETTINGS_KEY, all_configs)
+    close(stream_id)
+    return get_config(stream_id)
+
+
+def get_controller(stream_id, uri=None):
+    """Return the controller of a camera, opening its connection on first use."""
+    with controllers_lock:
+        controller = controllers.get(stream_id)
+        if controller is None:
+            config = get_config(stream_id, uri)
+            if not config["host"]:
+                raise ValueError(f"No PTZ host known for camera {stream_id}")
+            if config["protocol"] == "http":
+                backend = HttpBackend(config["host"], config["port"], config["username"], config["password"])
+            else:
+                backend = ViscaBackend(config["host"], config["port"])
+            controller = controllers[stream_id] = Controller(stream_id, backend, config["settle"])
+        return controller
+
+
+def _preset(preset):
+    preset = int(preset)
+    if not 0 <= preset <= PRESET_MAX:
+        raise ValueError(f"preset must be between 0 and {PRESET_MAX}")
+    return preset
+
+
+def recall_preset(stream_id, uri, preset, wait=True):
+    """
+    Move a camera to a saved preset. With wait=True, blocks until the
+    camera reports it got there. Returns False if a transaction owns the camera.
+    """
+    controller = get_controller(stream_id, uri)
+    future = controller.command("recall", _preset(preset))
+    if future is None:
+        return False
+    if wait:
+        future.result(PRESET_TIMEOUT)
+        time.sleep(controller.settle)
+    return True
+
+
+def save_preset(stream_id, uri, preset):
+    """Save the current position of a camera as a preset. Returns False if the camera is busy."""
+    future = get_controller(stream_id, uri).command("save", _preset(preset))
+    if future is None:
+        return False
+    future.result(PRESET_TIMEOUT)
+    return True
+
+
+def record_at_preset(stream_id, uri, preset, settings=None):
+    """
+    Move a camera to a preset, then start recording it. Joystick input is
+    rejected in between, so the first frame is already on the preset; if
+    the camera does not get there, recording is not started and the error
+    is raised. Returns the result of rtsp_manager.start_recording().
+    """
+    controller = get_controller(stream_id, uri)
+    with controller.exclusive_section():
+        if stream_id in rtsp_manager.active_recordings:
+            print(f"Stream {stream_id} is already recording.")
+            return False
+        controller.command("recall", _preset(preset), force=True).result(PRESET_TIMEOUT)
+        time.sleep(controller.settle)
+        return rtsp_manager.start_recording(stream_id, uri, settings)
+
+
+def stop_at_preset(stream_id, uri, preset=None):
+    """
+    Stop recording a camera, then (optionally) send it to a preset, e.g. a
+    parking position. Returns the result of rtsp_manager.stop_recording().
+    """
+    controller = get_controller(stream_id, uri)
+    with controller.exclusive_section():
+        stopped = rtsp_manager.stop_recording(stream_id)
+        if stopped and preset is not None:
+            controller.command("recall", _preset(preset), force=True).result(PRESET_TIMEOUT)
+        return stopped
+
+
+def close(stream_id):
+    """Close the connection of a camera (e.g. after it was deleted or reconfigured)."""
+    with controllers_lock:
+        controller = controllers.pop(stream_id, None)
+    if controller is not None:
+        controller.close()
+
+
+def close_all():
+    for stream_id in list(controllers):
+        close(stream_id)
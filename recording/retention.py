@@ -0,0 +1,434 @@
+# recording/retention.py
+
+import bisect
+import collections
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+from recording import highlights, metrics, rtsp_manager, segment_index, store
+
+# Policy used until one is saved (bytes, days and fractions; None disables a rule).
+# Only cataloged segments are ever deleted: trigger clips (camera_<id>/triggers)
+# and highlight outputs are exempt and are left for the user to remove.
+DEFAULT_POLICY = {
+    "max_bytes": None,          # all cameras together
+    "camera_max_bytes": {},     # { "<stream_id>": bytes }
+    "max_age_days": None,
+    "quota_high": 0.95,         # start deleting once a quota is this full...
+    "quota_low": 0.90,          # ...and stop once usage is back under this
+    # Same for the disk holding the recordings. Opt-in (e.g. 0.90 / 0.85): the
+    # disk may be filled by other data, and then no amount of footage frees it
+    "disk_high": None,
+    "disk_low": None,
+}
+
+# Seconds between two checks when no segment pushed usage over a high watermark
+CHECK_INTERVAL = 60
+
+# Files deleted between two short pauses, so a large cleanup never hogs the disk
+DELETE_BATCH = 100
+BATCH_PAUSE = 0.05
+
+Segment = collections.namedtuple("Segment", "start end size path")
+
+# Finished segments per camera, oldest first: eviction pops from the left in O(1)
+segments = {}  # { stream_id: deque of Segment }
+
+# Protected segments taken off the front of a deque, oldest first; still counted in usage
+held = {}  # { stream_id: [Segment] }
+
+# Running totals, updated on every add and delete instead of walking the disk
+usage = {}  # { stream_id: bytes }
+total_bytes = 0
+tracked = set()  # absolute paths counted in usage, so a segment reported twice is only counted once
+state_lock = threading.Lock()
+
+policy = dict(DEFAULT_POLICY)
+history = {"deleted_files": 0, "deleted_bytes": 0, "last_run": None, "last_error": None,
+           "disk_shortfall": None}  # bytes the disk rule could not free with deletable footage
+
+_loaded = False
+_pending = []  # (stream_id, Segment) finished while the catalog was being loaded
+_wake = threading.Event()
+_thread = None
+
+USAGE = metrics.Gauge("ptz_retention_bytes", "Bytes of recorded footage per camera", ["camera"])
+DELETED_BYTES = metrics.Counter("ptz_retention_deleted_bytes_total", "Bytes deleted by retention", ["reason"])
+
+
+def _add(stream_id, segment):
+    """Account for a segment. Caller holds state_lock."""
+    global total_bytes
+    key = os.path.abspath(segment.path)
+    if key in tracked:
+        return
+    tracked.add(key)
+    queue = segments.setdefault(stream_id, collections.deque())
+    if not queue or queue[-1].start <= segment.start:
+        queue.append(segment)
+    else:
+        # Only happens when old footage is cataloged late
+        queue.insert(bisect.bisect_right([s.start for s in queue], segment.start), segment)
+    usage[stream_id] = usage.get(stream_id, 0) + segment.size
+    total_bytes += segment.size
+    USAGE.labels(stream_id).set(usage[stream_id])
+
+
+def _forget(stream_id, segment):
+    """Take a segment out of the tallies. Caller holds state_lock."""
+    global total_bytes
+    tracked.discard(os.path.abspath(segment.path))
+    usage[stream_id] -= segment.size
+    total_bytes -= segment.size
+    USAGE.labels(stream_id).set(usage[stream_id])
+
+
+def segment_finished(stream_id, segment):
+    """Account for a segment as soon as its recorder closes it."""
+    try:
+        size = os.path.getsize(segment["path"])
+    except OSError:
+        return
+    start = datetime.fromisoformat(segment["start"]).timestamp()
+    entry = Segment(start, start + segment["duration"], size, segment["path"])
+    with state_lock:
+        if not _loaded:
+            _pending.append((stream_id, entry))
+            return
+        _add(stream_id, entry)
+    if over_high_watermark():
+        _wake.set()
+
+
+rtsp_manager.segment_listeners.append(segment_finished)
+
+
+def segments_cataloged(rows):
+    """Account for catalog rows added by a sync (footage no recorder of this process reported)."""
+    entries = [(row["stream_id"], Segment(row["start_ts"], row["end_ts"], row["size"] or 0, row["path"]))
+               for row in rows]
+    with state_lock:
+        if not _loaded:
+            _pending.extend(entries)
+            return
+        for stream_id, entry in entries:
+            _add(stream_id, entry)
+    if entries and over_high_watermark():
+        _wake.set()
+
+
+def segments_removed(paths):
+    """Stop counting segments whose file is gone (catalog rows pruned)."""
+    paths = {os.path.abspath(path) for path in paths}
+    with state_lock:
+        if not paths & tracked:
+            return
+        for stream_id, queue in segments.items():
+            gone = [s for s in queue if os.path.abspath(s.path) in paths]
+            if gone:
+                segments[stream_id] = collections.deque(s for s in queue if s not in gone)
+            for segment in gone:
+                _forget(stream_id, segment)
+        for stream_id, items in held.items():
+            gone = [s for s in items if os.path.abspath(s.path) in paths]
+            for segment in gone:
+                _forget(stream_id, segment)
+            held[stream_id] = [s for s in items if s not in gone]
+
+
+def _disk_usage():
+    location = rtsp_manager.DEFAULT_SETTINGS["location"]
+    try:
+        return shutil.disk_usage(location if os.path.exists(location) else ".")
+    except OSError:
+        return None
+
+
+def over_high_watermark(now=None):
+    """Return True if any rule needs enforcing right now (cheap: tallies and one statvfs)."""
+    now = now or time.time()
+    with state_lock:
+        if policy["max_bytes"] and total_bytes > policy["max_bytes"] * policy["quota_high"]:
+            return True
+        for stream_id, limit in policy["camera_max_bytes"].items():
+            if limit and usage.get(int(stream_id), 0) > limit * policy["quota_high"]:
+                return True
+        if policy["max_age_days"]:
+            cutoff = now - policy["max_age_days"] * 86400
+            if any(queue and queue[0].end < cutoff for queue in segments.values()):
+                return True
+    if not policy["disk_high"]:
+        return False
+    disk = _disk_usage()
+    return bool(disk and disk.used > disk.total * policy["disk_high"])
+
+
+# -- protection -----------------------------------------------------------------
+
+class Protection:
+    """
+    Time ranges that must not be deleted: events (every camera) and the
+    highlight clips still being cut (their camera only). Events are kept
+    sorted with a running maximum of their ends, so checking a segment is a
+    binary search.
+    """
+
+    def __init__(self):
+        ranges = store.event_ranges()
+        self.starts = [start for start, _ in ranges]
+        self.max_ends = []
+        latest = float("-inf")
+        for _, end in ranges:
+            latest = max(latest, end)
+            self.max_ends.append(latest)
+        self.clips = []
+        for job in highlights.list_jobs():
+            if job["state"] in ("queued", "running"):
+                self.clips.append((job["stream_id"], datetime.fromisoformat(job["start"]).timestamp(),
+                                   datetime.fromisoformat(job["end"]).timestamp()))
+
+    def covers(self, stream_id, segment):
+        i = bisect.bisect_left(self.starts, segment.end)  # events starting before the segment ends
+        if i and self.max_ends[i - 1] > segment.start:
+            return True
+        return any(sid == stream_id and start < segment.end and end > segment.start
+                   for sid, start, end in self.clips)
+
+
+def _release_held(protection):
+    """Put held segments that are no longer protected back in front of their deque. Caller holds state_lock."""
+    for stream_id, items in held.items():
+        released = [s for s in items if not protection.covers(stream_id, s)]
+        if released:
+            held[stream_id] = [s for s in items if protection.covers(stream_id, s)]
+            segments.setdefault(stream_id, collections.deque()).extendleft(reversed(released))
+
+
+def _take_oldest(stream_id, protection):
+    """Pop the oldest unprotected segment of a camera, or None. Caller holds state_lock."""
+    queue = segments.get(stream_id)
+    while queue:
+        segment = queue.popleft()
+        if protection.covers(stream_id, segment):
+            held.setdefault(stream_id, []).append(segment)
+            continue
+        _forget(stream_id, segment)
+        return segment
+    return None
+
+
+# -- enforcement ----------------------------------------------------------------
+
+def plan(now=None):
+    """
+    Choose the segments to delete under the current policy and remove them
+    from the tallies. Returns a list of (stream_id, Segment, reason).
+    Only in-memory structures are touched, so the lock is held briefly.
+    """
+    now = now or time.time()
+    protection = Protection()
+    victims = []
+    disk = _disk_usage() if policy["disk_high"] else None
+    with state_lock:
+        _release_held(protection)
+
+        if policy["max_age_days"]:
+            cutoff = now - policy["max_age_days"] * 86400
+            for stream_id, queue in segments.items():
+                while queue and queue[0].end < cutoff:
+                    segment = queue.popleft()
+                    if protection.covers(stream_id, segment):
+                        held.setdefault(stream_id, []).append(segment)
+                    else:
+                        _forget(stream_id, segment)
+                        victims.append((stream_id, segment, "age"))
+
+        for key, limit in policy["camera_max_bytes"].items():
+            stream_id = int(key)
+            if limit and usage.get(stream_id, 0) > limit * policy["quota_high"]:
+                while usage[stream_id] > limit * policy["quota_low"]:
+                    segment = _take_oldest(stream_id, protection)
+                    if segment is None:
+                        break
+                    victims.append((stream_id, segment, "camera_quota"))
+
+        # Global quota and disk space: free the oldest footage across all cameras
+        need, reason = 0, None
+        if policy["max_bytes"] and total_bytes > policy["max_bytes"] * policy["quota_high"]:
+            need, reason = total_bytes - policy["max_bytes"] * policy["quota_low"], "quota"
+        if disk and disk.used > disk.total * policy["disk_high"]:
+            already = sum(s.size for _, s, _ in victims)  # deleting these frees disk too
+            disk_need = disk.used - disk.total * policy["disk_low"] - already
+            if disk_need > need:
+                need, reason = disk_need, "disk"
+        while need > 0:
+            heads = [(queue[0].start, stream_id) for stream_id, queue in segments.items() if queue]
+            if not heads:
+                break
+            stream_id = min(heads)[1]
+            segment = _take_oldest(stream_id, protection)
+            if segment is not None:
+                victims.append((stream_id, segment, reason))
+                need -= segment.size
+    if disk is None:
+        history["disk_shortfall"] = None  # rule disabled (or disk unknown): nothing to report
+    else:
+        _report_shortfall(need if reason == "disk" and need > 0 else None)
+    return victims
+
+
+def _report_shortfall(need):
+    """Log once when the disk rule runs out of deletable footage, and once when it recovers."""
+    if need and not history["disk_shortfall"]:
+        print(f"Retention: disk still over disk_high after deleting all unprotected footage; "
+              f"{need / 1e9:.2f} GB must be freed elsewhere (other data, trigger clips, highlights)")
+    elif not need and history["disk_shortfall"]:
+        print("Retention: disk back under disk_high")
+    history["disk_shortfall"] = need
+
+
+def _delete_file(path):
+    os.remove(path)
+    sidecar = segment_index.index_path(path)
+    if os.path.exists(sidecar):
+        os.remove(sidecar)
+    try:
+        os.rmdir(os.path.dirname(path))  # only succeeds once the day's directory is empty
+    except OSError:
+        pass
+
+
+def delete(victims):
+    """Delete the planned segments in batches. Files that cannot be removed are accounted for again."""
+    for i in range(0, len(victims), DELETE_BATCH):
+        batch = victims[i:i + DELETE_BATCH]
+        gone = []
+        for stream_id, segment, reason in batch:
+            try:
+                _delete_file(segment.path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                # Typically a file still open on Windows; try again next time
+                print(f"Retention could not delete {segment.path}: {e}")
+                with state_lock:
+                    _add(stream_id, segment)
+                continue
+            gone.append(segment.path)
+            DELETED_BYTES.labels(reason).inc(segment.size)
+            history["deleted_files"] += 1
+            history["deleted_bytes"] += segment.size
+        store.delete_segments(gone)
+        time.sleep(BATCH_PAUSE)
+
+
+def enforce(now=None):
+    """Apply the policy once. Returns the number of segments deleted."""
+    victims = plan(now)
+    if victims:
+        print(f"Retention: deleting {len(victims)} segments "
+              f"({sum(s.size for _, s, _ in victims) / 1e9:.2f} GB)")
+        delete(victims)
+    history["last_run"] = time.time()
+    return len(victims)
+
+
+def _load():
+    """Fill the deques from the catalog (no directory walk)."""
+    global _loaded
+    by_camera = collections.defaultdict(list)
+    root = os.path.realpath(rtsp_manager.DEFAULT_SETTINGS["location"])
+    cursor = None
+    while True:
+        page = store.query_segments(cursor=cursor, limit=5000, newest_first=False, count=False)
+        for row in page["segments"]:
+            # Footage cataloged from outside the recordings directory is never deleted
+            if os.path.commonpath([root, os.path.realpath(row["path"])]) != root:
+                continue
+            by_camera[row["stream_id"]].append(
+                Segment(row["start_ts"], row["end_ts"], row["size"] or 0, row["path"]))
+        cursor = page["next"]
+        if cursor is None:
+            break
+    with state_lock:
+        for stream_id, items in by_camera.items():
+            for segment in items:
+                _add(stream_id, segment)
+        known = {s.path for items in by_camera.values() for s in items}
+        for stream_id, segment in _pending:
+            if segment.path not in known:
+                _add(stream_id, segment)
+        _pending.clear()
+        _loaded = True
+
+
+def _run(catalog_sync):
+    if catalog_sync is not None:
+        catalog_sync.join()
+    _load()
+    while True:
+        try:
+            enforce()
+            history["last_error"] = None
+        except Exception as e:
+            history["last_error"] = str(e)
+            print(f"Retention pass failed: {e}")
+        _wake.wait(CHECK_INTERVAL)
+        _wake.clear()
+
+
+def start(catalog_sync=None):
+    """Load the saved policy and start the retention thread (after the catalog sync thread, if given)."""
+    global _thread
+    set_policy(store.get_setting("retention", {}), save=False)
+    if _thread is None or not _thread.is_alive():
+        _thread = threading.Thread(target=_run, args=(catalog_sync,), name="retention", daemon=True)
+        _thread.start()
+
+
+def set_policy(changes, save=True):
+    """
+    Update the policy with the given keys (see DEFAULT_POLICY) and wake the
+    retention thread. Raises ValueError for invalid values.
+    """
+    updated = dict(policy, **{k: v for k, v in changes.items() if k in DEFAULT_POLICY})
+    for key in ("max_bytes", "max_age_days"):
+        if updated[key] is not None and float(updated[key]) <= 0:
+            raise ValueError(f"{key} must be positive (or null to disable it)")
+    updated["camera_max_bytes"] = {str(int(k)): int(v) for k, v in (updated["camera_max_bytes"] or {}).items()
+                                   if v}
+    if updated["disk_high"] is None and updated["disk_low"] is None:
+        pairs = (("quota_high", "quota_low"),)  # disk rule disabled
+    else:
+        pairs = (("quota_high", "quota_low"), ("disk_high", "disk_low"))
+    for high, low in pairs:
+        if updated[high] is None or updated[low] is None:
+            raise ValueError(f"{high} and {low} must both be set")
+        updated[high], updated[low] = float(updated[high]), float(updated[low])
+        if not 0 < updated[low] < updated[high] <= 1:
+            raise ValueError(f"expected 0 < {low} < {high} <= 1")
+    with state_lock:
+        policy.clear()
+        policy.update(updated)
+    if save:
+        store.set_setting("retention", {k: updated[k] for k in DEFAULT_POLICY})
+    _wake.set()
+    return dict(updated)
+
+
+def status():
+    """Return the policy, the running tallies per camera and what has been deleted so far."""
+    disk = _disk_usage()
+    with state_lock:
+        cameras = [{"stream_id": stream_id, "bytes": usage.get(stream_id, 0),
+                    "segments": len(segments.get(stream_id, ())) + len(held.get(stream_id, ())),
+                    "protected": len(held.get(stream_id, ())),
+                    "oldest": min([q[0].start for q in [segments.get(stream_id)] if q] +
+                                  [h[0].start for h in [held.get(stream_id)] if h], default=None)}
+                   for stream_id in sorted(usage)]
+        return {"policy": dict(policy), "loaded": _loaded, "total_bytes": total_bytes, "cameras": cameras,
+                "disk": {"total": disk.total, "used": disk.used, "free": disk.free} if disk else None,
+                **history}
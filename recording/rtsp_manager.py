@@ -1,35 +1,190 @@
 # recording/rtsp_manager.py
 
-import subprocess
 import json
+import csv
+import os
+import glob
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
 
-# Dictionary to keep track of active FFmpeg processes by stream_id
-active_recordings = {}  # { stream_id: subprocess.Popen }
+from recording import process_manager, relay, segment_index, store
+from recording.supervisor import STOP_TIMEOUT, Recorder
 
-def start_recording(stream_id: int, rtsp_uri: str):
+# Path to ffmpeg (point this at a stub to exercise the supervisor)
+FFMPEG = process_manager.FFMPEG
+
+# Dictionary to keep track of supervised FFmpeg recorders by stream_id
+active_recordings = {}  # { stream_id: supervisor.Recorder }
+
+# Dictionary describing where each active recording writes its segments
+recording_sessions = {}  # { stream_id: { "camera_dir", "index_file", "settings", "started", ... } }
+
+# Guards adding and removing entries of both dictionaries, so two concurrent
+# starts (bulk pool, scheduler, motion, PTZ) cannot both claim a camera
+recordings_lock = threading.Lock()
+
+# Defaults used when the Recording Settings tab does not provide a value
+DEFAULT_SETTINGS = {
+    "format": "mp4",
+    "location": "./recordings/",
+    "segmentation": 10,  # minutes
+}
+
+# Segment muxer arguments per recording format
+SEGMENT_FORMATS = {
+    # Fragmented MP4: every fragment is playable even if ffmpeg is killed
+    "mp4": ("mp4", "mp4", ["-segment_format_options", "movflags=+frag_keyframe+empty_moov+default_base_moof"]),
+    "mkv": ("mkv", "matroska", []),
+    "ts": ("ts", "mpegts", []),
+}
+
+# Called as listener(stream_id, segment) whenever a recorder closes a segment
+segment_listeners = []
+
+# Called as listener(stream_id, path, stream_info) once a finished segment has been probed
+index_listeners = []
+
+# Segment file names carry the full wall-clock start so they sort and never collide
+SEGMENT_TIME_FORMAT = "%Y%m%d-%H%M%S"
+
+# Relay buffer for a recorder; large enough to ride out a slow disk (in bytes)
+RECORDER_BUFFER = 32 * 1024 * 1024
+
+# Cameras started or stopped at the same time by bulk_control()
+BULK_WORKERS = 16
+
+process_manager.PROCESSES.labels("recorder").set_function(
+    lambda: sum(1 for r in list(active_recordings.values()) if r.process and r.process.poll() is None))
+
+def resolve_settings(settings=None):
     """
-    Start recording for the given RTSP URI using FFmpeg.
-    The output is saved to "record_stream_<stream_id>.mp4".
-    Returns True if recording started, False otherwise.
+    Merge user supplied recording settings with DEFAULT_SETTINGS.
+    Returns a dictionary with "format", "location" and "segmentation" (minutes).
     """
-    if stream_id in active_recordings:
-        print(f"Stream {stream_id} is already recording.")
-        return False
+    resolved = dict(DEFAULT_SETTINGS)
+    for key, value in (settings or {}).items():
+        if key in resolved and value not in (None, ""):
+            resolved[key] = value
+    fmt = str(resolved["format"]).lower().lstrip(".")
+    resolved["format"] = fmt if fmt in SEGMENT_FORMATS else DEFAULT_SETTINGS["format"]
+    try:
+        resolved["segmentation"] = max(float(resolved["segmentation"]), 1 / 60)
+    except (TypeError, ValueError):
+        resolved["segmentation"] = DEFAULT_SETTINGS["segmentation"]
+    return resolved
+
+def camera_directory(stream_id: int, location: str):
+    """Return the directory holding all footage of one camera."""
+    return os.path.join(location, f"camera_{stream_id}")
 
-    output_file = f"record_stream_{stream_id}.mp4"
-    cmd = [
-        "ffmpeg",
-        "-i", rtsp_uri,
+def ensure_date_directories(camera_dir: str, now=None):
+    """
+    Create today's and tomorrow's dated directories.
+    The segment muxer does not create directories, so the next day's folder
+    must exist before a segment rolls over at midnight.
+    """
+    now = now or datetime.now()
+    for day in (now, now + timedelta(days=1)):
+        os.makedirs(os.path.join(camera_dir, day.strftime("%Y-%m-%d")), exist_ok=True)
+
+def build_record_cmd(stream_id: int, rtsp_uri: str, settings: dict, index_file: str):
+    """
+    Build the FFmpeg command writing clock-aligned segments of the stream into
+    <location>/camera_<id>/<YYYY-MM-DD>/camera_<id>_<YYYYmmdd-HHMMSS>.<ext>
+    and appending every finished segment to a CSV index.
+    """
+    ext, muxer, muxer_options = SEGMENT_FORMATS[settings["format"]]
+    camera_dir = camera_directory(stream_id, settings["location"])
+    pattern = os.path.join(camera_dir, "%Y-%m-%d", f"camera_{stream_id}_{SEGMENT_TIME_FORMAT}.{ext}")
+    cmd = [FFMPEG, "-hide_banner", "-nostdin", "-nostats", "-progress", "pipe:1"]
+    if uses_relay(rtsp_uri):
+        # The shared relay writes the camera's MPEG-TS into stdin
+        cmd += ["-f", "mpegts", "-i", "pipe:0"]
+    else:
+        if rtsp_uri.startswith("rtsp://"):
+            cmd += ["-rtsp_transport", "tcp"]
+        cmd += ["-i", rtsp_uri]
+    cmd += [
         "-c:v", "copy",
         "-c:a", "copy",
-        output_file
+        "-f", "segment",
+        "-segment_time", str(int(settings["segmentation"] * 60)),
+        "-segment_atclocktime", "1",
+        "-reset_timestamps", "1",
+        "-strftime", "1",
+        "-segment_format", muxer,
+        *muxer_options,
+        "-segment_list", index_file,
+        "-segment_list_type", "csv",
+        pattern
     ]
+    return cmd
+
+def uses_relay(rtsp_uri: str):
+    """Return True if recordings of this URI read from the shared relay."""
+    return relay.ENABLED and rtsp_uri.startswith("rtsp://")
+
+def start_recording(stream_id: int, rtsp_uri: str, settings: dict = None):
+    """
+    Start recording for the given RTSP URI using FFmpeg.
+    The stream is split into segments of settings["segmentation"] minutes,
+    aligned to the wall clock, under settings["location"]. A crash loses at
+    most the segment being written.
+    Returns True if recording started, False otherwise.
+    """
+    settings = resolve_settings(settings)
+    camera_dir = camera_directory(stream_id, settings["location"])
+    index_dir = os.path.join(camera_dir, "index")
+    started = datetime.now()
+    session = {
+        "camera_dir": camera_dir,
+        "index_file": None,
+        "settings": settings,
+        "started": started.isoformat(timespec="seconds"),
+        "index_read": (None, 0),  # (CSV index, bytes already consumed)
+        "lock": threading.Lock(),
+    }
+
+    def build_cmd():
+        # Every (re)start gets its own index so FFmpeg never truncates an earlier one
+        now = datetime.now()
+        ensure_date_directories(camera_dir, now)
+        session["index_file"] = os.path.join(index_dir, f"{now.strftime(SEGMENT_TIME_FORMAT)}.csv")
+        return build_record_cmd(stream_id, rtsp_uri, settings, session["index_file"])
+
+    try:
+        os.makedirs(index_dir, exist_ok=True)
+        feed_input = None
+        if uses_relay(rtsp_uri):
+            def feed_input(process):
+                consumer = relay.attach(rtsp_uri, f"recorder-{stream_id}", RECORDER_BUFFER)
+                relay.feed_process(consumer, process)
+        # FFmpeg appends a CSV row whenever a segment is closed
+        recorder = Recorder(stream_id, build_cmd, feed_input=feed_input,
+                            on_progress=lambda r, block: _collect_finished_segments(stream_id, session, r),
+                            on_exit=lambda r, reason: _collect_finished_segments(stream_id, session, r))
+        # Claim the camera before anything is spawned
+        with recordings_lock:
+            if stream_id in active_recordings:
+                print(f"Stream {stream_id} is already recording.")
+                return False
+            active_recordings[stream_id] = recorder
+            recording_sessions[stream_id] = session
+    except Exception as e:
+        print(f"Failed to start recording for stream {stream_id}: {e}")
+        return False
     try:
-        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        active_recordings[stream_id] = process
-        print(f"Started recording stream {stream_id} -> {output_file}")
+        recorder.start()
+        _start_housekeeping()
+        print(f"Started recording stream {stream_id} -> {camera_dir}")
         return True
     except Exception as e:
+        with recordings_lock:
+            if active_recordings.get(stream_id) is recorder:
+                del active_recordings[stream_id]
+                recording_sessions.pop(stream_id, None)
         print(f"Failed to start recording for stream {stream_id}: {e}")
         return False
 
@@ -38,23 +193,237 @@ def stop_recording(stream_id: int):
     Stop recording for the given stream if it is active.
     Returns True if successfully stopped, False otherwise.
     """
-    process = active_recordings.get(stream_id)
-    if not process:
+    recorder = active_recordings.get(stream_id)
+    if not recorder:
         print(f"No active recording found for stream {stream_id}")
         return False
+    recorder.request_stop()
+    return _wait_stopped(stream_id, recorder)
+
+def _wait_stopped(stream_id: int, recorder: Recorder):
     try:
-        process.terminate()
-        process.wait(timeout=5)
-        del active_recordings[stream_id]
+        if not recorder.wait_stopped(STOP_TIMEOUT):
+            raise RuntimeError("recorder did not exit in time")
+        with recordings_lock:
+            if active_recordings.get(stream_id) is recorder:
+                del active_recordings[stream_id]
+                recording_sessions.pop(stream_id, None)
         print(f"Stopped recording for stream {stream_id}")
         return True
     except Exception as e:
         print(f"Failed to stop recording for stream {stream_id}: {e}")
         return False
 
+def bulk_control(action: str, targets: dict, settings: dict = None, workers: int = BULK_WORKERS):
+    """
+    Start, stop or restart the recordings of many cameras concurrently.
+    targets maps stream IDs to RTSP URIs. settings holds recording settings
+    per stream ID (as a string key, like schedule settings) or one set for
+    all; a restart without settings keeps the ones the camera recorded with.
+    Every recorder being stopped gets SIGINT before any exit is awaited, so
+    a whole fleet stops in about the time of its slowest camera.
+    Yields a dictionary per camera as soon as it is done, with "streamId",
+    "action", "ok", "error" and "seconds".
+    """
+    if action not in ("start", "stop", "restart"):
+        raise ValueError(f"Unknown action {action!r}")
+    settings = settings or {}
+    previous = {}
+    stopping = {}
+    if action != "start":
+        for stream_id in targets:
+            recorder = active_recordings.get(stream_id)
+            session = recording_sessions.get(stream_id)
+            if recorder:
+                previous[stream_id] = session["settings"] if session else None
+                recorder.request_stop()
+                stopping[stream_id] = recorder
+
+    def run(stream_id, uri):
+        began = time.monotonic()
+        error = None
+        if stream_id in stopping:
+            if not _wait_stopped(stream_id, stopping[stream_id]):
+                error = "recorder did not exit in time"
+        elif action == "stop":
+            error = "not recording"
+        if action != "stop" and error is None:
+            camera_settings = settings.get(str(stream_id), settings) or previous.get(stream_id)
+            if not start_recording(stream_id, uri, camera_settings):
+                error = "already recording" if stream_id in active_recordings else "could not start"
+        return {"streamId": stream_id, "action": action, "ok": error is None, "error": error,
+                "seconds": round(time.monotonic() - began, 3)}
+
+    if not targets:
+        return
+    with ThreadPoolExecutor(max_workers=min(workers, len(targets)), thread_name_prefix=f"bulk-{action}") as pool:
+        for future in as_completed([pool.submit(run, i, uri) for i, uri in targets.items()]):
+            yield future.result()
+
 def list_active_recordings():
     """
     Return a list of stream IDs that are currently recording.
     """
     return list(active_recordings.keys())
 
+def recording_health():
+    """
+    Return a dictionary of supervisor health reports by stream ID.
+    """
+    health = {}
+    for stream_id, recorder in list(active_recordings.items()):
+        report = recorder.health()
+        session = recording_sessions.get(stream_id, {})
+        report["started"] = session.get("started")
+        report["camera_dir"] = session.get("camera_dir")
+        health[stream_id] = report
+    return health
+
+def segment_start_time(path: str):
+    """
+    Return the wall-clock start of a segment parsed from its file name,
+    or None if the name does not follow the recorder's pattern.
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    try:
+        return datetime.strptime(stem.rsplit("_", 1)[-1], SEGMENT_TIME_FORMAT)
+    except ValueError:
+        return None
+
+def parse_index_row(camera_dir: str, row):
+    """
+    Convert one row of FFmpeg's CSV segment list into a segment dictionary
+    with "path", "start", "end" and "duration" (seconds), or None if the
+    row is incomplete.
+    """
+    if len(row) < 3:
+        return None
+    start = segment_start_time(row[0])
+    if start is None:
+        return None
+    try:
+        duration = float(row[2]) - float(row[1])
+    except ValueError:
+        return None
+    return {
+        "path": os.path.join(camera_dir, start.strftime("%Y-%m-%d"), row[0]),
+        "start": start.isoformat(timespec="seconds"),
+        "end": (start + timedelta(seconds=duration)).isoformat(timespec="seconds"),
+        "duration": duration,
+    }
+
+def list_segments(stream_id: int, location: str = None):
+    """
+    Return the finished segments of a camera, oldest first, as a list of
+    dictionaries with "path", "start", "end" and "duration" (seconds).
+    Segments are read from the per-session CSV indexes written by FFmpeg.
+    """
+    location = location or DEFAULT_SETTINGS["location"]
+    camera_dir = camera_directory(stream_id, location)
+    segments = []
+    for index_file in sorted(glob.glob(os.path.join(camera_dir, "index", "*.csv"))):
+        with open(index_file, newline="") as f:
+            for row in csv.reader(f):
+                segment = parse_index_row(camera_dir, row)
+                if segment:
+                    segments.append(segment)
+    segments.sort(key=lambda s: s["start"])
+    return segments
+
+def _collect_finished_segments(stream_id: int, session: dict, recorder: Recorder = None):
+    """
+    Read the rows FFmpeg appended to the session's CSV index since the last
+    call and hand every newly finished segment to _segment_finished().
+    The recorder, if given, is credited with the size of each segment.
+    """
+    with session["lock"]:
+        index_file = session["index_file"]
+        read_file, position = session["index_read"]
+        if index_file != read_file:
+            position = 0
+        try:
+            with open(index_file, "rb") as f:
+                f.seek(position)
+                data = f.read()
+        except (OSError, TypeError):
+            return
+        complete = data[:data.rfind(b"\n") + 1]  # a row may still be half written
+        session["index_read"] = (index_file, position + len(complete))
+    lines = complete.decode("utf-8", "replace").splitlines()
+    for row in csv.reader(lines):
+        segment = parse_index_row(session["camera_dir"], row)
+        if segment:
+            if recorder is not None:
+                try:
+                    recorder.count_written(os.path.getsize(segment["path"]))
+                except OSError:
+                    pass
+            _segment_finished(stream_id, segment)
+
+def _notify(listeners, *args):
+    for listener in list(listeners):
+        try:
+            listener(*args)
+        except Exception as e:
+            print(f"Error in segment listener {getattr(listener, '__name__', listener)}: {e}")
+
+def _segment_finished(stream_id: int, segment: dict):
+    """Called once for every segment FFmpeg has closed."""
+    _notify(segment_listeners, stream_id, segment)
+    segment_index.submit(segment["path"], datetime.fromisoformat(segment["start"]).timestamp(),
+                         on_indexed=lambda path, info: _notify(index_listeners, stream_id, path, info))
+
+def find_segment(stream_id: int, when: datetime, location: str = None):
+    """
+    Return the cataloged segment of a camera that was being written at the
+    given wall-clock time (start_ts <= when < end_ts), or None if the time
+    falls in a gap or the segment is not under location. This is one index
+    lookup in the segments catalog.
+    """
+    segment = store.segment_at(stream_id, when.timestamp())
+    if segment is None or not os.path.exists(segment["path"]):
+        return None
+    if location:
+        camera_dir = os.path.realpath(camera_directory(stream_id, location))
+        if os.path.commonpath([camera_dir, os.path.realpath(segment["path"])]) != camera_dir:
+            return None
+    return segment
+
+def seek(stream_id: int, when: datetime, location: str = None):
+    """
+    Resolve a wall-clock time to the keyframe to start playback from.
+    Returns a dictionary with "path", "offset" (bytes), "pts" (seconds into
+    the segment) and "keyframe_time", or None if nothing was recorded then.
+    """
+    segment = find_segment(stream_id, when, location)
+    if segment is None:
+        return None
+    path = segment["path"]
+    record = segment_index.lookup(path, segment["start_ts"], when.timestamp())
+    if record is None:
+        return None
+    keyframe_time, offset, pts = record
+    return {
+        "path": path,
+        "offset": offset,
+        "pts": pts,
+        "keyframe_time": datetime.fromtimestamp(keyframe_time).isoformat(timespec="milliseconds"),
+    }
+
+_housekeeping_thread = None
+
+def _housekeeping():
+    """Keep the dated directories of every active recording ahead of midnight."""
+    while active_recordings:
+        for session in list(recording_sessions.values()):
+            try:
+                ensure_date_directories(session["camera_dir"])
+            except OSError as e:
+                print(f"Failed to create segment directories in {session['camera_dir']}: {e}")
+        time.sleep(60)
+
+def _start_housekeeping():
+    global _housekeeping_thread
+    if _housekeeping_thread is None or not _housekeeping_thread.is_alive():
+        _housekeeping_thread = threading.Thread(target=_housekeeping, daemon=True)
+        _housekeeping_thread.start()
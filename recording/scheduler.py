@@ -0,0 +1,248 @@
+# recording/scheduler.py
+
+import heapq
+import itertools
+import threading
+import time
+from datetime import datetime
+
+START = "start"
+STOP = "stop"
+
+
+def parse_time(value):
+    """
+    Convert an ISO 8601 string (e.g. "2025-04-01T10:00" from a
+    datetime-local input) or a number into a POSIX timestamp.
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+
+
+class Scheduler:
+    """
+    Starts and stops recordings at scheduled instants from a single thread.
+
+    Pending start/stop instants live in one heap. Editing or deleting a
+    schedule bumps its version, which invalidates its old heap entries
+    lazily, so every change costs O(log n). A camera covered by several
+    overlapping schedules is started by the first one and stopped by the
+    last one to end. A schedule is dropped once its end instant has fired.
+
+    start_camera(camera_id, schedule) and stop_camera(camera_id, schedule)
+    are called from the scheduler thread. clock defaults to time.time and
+    can be replaced with a fake clock; run_pending() then fires whatever is
+    due without the background thread.
+    """
+
+    def __init__(self, start_camera, stop_camera, clock=time.time, on_fire=None):
+        self.start_camera = start_camera
+        self.stop_camera = stop_camera
+        self.clock = clock
+        self.on_fire = on_fire          # called with (action, schedule, lag seconds)
+        self.schedules = {}             # { schedule_id: schedule dict }
+        self.active = {}                # { camera_id: set(schedule_id) }
+        self.heap = []                  # (when, seq, action, schedule_id, version)
+        self.stale = 0                  # invalidated entries still in the heap
+        self.calls = []                 # camera start/stop calls queued under the lock
+        self.seq = itertools.count()
+        self.cond = threading.Condition()
+        self.thread = None
+        self.running = False
+
+    # -- schedule management -------------------------------------------------
+
+    def add(self, schedule_id, camera_ids, start_time, end_time, **extra):
+        """
+        Add (or replace) a schedule. Times may be ISO strings or timestamps.
+        Returns the stored schedule dictionary.
+        Raises ValueError if the window is empty or has already ended.
+        """
+        start, end = parse_time(start_time), parse_time(end_time)
+        if end <= start:
+            raise ValueError("end_time must be after start_time")
+        with self.cond:
+            now = self.clock()
+            if end <= now:
+                raise ValueError("end_time has already passed")
+            old = self.schedules.get(schedule_id)
+            # A running schedule whose new window still covers "now" keeps its cameras recording
+            handover = old is not None and old["state"] == "running" and start <= now < end
+            if old is not None:
+                self._remove(schedule_id, keep_cameras=camera_ids if handover else ())
+            schedule = dict(extra)
+            schedule.update({
+                "schedule_id": schedule_id,
+                "camera_ids": list(camera_ids),
+                "start_time": start_time,
+                "end_time": end_time,
+                "start": start,
+                "end": end,
+                "version": 0,
+                "state": "pending",
+            })
+            self.schedules[schedule_id] = schedule
+            if handover:
+                self._start_schedule(schedule)
+            else:
+                self._push(start, START, schedule)
+            self._push(end, STOP, schedule)
+            self.cond.notify()
+        self._run_calls()
+        return schedule
+
+    def update(self, schedule_id, camera_ids, start_time, end_time, **extra):
+        """Reschedule an existing schedule; running cameras are handed over."""
+        with self.cond:
+            old = self.schedules.get(schedule_id)
+            if old is None:
+                raise KeyError(schedule_id)
+            merged = {k: v for k, v in old.items()
+                      if k not in ("schedule_id", "camera_ids", "start_time", "end_time",
+                                   "start", "end", "version", "state")}
+        merged.update(extra)
+        return self.add(schedule_id, camera_ids, start_time, end_time, **merged)
+
+    def remove(self, schedule_id):
+        """Delete a schedule, stopping its cameras if it is running. Returns True if it existed."""
+        with self.cond:
+            if schedule_id not in self.schedules:
+                return False
+            self._remove(schedule_id)
+            self.cond.notify()
+        self._run_calls()
+        return True
+
+    def get(self, schedule_id):
+        with self.cond:
+            return self.schedules.get(schedule_id)
+
+    def list_schedules(self):
+        """Return all schedules ordered by start time."""
+        with self.cond:
+            return sorted(self.schedules.values(), key=lambda s: s["start"])
+
+    def next_deadline(self):
+        """Return the timestamp of the next valid start/stop instant, or None."""
+        with self.cond:
+            self._discard_stale_head()
+            return self.heap[0][0] if self.heap else None
+
+    # -- internals (caller holds self.cond) -------------------------------------
+
+    def _push(self, when, action, schedule):
+        heapq.heappush(self.heap, (when, next(self.seq), action, schedule["schedule_id"], schedule["version"]))
+
+    def _remove(self, schedule_id, keep_cameras=()):
+        schedule = self.schedules.pop(schedule_id)
+        schedule["version"] += 1
+        self.stale += 2
+        if schedule["state"] == "running":
+            released = [c for c in schedule["camera_ids"] if c not in keep_cameras]
+            self._stop_schedule(dict(schedule, camera_ids=released))
+            schedule["state"] = "done"
+        # Rebuild once stale entries dominate so the heap stays O(n) in size
+        if self.stale > len(self.heap) // 2:
+            self.heap = [e for e in self.heap if self._is_current(e)]
+            heapq.heapify(self.heap)
+            self.stale = 0
+
+    def _is_current(self, entry):
+        schedule = self.schedules.get(entry[3])
+        return schedule is not None and schedule["version"] == entry[4]
+
+    def _discard_stale_head(self):
+        while self.heap and not self._is_current(self.heap[0]):
+            heapq.heappop(self.heap)
+            self.stale = max(0, self.stale - 1)
+
+    def _start_schedule(self, schedule):
+        schedule["state"] = "running"
+        for camera_id in schedule["camera_ids"]:
+            owners = self.active.setdefault(camera_id, set())
+            if not owners:
+                self._call(self.start_camera, camera_id, schedule)
+            owners.add(schedule["schedule_id"])
+
+    def _stop_schedule(self, schedule):
+        schedule["state"] = "done"
+        for camera_id in schedule["camera_ids"]:
+            owners = self.active.get(camera_id)
+            if not owners or schedule["schedule_id"] not in owners:
+                continue
+            owners.discard(schedule["schedule_id"])
+            if not owners:
+                del self.active[camera_id]
+                self._call(self.stop_camera, camera_id, schedule)
+
+    def _call(self, fn, camera_id, schedule):
+        self.calls.append((fn, camera_id, schedule))
+
+    def _run_calls(self):
+        """Run queued camera calls outside the lock (stopping ffmpeg can take seconds)."""
+        with self.cond:
+            calls, self.calls = self.calls, []
+        for fn, camera_id, schedule in calls:
+            try:
+                fn(camera_id, schedule)
+            except Exception as e:
+                print(f"Scheduler failed to {fn.__name__} for camera {camera_id}: {e}")
+
+    # -- execution -------------------------------------------------------------
+
+    def run_pending(self, now=None):
+        """
+        Fire every start/stop instant that is due.
+        Returns the number of actions fired.
+        """
+        fired = 0
+        with self.cond:
+            now = self.clock() if now is None else now
+            while True:
+                self._discard_stale_head()
+                if not self.heap or self.heap[0][0] > now:
+                    break
+                when, _, action, schedule_id, _ = heapq.heappop(self.heap)
+                schedule = self.schedules[schedule_id]
+                if action == START:
+                    self._start_schedule(schedule)
+                else:
+                    if schedule["state"] == "running":
+                        self._stop_schedule(schedule)
+                    # Its stop calls are queued; nothing refers to it any more
+                    del self.schedules[schedule_id]
+                if self.on_fire:
+                    self.on_fire(action, schedule, now - when)
+                fired += 1
+        self._run_calls()
+        return fired
+
+    def _loop(self):
+        while True:
+            with self.cond:
+                if not self.running:
+                    break
+                deadline = self.next_deadline()
+                timeout = None if deadline is None else max(0.0, deadline - self.clock())
+                if timeout is None or timeout > 0:
+                    self.cond.wait(timeout)
+                    continue
+            self.run_pending()
+
+    def start(self):
+        """Start the scheduler thread."""
+        with self.cond:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop the scheduler thread (running recordings are left alone)."""
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        if self.thread:
+            self.thread.join()
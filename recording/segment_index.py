@@ -0,0 +1,193 @@
+# recording/segment_index.py
+
+import mmap
+import os
+import queue
+import struct
+import threading
+
+from recording import process_manager
+from recording.stream_analyzer import parse_compact_line
+
+# One record per keyframe: wall-clock time (POSIX seconds), byte offset, PTS (seconds)
+RECORD = struct.Struct("<dqd")
+
+# Sidecar file written next to every finished segment
+INDEX_SUFFIX = ".kidx"
+
+# Upper bound on probing one finished segment (in seconds)
+PROBE_TIMEOUT = 60
+
+# Segments waiting for their index to be built
+pending = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def index_path(segment_path):
+    """Return the path of the keyframe index belonging to a segment."""
+    return segment_path + INDEX_SUFFIX
+
+
+def build_probe_cmd(segment_path):
+    """
+    Build the ffprobe command listing the codec and size of the video
+    stream and the PTS, byte position and flags of every video packet of a
+    finished segment (demux only, no decoding).
+    """
+    return [
+        process_manager.FFPROBE, "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "stream=codec_name,width,height:packet=pts_time,pos,flags",
+        "-of", "compact=p=1:nk=0",
+        segment_path
+    ]
+
+
+def probe_keyframes(segment_path, stream_info=None):
+    """
+    Return a list of (pts, offset) tuples for every keyframe of a segment,
+    or None if ffprobe failed. If a stream_info dictionary is given, it is
+    filled with the video stream's "codec", "width" and "height".
+    """
+    keyframes = []
+
+    def on_line(line):
+        section, fields = parse_compact_line(line)
+        if section == "stream" and stream_info is not None:
+            stream_info["codec"] = fields.get("codec_name")
+            for key in ("width", "height"):
+                stream_info[key] = int(fields[key]) if fields.get(key, "").isdigit() else None
+            return
+        if section != "packet" or "K" not in fields.get("flags", ""):
+            return
+        try:
+            keyframes.append((float(fields["pts_time"]), int(fields["pos"])))
+        except (KeyError, ValueError):
+            pass  # pts or pos reported as N/A
+
+    result = process_manager.run(build_probe_cmd(segment_path), key=segment_path,
+                                 timeout=PROBE_TIMEOUT, on_stdout_line=on_line)
+    return keyframes if result.ok else None
+
+
+def write_index(segment_path, start, keyframes):
+    """
+    Write the sidecar index of a segment that started at the given POSIX
+    time. keyframes is a list of (pts, offset) tuples in file order.
+    Returns the index path.
+    """
+    first_pts = keyframes[0][0] if keyframes else 0.0
+    path = index_path(segment_path)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        for pts, offset in keyframes:
+            f.write(RECORD.pack(start + pts - first_pts, offset, pts))
+    os.replace(tmp, path)  # readers never see a half-written index
+    return path
+
+
+def build_index(segment_path, start, stream_info=None):
+    """
+    Probe a finished segment and write its keyframe index (filling
+    stream_info as probe_keyframes() does).
+    Returns the index path, or None if the segment could not be probed.
+    """
+    try:
+        keyframes = probe_keyframes(segment_path, stream_info)
+    except OSError as e:
+        print(f"Failed to index {segment_path}: {e}")
+        return None
+    if keyframes is None:
+        print(f"Failed to index {segment_path}: ffprobe error")
+        return None
+    return write_index(segment_path, start, keyframes)
+
+
+class KeyframeIndex:
+    """
+    Read-only view of a sidecar index, memory-mapped so a lookup only
+    touches the pages its binary search visits.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.count = os.path.getsize(path) // RECORD.size
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.count else None
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        """Return the record (wallclock, offset, pts) at position i."""
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        return RECORD.unpack_from(self.map, i * RECORD.size)
+
+    def find(self, wallclock):
+        """
+        Return the record of the last keyframe at or before wallclock
+        (or the first keyframe if wallclock precedes it), or None if empty.
+        """
+        if not self.count:
+            return None
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if RECORD.unpack_from(self.map, mid * RECORD.size)[0] <= wallclock:
+                lo = mid + 1
+            else:
+                hi = mid
+        return self[max(lo - 1, 0)]
+
+    def close(self):
+        if self.map:
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def lookup(segment_path, start, wallclock):
+    """
+    Return (wallclock, offset, pts) of the keyframe to seek to in a segment
+    that started at POSIX time start, building the index first if the
+    segment predates indexing. Returns None if no keyframe could be found.
+    """
+    path = index_path(segment_path)
+    if not os.path.exists(path) and build_index(segment_path, start) is None:
+        return None
+    with KeyframeIndex(path) as index:
+        return index.find(wallclock)
+
+
+def _run_worker():
+    while True:
+        segment_path, start, on_indexed = pending.get()
+        if not os.path.exists(segment_path):
+            continue
+        stream_info = {}
+        if build_index(segment_path, start, stream_info) and on_indexed is not None:
+            try:
+                on_indexed(segment_path, stream_info)
+            except Exception as e:
+                print(f"Error after indexing {segment_path}: {e}")
+
+
+def submit(segment_path, start, on_indexed=None):
+    """
+    Queue a finished segment (started at POSIX time start) for indexing.
+    on_indexed(segment_path, stream_info) is called from the worker once the
+    index is written, with the codec and size found by the same probe.
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run_worker, name="segment-indexer", daemon=True)
+            _worker.start()
+    pending.put((segment_path, start, on_indexed))
@@ -0,0 +1,219 @@
+# recording/stats_backends.py
+
+import os
+import re
+import shutil
+import statistics
+import threading
+import time
+
+from recording import lazy, process_manager, relay, stream_analyzer
+
+# Backends to try, in order of preference; the first available one that succeeds is used
+PREFERRED = [name.strip() for name in os.environ.get("PTZ_STATS_BACKENDS", "ffprobe,opencv,socket,pcap").split(",")
+             if name.strip()]
+
+# Registered measurement backends by name
+backends = {}  # { name: Backend }
+backends_lock = threading.Lock()
+
+
+class Backend:
+    """
+    One way of measuring a stream. `analyze(source, duration)` returns
+    (summary, error) with the same keys as StreamAnalysis.summary(); fields
+    a backend cannot measure are left out. Nothing heavy is imported until
+    analyze() first runs.
+    """
+
+    def __init__(self, name, analyze, modules=(), binaries=(), privileged=False, check=None, description=""):
+        self.name = name
+        self.analyze = analyze
+        self.modules = tuple(modules)
+        self.binaries = tuple(binaries)
+        self.privileged = privileged
+        self.check = check
+        self.description = description
+
+    def missing(self):
+        """Return the reason the backend cannot run here, or None if it can."""
+        for module in self.modules:
+            if not lazy.available(module):
+                return f"Python package '{module}' is not installed"
+        for binary in self.binaries:
+            if not (os.path.isfile(binary) or shutil.which(binary)):
+                return f"{binary} was not found"
+        if self.privileged and hasattr(os, "geteuid") and os.geteuid() != 0:
+            return "needs root (raw socket capture)"
+        if self.check is not None:
+            return self.check()
+        return None
+
+    def info(self):
+        reason = self.missing()
+        return {"name": self.name, "description": self.description, "available": reason is None,
+                "reason": reason, "preferred": self.name in PREFERRED}
+
+
+def register(name, modules=(), binaries=(), privileged=False, check=None, description=""):
+    """Decorator registering a function as the analyze() of a backend."""
+    def decorator(analyze):
+        with backends_lock:
+            backends[name] = Backend(name, analyze, modules, binaries, privileged, check, description)
+        return analyze
+    return decorator
+
+
+def select(names=None):
+    """Return the available backends among `names` (default: PREFERRED), in order."""
+    with backends_lock:
+        candidates = [backends[n] for n in (names or PREFERRED) if n in backends]
+    return [backend for backend in candidates if backend.missing() is None]
+
+
+def analyze(source, duration=stream_analyzer.DURATION, names=None):
+    """
+    Measure a stream with the first available backend that succeeds.
+    Returns a tuple (summary, error) like stream_analyzer.analyze_stream;
+    summary["backend"] names the backend that produced it.
+    """
+    chosen = select(names)
+    if not chosen:
+        return {}, "No stats backend is available (see /api/stats/backends)"
+    summary, error = {}, None
+    for backend in chosen:
+        try:
+            summary, error = backend.analyze(source, duration)
+        except ImportError as e:
+            summary, error = {}, str(e)
+        summary = dict(summary, backend=backend.name)
+        if error is None:
+            break
+    return summary, error
+
+
+def list_backends():
+    """Return a list of dictionaries describing every registered backend."""
+    with backends_lock:
+        items = list(backends.values())
+    return [backend.info() for backend in items]
+
+
+# -- ffprobe: everything from one demux session ----------------------------------
+
+@register("ffprobe", binaries=(process_manager.FFPROBE,),
+          description="Codec, frame rate, GOP, jitter, drops and bitrate from demuxed packets")
+def _analyze_ffprobe(source, duration):
+    return stream_analyzer.analyze_stream(source, duration)
+
+
+# -- OpenCV: frame arrival times from a decoding capture --------------------------
+
+@register("opencv", modules=("cv2",), description="Resolution, frame rate, frame interval, jitter and drops")
+def _analyze_opencv(source, duration):
+    cv2 = lazy.load("cv2")
+    capture = cv2.VideoCapture(source, cv2.CAP_FFMPEG)
+    if not capture.isOpened():
+        return {}, "OpenCV could not open the stream"
+    arrivals = []
+    failed_reads = 0
+    try:
+        started = time.time()
+        while time.time() - started < duration:
+            ok, _ = capture.read()
+            if ok:
+                arrivals.append(time.time())
+            else:
+                failed_reads += 1
+            # Stop once the mean frame interval is pinned down
+            if ok and arrivals[-1] - arrivals[0] >= stream_analyzer.MIN_DURATION:
+                spread = stream_analyzer.relative_interval([b - a for a, b in zip(arrivals, arrivals[1:])])
+                if spread is not None and spread <= stream_analyzer.BITRATE_TOLERANCE:
+                    break
+        fourcc = int(capture.get(cv2.CAP_PROP_FOURCC))
+        summary = {
+            "codec": "".join(chr((fourcc >> 8 * i) & 0xFF) for i in range(4)).strip().lower() or None,
+            "width": int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)) or None,
+            "height": int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)) or None,
+            "fps": capture.get(cv2.CAP_PROP_FPS) or None,
+            "dropped_frames": failed_reads,
+        }
+    finally:
+        capture.release()
+    if len(arrivals) < 3:
+        return summary, "No frames received"
+    intervals = [b - a for a, b in zip(arrivals, arrivals[1:])]
+    summary["frame_interval_ms"] = statistics.mean(intervals) * 1000
+    summary["jitter_ms"] = statistics.pstdev(intervals) * 1000
+    return summary, None
+
+
+# -- socket counters: bytes arriving through the camera's relay -------------------
+
+# Bitrate sampling period of the socket backend (seconds)
+SOCKET_SLICE = 0.25
+
+def _relay_disabled():
+    return None if relay.ENABLED else "the relay is disabled (PTZ_RELAY=0)"
+
+@register("socket", binaries=(process_manager.FFMPEG,), check=_relay_disabled,
+          description="Bitrate from the bytes received by the relay")
+def _analyze_socket(source, duration):
+    consumer = relay.attach(source, "stats-socket", stream_analyzer.ANALYZER_BUFFER)
+    try:
+        # Wait for the upstream connection before starting the clock
+        chunk = consumer.read(timeout=stream_analyzer.CONNECT_TIMEOUT)
+        if not chunk:
+            return {}, "No data received"
+        total, started = 0, time.time()
+        slices, slice_bytes, slice_start = [], 0, started  # bitrate per SOCKET_SLICE, to stop once it is steady
+        while time.time() - started < duration:
+            chunk = consumer.read(timeout=0.5)
+            if chunk is None:
+                break
+            total += len(chunk)
+            slice_bytes += len(chunk)
+            now = time.time()
+            if now - slice_start >= SOCKET_SLICE:
+                slices.append(slice_bytes * 8 / (now - slice_start))
+                slice_bytes, slice_start = 0, now
+                spread = stream_analyzer.relative_interval(slices)
+                if now - started >= stream_analyzer.MIN_DURATION and spread is not None \
+                        and spread <= stream_analyzer.BITRATE_TOLERANCE:
+                    break
+        elapsed = time.time() - started
+    finally:
+        consumer.close()
+    # MPEG-TS framing adds a few percent over the raw video bitrate
+    return {"bytes": total, "bitrate_bps": total * 8 / elapsed if elapsed > 0 else None}, None
+
+
+# -- packet capture: bytes on the wire, including RTP/RTSP overhead ---------------
+
+def _host_port(uri):
+    match = re.search(r"rtsp://(?:[^@/]*@)?([^:/]+)(?::(\d+))?", uri)
+    return (match.group(1), int(match.group(2) or 554)) if match else (None, None)
+
+@register("pcap", modules=("scapy",), binaries=(process_manager.FFMPEG,), privileged=True,
+          description="Bitrate from captured packets (raw sockets, root only)")
+def _analyze_pcap(source, duration):
+    host, port = _host_port(source)
+    if host is None:
+        return {}, "Packet capture only works on rtsp:// URLs"
+    sniffer = lazy.load("scapy.all")
+    sizes = []
+    # Keep the camera sending while we listen, unless the relay already pulls it
+    reader = None
+    if not (relay.ENABLED and source in relay.relays):
+        reader = process_manager.spawn_until_ready(
+            [process_manager.FFMPEG, "-rtsp_transport", "tcp", "-i", source, "-an", "-f", "null", "-"],
+            "Output #0", timeout=stream_analyzer.CONNECT_TIMEOUT)
+    try:
+        sniffer.sniff(filter=f"host {host} and port {port}", prn=lambda packet: sizes.append(len(packet)),
+                      timeout=duration, store=0)
+    finally:
+        if reader is not None:
+            reader.terminate()
+    if not sizes:
+        return {}, "No packets captured"
+    return {"packets": len(sizes), "bytes": sum(sizes), "bitrate_bps": sum(sizes) * 8 / duration}, None
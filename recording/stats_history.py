@@ -0,0 +1,199 @@
+# recording/stats_history.py
+
+import hashlib
+import os
+import threading
+import time
+
+from recording import lazy
+
+# Only imported when the first sample is stored
+np = lazy.load("numpy", "Stats history")
+
+# Raw analyzer measurements kept per camera
+METRICS = ["fps", "gop_frames", "frame_interval_ms", "jitter_ms", "dropped_frames", "bitrate_bps"]
+
+# Samples arrive once per stats_monitor cycle (the adaptive analysis window, about
+# 2-5 s, plus its refresh interval), so 1 s buckets would mostly stay empty: the
+# finest tier uses buckets about one cycle long instead
+SAMPLE_RESOLUTION = 5
+
+# (resolution in seconds, number of buckets): 5 s for a day, 1 min for a week, 1 h for
+# 90 days. That is 29,520 buckets, about 5.2 MB per camera or 260 MB for 50 cameras
+# (see bytes_per_camera); a week is kept at 1 min min/max/avg
+TIERS = [(SAMPLE_RESOLUTION, 24 * 3600 // SAMPLE_RESOLUTION), (60, 7 * 24 * 60), (3600, 90 * 24)]
+
+# Set PTZ_STATS_DIR to keep the rings in memory-mapped files that survive restarts
+STATS_DIR = os.environ.get("PTZ_STATS_DIR")
+
+# Upper bound on the points returned by one history query per metric
+MAX_POINTS = 2000
+
+# Dictionary of series stores by stream URI
+stores = {}  # { uri: SeriesStore }
+stores_lock = threading.Lock()
+
+
+def _ring(path, shape, dtype, fill):
+    """Allocate one ring array, backed by a .npy file when a path is given."""
+    if path is None:
+        return np.full(shape, fill, dtype)
+    if os.path.exists(path):
+        ring = np.load(path, mmap_mode="r+")
+        if ring.shape == shape and ring.dtype == dtype:
+            return ring
+    ring = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+    ring[...] = fill
+    return ring
+
+
+class Tier:
+    """
+    One resolution of a camera's history: preallocated rings of per-bucket
+    min/max/avg for every metric. A bucket's slot is its index modulo the
+    capacity, and stamps records which bucket currently owns each slot, so
+    old data is overwritten in place without any bookkeeping.
+    """
+
+    def __init__(self, resolution, capacity, directory=None):
+        self.resolution = resolution
+        self.capacity = capacity
+        shape = (len(METRICS), capacity)
+
+        def path(name):
+            return os.path.join(directory, f"{resolution}s-{name}.npy") if directory else None
+
+        self.stamps = _ring(path("stamps"), (capacity,), np.int64, -1)
+        self.mins = _ring(path("min"), shape, np.float64, np.nan)
+        self.maxs = _ring(path("max"), shape, np.float64, np.nan)
+        self.avgs = _ring(path("avg"), shape, np.float64, np.nan)
+        self.counts = _ring(path("count"), shape, np.int32, 0)
+
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.stamps, self.mins, self.maxs, self.avgs, self.counts))
+
+    def add(self, timestamp, values):
+        """Fold one sample (float64 array, NaN for missing metrics) into its bucket."""
+        bucket = int(timestamp // self.resolution)
+        slot = bucket % self.capacity
+        if self.stamps[slot] != bucket:
+            self.stamps[slot] = bucket
+            self.mins[:, slot] = self.maxs[:, slot] = self.avgs[:, slot] = np.nan
+            self.counts[:, slot] = 0
+        present = ~np.isnan(values)
+        counts = self.counts[:, slot] + present
+        self.counts[:, slot] = counts
+        self.mins[:, slot] = np.fmin(self.mins[:, slot], values)
+        self.maxs[:, slot] = np.fmax(self.maxs[:, slot], values)
+        # Running mean: avg += (x - avg) / n, starting from the first value
+        avg = np.where(np.isnan(self.avgs[:, slot]), 0.0, self.avgs[:, slot])
+        self.avgs[:, slot] = np.where(present, avg + (np.nan_to_num(values) - avg) / np.maximum(counts, 1),
+                                      self.avgs[:, slot])
+
+    def covers(self, start, now):
+        return now - start <= self.resolution * self.capacity
+
+    def query(self, start, end, rows):
+        """Return (times, mins, maxs, avgs) of the buckets in [start, end] for the metric rows."""
+        first = max(int(start // self.resolution), int(end // self.resolution) - self.capacity + 1)
+        buckets = np.arange(first, int(end // self.resolution) + 1)
+        slots = buckets % self.capacity
+        valid = self.stamps[slots] == buckets
+        buckets, slots = buckets[valid], slots[valid]
+        return (buckets * self.resolution, self.mins[rows][:, slots],
+                self.maxs[rows][:, slots], self.avgs[rows][:, slots])
+
+
+class SeriesStore:
+    """All tiers of one camera. Every sample is written to every tier."""
+
+    def __init__(self, uri):
+        self.uri = uri
+        directory = None
+        if STATS_DIR:
+            directory = os.path.join(STATS_DIR, hashlib.sha1(uri.encode()).hexdigest()[:16])
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, "uri.txt"), "w", encoding="utf-8") as f:
+                f.write(uri)
+        self.tiers = [Tier(resolution, capacity, directory) for resolution, capacity in TIERS]
+        self.lock = threading.Lock()
+
+    def add(self, timestamp, summary):
+        values = np.array([np.nan if summary.get(m) is None else float(summary[m]) for m in METRICS])
+        with self.lock:
+            for tier in self.tiers:
+                tier.add(timestamp, values)
+
+    def nbytes(self):
+        return sum(tier.nbytes() for tier in self.tiers)
+
+
+def bytes_per_camera():
+    """Return the fixed size of one camera's history (all tiers, all metrics) in bytes."""
+    per_bucket = 8 + len(METRICS) * (3 * 8 + 4)  # stamp + min/max/avg float64 + int32 count
+    return sum(capacity for _, capacity in TIERS) * per_bucket
+
+
+def record(uri, summary, timestamp=None):
+    """Store the numeric fields of an analyzer summary for the URI (skipped without NumPy)."""
+    if not lazy.available("numpy"):
+        return
+    with stores_lock:
+        store = stores.get(uri)
+        if store is None:
+            store = stores[uri] = SeriesStore(uri)
+    store.add(time.time() if timestamp is None else timestamp, summary)
+
+
+def history(uri, start=None, end=None, metrics=None, resolution=None):
+    """
+    Return the history of a camera between two POSIX times (default: the
+    last hour) as numeric arrays:
+    {"resolution": s, "time": [...], "metrics": {name: {"min", "max", "avg"}}}.
+    Without a resolution, the finest tier that holds the whole window in at
+    most MAX_POINTS buckets is used. Returns None if the URI has no history.
+    """
+    with stores_lock:
+        store = stores.get(uri)
+    if store is None:
+        return None
+    now = time.time()
+    end = now if end is None else end
+    start = end - 3600 if start is None else start
+    metrics = [m for m in (metrics or METRICS) if m in METRICS]
+    rows = [METRICS.index(m) for m in metrics]
+
+    tier = store.tiers[-1]
+    for candidate in store.tiers:
+        if resolution is not None:
+            if candidate.resolution >= resolution:
+                tier = candidate
+                break
+        elif candidate.covers(start, now) and (end - start) / candidate.resolution <= MAX_POINTS:
+            tier = candidate
+            break
+
+    with store.lock:
+        times, mins, maxs, avgs = tier.query(start, end, rows)
+
+    def as_list(values):
+        # JSON has no NaN; missing measurements become null
+        return [None if np.isnan(v) else float(v) for v in values]
+
+    return {
+        "uri": uri,
+        "resolution": tier.resolution,
+        "start": start,
+        "end": end,
+        "time": times.astype(float).tolist(),
+        "metrics": {m: {"min": as_list(mins[i]), "max": as_list(maxs[i]), "avg": as_list(avgs[i])}
+                    for i, m in enumerate(metrics)},
+    }
+
+
+def memory_usage():
+    """Return the bytes held by all series stores and the fixed per-camera cost."""
+    with stores_lock:
+        items = list(stores.values())
+    return {"cameras": len(items), "bytes": sum(s.nbytes() for s in items),
+            "bytes_per_camera": bytes_per_camera(), "on_disk": bool(STATS_DIR)}
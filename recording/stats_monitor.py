@@ -0,0 +1,168 @@
+# recording/stats_monitor.py
+
+import threading
+import time
+
+from recording import stats_backends, stats_history, stream_analyzer
+
+# Pause between two analyses of the same stream (in seconds)
+REFRESH_INTERVAL = 1
+
+# Stop a monitor when nobody asked for its stats for this long (in seconds)
+IDLE_TIMEOUT = 30
+
+# A snapshot older than this is reported as stale (in seconds)
+STALE_AFTER = stream_analyzer.MAX_DURATION + stream_analyzer.CONNECT_TIMEOUT + REFRESH_INTERVAL
+
+# Dictionary of running monitors by URI
+monitors = {}  # { uri: StatsMonitor }
+monitors_lock = threading.Lock()
+
+# Notified every time any monitor stores a new snapshot
+snapshot_updated = threading.Condition()
+
+
+class StatsMonitor(threading.Thread):
+    """
+    Background thread that keeps re-analyzing one stream and stores the
+    latest result so requests never wait for a measurement.
+    """
+
+    def __init__(self, uri):
+        super().__init__(name=f"stats-{uri}", daemon=True)
+        self.uri = uri
+        self.refcount = 0
+        self.last_access = time.time()
+        self.summary = None
+        self.stats = None
+        self.error = None
+        self.updated = None
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+
+    def is_idle(self, now=None):
+        """Return True if no subscriber holds the monitor and it was not polled recently."""
+        now = now or time.time()
+        return self.refcount <= 0 and now - self.last_access > IDLE_TIMEOUT
+
+    def run(self):
+        while not self.stop_event.is_set():
+            with monitors_lock:
+                if self.is_idle():
+                    if monitors.get(self.uri) is self:
+                        del monitors[self.uri]
+                    break
+            summary, error = stats_backends.analyze(self.uri)
+            with self.lock:
+                self.summary = summary
+                self.stats = stream_analyzer.format_stats(summary)
+                self.error = error
+                self.updated = time.time()
+            if error is None:
+                # Keep the raw numbers for trend charts
+                stats_history.record(self.uri, summary, self.updated)
+            with snapshot_updated:
+                snapshot_updated.notify_all()
+            self.stop_event.wait(REFRESH_INTERVAL)
+
+    def snapshot(self):
+        """
+        Return the latest stats dictionary with a "meta" entry describing
+        how old the measurement is.
+        """
+        now = time.time()
+        with self.lock:
+            if self.stats is None:
+                stats = stream_analyzer.format_stats({})
+                age = None
+            else:
+                stats = dict(self.stats)
+                age = now - self.updated
+            stats["meta"] = {
+                "updated": self.updated,
+                "age": age,
+                "pending": self.stats is None,
+                "stale": age is None or age > STALE_AFTER,
+                "error": self.error,
+                "subscribers": self.refcount,
+            }
+        return stats
+
+
+def _get_monitor(uri):
+    """Return the running monitor for the URI, starting one if needed. Caller holds monitors_lock."""
+    monitor = monitors.get(uri)
+    if monitor is None or not monitor.is_alive():
+        monitor = StatsMonitor(uri)
+        monitors[uri] = monitor
+        monitor.start()
+    monitor.last_access = time.time()
+    return monitor
+
+
+def get_snapshot(uri):
+    """
+    Return the cached stats for the URI without blocking on a measurement.
+    Polling keeps the monitor alive until IDLE_TIMEOUT passes without a poll.
+    """
+    with monitors_lock:
+        monitor = _get_monitor(uri)
+    return monitor.snapshot()
+
+
+def acquire(uri):
+    """
+    Register a long-lived subscriber for the URI (e.g. a streaming client).
+    Returns the monitor; call release() when the subscriber goes away.
+    """
+    with monitors_lock:
+        monitor = _get_monitor(uri)
+        monitor.refcount += 1
+    return monitor
+
+
+def release(uri):
+    """Drop a subscriber registered with acquire()."""
+    with monitors_lock:
+        monitor = monitors.get(uri)
+        if monitor:
+            monitor.refcount = max(0, monitor.refcount - 1)
+            monitor.last_access = time.time()
+
+
+def wait_for_update(timeout):
+    """Block until any monitor publishes a new snapshot or the timeout expires."""
+    with snapshot_updated:
+        snapshot_updated.wait(timeout)
+
+
+def changed_fields(previous, current):
+    """
+    Return the entries of a snapshot that differ from the previously sent one.
+    The "meta" entry is compared without its ever-changing "age" field.
+    """
+    delta = {}
+    for key, value in current.items():
+        if key == "meta":
+            value = {k: v for k, v in value.items() if k != "age"}
+        if previous.get(key) != value:
+            delta[key] = value
+    return delta
+
+
+def list_monitors():
+    """
+    Return a list of dictionaries describing the running monitors.
+    """
+    with monitors_lock:
+        items = list(monitors.values())
+    return [{"uri": m.uri, "subscribers": m.refcount, "updated": m.updated} for m in items]
+
+
+def stop_all():
+    """Stop every monitor (used on shutdown)."""
+    with monitors_lock:
+        items = list(monitors.values())
+        monitors.clear()
+    for monitor in items:
+        monitor.stop_event.set()
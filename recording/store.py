@@ -0,0 +1,532 @@
+# recording/store.py
+
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from recording.scheduler import parse_time
+
+# Location of the database file (override with PTZ_DB_PATH)
+DB_PATH = os.environ.get("PTZ_DB_PATH", "ptzopticorder.db")
+
+# Example cameras/events inserted into an empty database
+DEFAULT_STREAMS = [
+    {'id': 1, 'name': 'Camera 1', 'uri': 'rtsp://192.168.12.111:554/1'},
+    {'id': 2, 'name': 'Camera 2', 'uri': 'rtsp://192.168.12.243:554/1'},
+    {'id': 3, 'name': 'Camera 3', 'uri': 'rtsp://192.168.12.220:554/1'}
+]
+DEFAULT_EVENTS = [
+    {'id': 1, 'name': 'Event 1', 'start': '2025-04-01T10:00:00', 'end': '2025-04-01T12:00:00'},
+    {'id': 2, 'name': 'Event 2', 'start': '2025-04-02T14:00:00', 'end': '2025-04-02T16:00:00'}
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS streams (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    uri TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    start TEXT NOT NULL,
+    "end" TEXT NOT NULL,
+    start_ts REAL,
+    end_ts REAL,
+    image_url TEXT
+);
+CREATE INDEX IF NOT EXISTS events_time ON events (start_ts, end_ts);
+CREATE TABLE IF NOT EXISTS schedules (
+    schedule_id TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    start_time TEXT NOT NULL,
+    end_time TEXT NOT NULL,
+    start_ts REAL NOT NULL,
+    end_ts REAL NOT NULL,
+    settings TEXT
+);
+CREATE INDEX IF NOT EXISTS schedules_time ON schedules (start_ts, end_ts);
+CREATE INDEX IF NOT EXISTS schedules_end ON schedules (end_ts);
+CREATE TABLE IF NOT EXISTS schedule_cameras (
+    schedule_id TEXT NOT NULL REFERENCES schedules (schedule_id) ON DELETE CASCADE,
+    camera_id INTEGER NOT NULL,
+    PRIMARY KEY (schedule_id, camera_id)
+);
+CREATE INDEX IF NOT EXISTS schedule_cameras_camera ON schedule_cameras (camera_id);
+CREATE TABLE IF NOT EXISTS highlight_jobs (
+    id INTEGER PRIMARY KEY,
+    stream_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    start TEXT NOT NULL,
+    "end" TEXT NOT NULL,
+    path TEXT NOT NULL,
+    state TEXT NOT NULL,
+    error TEXT,
+    segments INTEGER,
+    size INTEGER,
+    created REAL,
+    started REAL,
+    finished REAL
+);
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY,
+    stream_id INTEGER NOT NULL,
+    path TEXT NOT NULL UNIQUE,
+    start_ts REAL NOT NULL,
+    end_ts REAL NOT NULL,
+    duration REAL NOT NULL,
+    size INTEGER,
+    codec TEXT,
+    width INTEGER,
+    height INTEGER
+);
+CREATE INDEX IF NOT EXISTS segments_time ON segments (start_ts, id);
+CREATE INDEX IF NOT EXISTS segments_camera_time ON segments (stream_id, start_ts, id);
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS segment_sources (
+    path TEXT PRIMARY KEY,
+    position INTEGER NOT NULL
+);
+"""
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = set()
+
+
+def connect(path=None):
+    """
+    Return this thread's connection to the database, creating the schema
+    (and the example data) on first use. SQLite connections cannot be shared
+    between threads, so each thread gets its own.
+    """
+    path = path or DB_PATH
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        connections[path] = conn
+        with _init_lock:
+            if path not in _initialized:
+                _create_schema(conn)
+                _initialized.add(path)
+    return conn
+
+
+def _create_schema(conn):
+    with conn:
+        conn.executescript(SCHEMA)
+        if conn.execute("SELECT COUNT(*) FROM streams").fetchone()[0] == 0:
+            conn.executemany("INSERT INTO streams (id, name, uri) VALUES (:id, :name, :uri)", DEFAULT_STREAMS)
+        if conn.execute("SELECT COUNT(*) FROM events").fetchone()[0] == 0:
+            for event in DEFAULT_EVENTS:
+                _insert_event(conn, event)
+
+
+def _timestamp(value):
+    try:
+        return parse_time(value)
+    except (TypeError, ValueError):
+        return None
+
+# -- settings -----------------------------------------------------------------
+
+def get_setting(key, default=None):
+    """Return a JSON setting saved with set_setting(), or default."""
+    row = connect().execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+    return json.loads(row[0]) if row else default
+
+
+def set_setting(key, value):
+    conn = connect()
+    with conn:
+        conn.execute("INSERT INTO settings (key, value) VALUES (?, ?) "
+                     "ON CONFLICT (key) DO UPDATE SET value = excluded.value", (key, json.dumps(value)))
+
+# -- streams ------------------------------------------------------------------
+
+def list_streams():
+    """Return all cameras ordered by ID."""
+    rows = connect().execute("SELECT id, name, uri FROM streams ORDER BY id")
+    return [dict(row) for row in rows]
+
+
+def get_stream(stream_id):
+    """Return one camera by ID, or None."""
+    row = connect().execute("SELECT id, name, uri FROM streams WHERE id = ?", (stream_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def add_stream(name, uri):
+    """Insert a camera and return it with its new ID."""
+    conn = connect()
+    with conn:
+        cursor = conn.execute("INSERT INTO streams (name, uri) VALUES (?, ?)", (name, uri))
+    return get_stream(cursor.lastrowid)
+
+
+def update_stream(stream_id, name, uri):
+    """Update a camera. Returns the updated camera, or None if it does not exist."""
+    conn = connect()
+    with conn:
+        cursor = conn.execute("UPDATE streams SET name = ?, uri = ? WHERE id = ?", (name, uri, stream_id))
+    return get_stream(stream_id) if cursor.rowcount else None
+
+
+def delete_stream(stream_id):
+    """Delete a camera. Returns True if it existed."""
+    conn = connect()
+    with conn:
+        cursor = conn.execute("DELETE FROM streams WHERE id = ?", (stream_id,))
+    return cursor.rowcount > 0
+
+# -- events -------------------------------------------------------------------
+
+EVENT_COLUMNS = 'id, name, start, "end", image_url AS imageUrl'
+
+
+def _insert_event(conn, event):
+    cursor = conn.execute(
+        'INSERT INTO events (id, name, start, "end", start_ts, end_ts, image_url) VALUES (?, ?, ?, ?, ?, ?, ?)',
+        (event.get("id"), event["name"], event["start"], event["end"],
+         _timestamp(event["start"]), _timestamp(event["end"]), event.get("imageUrl") or None))
+    return cursor.lastrowid
+
+
+def list_events():
+    """Return all events ordered by start time."""
+    rows = connect().execute(f"SELECT {EVENT_COLUMNS} FROM events ORDER BY start_ts, id")
+    return [dict(row) for row in rows]
+
+
+# Sort keys accepted by query_events() / iter_events() (ties are broken by ID)
+EVENT_SORTS = {
+    "start": "start_ts",
+    "end": "end_ts",
+    "name": "name COLLATE NOCASE",
+    "duration": "(end_ts - start_ts)",
+}
+
+
+def _event_filter(search):
+    # Case-insensitive substring match on the name and the start/end text
+    if not search:
+        return "", []
+    pattern = "%" + search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    return ("WHERE name LIKE ? ESCAPE '\\' OR start LIKE ? ESCAPE '\\' OR \"end\" LIKE ? ESCAPE '\\'",
+            [pattern] * 3)
+
+
+def _event_order(sort, order):
+    if sort not in EVENT_SORTS:
+        raise ValueError(f"sort must be one of {', '.join(EVENT_SORTS)}")
+    direction = "DESC" if order == "desc" else "ASC"
+    return f"ORDER BY {EVENT_SORTS[sort]} {direction}, id {direction}"
+
+
+def query_events(search=None, sort="start", order="asc", offset=0, limit=100):
+    """
+    Return one page of events matching a search, sorted by "start", "end",
+    "name" or "duration", as {"events": [...], "total": n, "next": offset}.
+    "next" is the offset of the following page, or None on the last page.
+    """
+    where, params = _event_filter(search)
+    conn = connect()
+    total = conn.execute(f"SELECT COUNT(*) FROM events {where}", params).fetchone()[0]
+    rows = conn.execute(f"SELECT {EVENT_COLUMNS} FROM events {where} {_event_order(sort, order)} LIMIT ? OFFSET ?",
+                        params + [limit, offset]).fetchall()
+    return {"events": [dict(row) for row in rows], "total": total,
+            "next": offset + limit if offset + limit < total else None}
+
+
+def iter_events(search=None, sort="start", order="asc", batch=500):
+    """Yield lists of up to batch events matching a search, in order, without loading them all."""
+    where, params = _event_filter(search)
+    cursor = connect().execute(f"SELECT {EVENT_COLUMNS} FROM events {where} {_event_order(sort, order)}", params)
+    try:
+        while True:
+            rows = cursor.fetchmany(batch)
+            if not rows:
+                return
+            yield [dict(row) for row in rows]
+    finally:
+        cursor.close()
+
+
+def add_events(events):
+    """
+    Insert many events in one transaction. Each event is a dictionary with
+    "name", "start", "end" and optionally "imageUrl". Returns the number inserted.
+    """
+    conn = connect()
+    with conn:
+        conn.executemany(
+            'INSERT INTO events (name, start, "end", start_ts, end_ts, image_url) VALUES (?, ?, ?, ?, ?, ?)',
+            [(e["name"], e["start"], e["end"], _timestamp(e["start"]), _timestamp(e["end"]),
+              e.get("imageUrl") or None) for e in events])
+    return len(events)
+
+
+def event_ranges():
+    """Return (start_ts, end_ts) of every event with valid times, ordered by start."""
+    rows = connect().execute("SELECT start_ts, end_ts FROM events "
+                             "WHERE start_ts IS NOT NULL AND end_ts IS NOT NULL ORDER BY start_ts")
+    return [(row[0], row[1]) for row in rows]
+
+
+def get_event(event_id):
+    """Return one event by ID, or None."""
+    row = connect().execute(f"SELECT {EVENT_COLUMNS} FROM events WHERE id = ?", (event_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def add_event(name, start, end, image_url=None):
+    """Insert an event and return it with its new ID."""
+    conn = connect()
+    with conn:
+        event_id = _insert_event(conn, {"name": name, "start": start, "end": end, "imageUrl": image_url})
+    return get_event(event_id)
+
+
+def update_event(event_id, name, start, end, image_url=None):
+    """Update an event (the image is kept unless a new one is given). Returns the event or None."""
+    conn = connect()
+    with conn:
+        cursor = conn.execute(
+            'UPDATE events SET name = ?, start = ?, "end" = ?, start_ts = ?, end_ts = ?, '
+            'image_url = COALESCE(?, image_url) WHERE id = ?',
+            (name, start, end, _timestamp(start), _timestamp(end), image_url or None, event_id))
+    return get_event(event_id) if cursor.rowcount else None
+
+
+def delete_event(event_id):
+    """Delete an event. Returns True if it existed."""
+    conn = connect()
+    with conn:
+        cursor = conn.execute("DELETE FROM events WHERE id = ?", (event_id,))
+    return cursor.rowcount > 0
+
+# -- schedules ----------------------------------------------------------------
+
+def _schedule_rows(where="", params=()):
+    conn = connect()
+    rows = conn.execute(
+        "SELECT s.*, GROUP_CONCAT(c.camera_id) AS cameras FROM schedules s "
+        "LEFT JOIN schedule_cameras c ON c.schedule_id = s.schedule_id "
+        f"{where} GROUP BY s.schedule_id ORDER BY s.start_ts", params)
+    schedules = []
+    for row in rows:
+        schedules.append({
+            "schedule_id": row["schedule_id"],
+            "camera_ids": sorted(int(c) for c in row["cameras"].split(",")) if row["cameras"] else [],
+            "start_time": row["start_time"],
+            "end_time": row["end_time"],
+            "type": row["type"],
+            "settings": json.loads(row["settings"]) if row["settings"] else {},
+        })
+    return schedules
+
+
+def save_schedule(schedule_id, camera_ids, start_time, end_time, type="manual", settings=None):
+    """Insert or replace a scheduled recording."""
+    conn = connect()
+    with conn:
+        conn.execute("DELETE FROM schedules WHERE schedule_id = ?", (schedule_id,))
+        conn.execute(
+            "INSERT INTO schedules (schedule_id, type, start_time, end_time, start_ts, end_ts, settings) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (schedule_id, type, start_time, end_time, parse_time(start_time), parse_time(end_time),
+             json.dumps(settings or {})))
+        conn.executemany("INSERT INTO schedule_cameras (schedule_id, camera_id) VALUES (?, ?)",
+                         [(schedule_id, int(c)) for c in dict.fromkeys(camera_ids)])
+
+
+def delete_schedule(schedule_id):
+    """Delete a scheduled recording. Returns True if it existed."""
+    conn = connect()
+    with conn:
+        cursor = conn.execute("DELETE FROM schedules WHERE schedule_id = ?", (schedule_id,))
+    return cursor.rowcount > 0
+
+
+def get_schedule(schedule_id):
+    """Return one scheduled recording, or None."""
+    found = _schedule_rows("WHERE s.schedule_id = ?", (schedule_id,))
+    return found[0] if found else None
+
+
+def list_schedules(ending_after=None):
+    """Return scheduled recordings ordered by start, optionally only those ending after a time."""
+    if ending_after is None:
+        return _schedule_rows()
+    return _schedule_rows("WHERE s.end_ts > ?", (parse_time(ending_after),))
+
+
+def schedules_overlapping(start, end, camera_id=None):
+    """
+    Return the schedules whose time range overlaps [start, end), optionally
+    limited to one camera. Times may be ISO strings or timestamps.
+    """
+    where = "WHERE s.start_ts < ? AND s.end_ts > ?"
+    params = [parse_time(end), parse_time(start)]
+    if camera_id is not None:
+        where += " AND s.schedule_id IN (SELECT schedule_id FROM schedule_cameras WHERE camera_id = ?)"
+        params.append(camera_id)
+    return _schedule_rows(where, params)
+
+# -- highlights -----------------------------------------------------------------
+
+HIGHLIGHT_JOB_FIELDS = ("id", "stream_id", "name", "start", "end", "path", "state", "error", "segments", "size",
+                        "created", "started", "finished")
+
+
+def save_highlight_job(job):
+    """Insert or update a highlight clip job (keys as in HIGHLIGHT_JOB_FIELDS; others are ignored)."""
+    columns = ", ".join(f'"{field}"' for field in HIGHLIGHT_JOB_FIELDS)
+    updates = ", ".join(f'"{field}" = excluded."{field}"' for field in HIGHLIGHT_JOB_FIELDS[1:])
+    conn = connect()
+    with conn:
+        conn.execute(f"INSERT INTO highlight_jobs ({columns}) VALUES ({', '.join('?' * len(HIGHLIGHT_JOB_FIELDS))}) "
+                     f"ON CONFLICT (id) DO UPDATE SET {updates}",
+                     [job.get(field) for field in HIGHLIGHT_JOB_FIELDS])
+
+
+def list_highlight_jobs():
+    """Return all highlight clip jobs ordered by ID."""
+    rows = connect().execute("SELECT * FROM highlight_jobs ORDER BY id")
+    return [dict(row) for row in rows]
+
+# -- segments -----------------------------------------------------------------
+
+SEGMENT_COLUMNS = "id, stream_id, path, start_ts, end_ts, duration, size, codec, width, height"
+
+
+def _segment(row):
+    segment = dict(row)
+    segment["start"] = datetime.fromtimestamp(row["start_ts"]).isoformat(timespec="seconds")
+    segment["end"] = datetime.fromtimestamp(row["end_ts"]).isoformat(timespec="seconds")
+    return segment
+
+
+def add_segments(segments):
+    """
+    Insert or refresh catalog rows. Each segment is a dictionary with
+    "stream_id", "path", "start_ts", "end_ts", "duration" and optionally
+    "size", "codec", "width", "height" (known values are never erased).
+    """
+    conn = connect()
+    with conn:
+        conn.executemany(
+            "INSERT INTO segments (stream_id, path, start_ts, end_ts, duration, size, codec, width, height) "
+            "VALUES (:stream_id, :path, :start_ts, :end_ts, :duration, :size, :codec, :width, :height) "
+            "ON CONFLICT (path) DO UPDATE SET end_ts = excluded.end_ts, duration = excluded.duration, "
+            "size = COALESCE(excluded.size, size), codec = COALESCE(excluded.codec, codec), "
+            "width = COALESCE(excluded.width, width), height = COALESCE(excluded.height, height)",
+            [dict({"size": None, "codec": None, "width": None, "height": None}, **s) for s in segments])
+
+
+def set_segment_info(path, codec=None, width=None, height=None):
+    """Record the stream properties of a cataloged segment once it has been probed."""
+    conn = connect()
+    with conn:
+        conn.execute("UPDATE segments SET codec = COALESCE(?, codec), width = COALESCE(?, width), "
+                     "height = COALESCE(?, height) WHERE path = ?", (codec, width, height, path))
+
+
+def get_segment(segment_id):
+    """Return one cataloged segment by ID, or None."""
+    row = connect().execute(f"SELECT {SEGMENT_COLUMNS} FROM segments WHERE id = ?", (segment_id,)).fetchone()
+    return _segment(row) if row else None
+
+
+def segment_at(stream_id, ts):
+    """
+    Return the cataloged segment of a camera covering a POSIX time, or None
+    when the camera was not recording then. One seek on the (stream_id,
+    start_ts) index: the latest segment starting at or before ts.
+    """
+    row = connect().execute(
+        f"SELECT {SEGMENT_COLUMNS} FROM segments WHERE stream_id = ? AND start_ts <= ? "
+        "ORDER BY start_ts DESC, id DESC LIMIT 1", (stream_id, ts)).fetchone()
+    return _segment(row) if row and ts < row["end_ts"] else None
+
+
+def delete_segments(paths):
+    """Remove segments (e.g. deleted files) from the catalog. Returns the number removed."""
+    conn = connect()
+    with conn:
+        cursor = conn.executemany("DELETE FROM segments WHERE path = ?", [(p,) for p in paths])
+    return cursor.rowcount
+
+
+def query_segments(stream_ids=None, start=None, end=None, codec=None, cursor=None, limit=100,
+                   newest_first=True, count=True):
+    """
+    Return one page of cataloged segments overlapping [start, end) (POSIX
+    times, either may be None), optionally limited to some cameras and a
+    codec, as {"segments": [...], "total": n, "next": cursor}.
+    Pages are keyed on (start_ts, id) rather than an OFFSET, so fetching a
+    late page costs the same as the first one. "next" is None on the last page.
+    """
+    where, params = [], []
+    if stream_ids:
+        where.append(f"stream_id IN ({','.join('?' * len(stream_ids))})")
+        params += list(stream_ids)
+    if end is not None:
+        where.append("start_ts < ?")
+        params.append(end)
+    if start is not None:
+        where.append("end_ts > ?")
+        params.append(start)
+    if codec:
+        where.append("codec = ?")
+        params.append(codec)
+    filters = ("WHERE " + " AND ".join(where)) if where else ""
+    limit = max(int(limit), 1)  # a page without rows would never reach the end
+    conn = connect()
+    total = conn.execute(f"SELECT COUNT(*) FROM segments {filters}", params).fetchone()[0] if count else None
+
+    page_where, page_params = list(where), list(params)
+    if cursor:
+        cursor_ts, _, cursor_id = str(cursor).partition(":")
+        page_where.append("(start_ts, id) < (?, ?)" if newest_first else "(start_ts, id) > (?, ?)")
+        page_params += [float(cursor_ts), int(cursor_id or 0)]
+    order = "DESC" if newest_first else "ASC"
+    rows = conn.execute(
+        f"SELECT {SEGMENT_COLUMNS} FROM segments "
+        f"{('WHERE ' + ' AND '.join(page_where)) if page_where else ''} "
+        f"ORDER BY start_ts {order}, id {order} LIMIT ?", page_params + [limit + 1]).fetchall()
+    segments = [_segment(row) for row in rows[:limit]]
+    last = rows[limit - 1] if len(rows) > limit else None
+    return {"segments": segments, "total": total,
+            "next": f"{last['start_ts']!r}:{last['id']}" if last is not None else None}
+
+
+def segment_codecs():
+    """Return the distinct codecs in the catalog (for filter menus)."""
+    rows = connect().execute("SELECT DISTINCT codec FROM segments WHERE codec IS NOT NULL ORDER BY codec")
+    return [row[0] for row in rows]
+
+
+def get_source_position(path):
+    """Return how many bytes of a recorder CSV index have already been cataloged."""
+    row = connect().execute("SELECT position FROM segment_sources WHERE path = ?", (path,)).fetchone()
+    return row[0] if row else 0
+
+
+def set_source_position(path, position):
+    conn = connect()
+    with conn:
+        conn.execute("INSERT INTO segment_sources (path, position) VALUES (?, ?) "
+                     "ON CONFLICT (path) DO UPDATE SET position = excluded.position", (path, position))
@@ -0,0 +1,437 @@
+# recording/stream_analyzer.py
+
+import math
+import threading
+import time
+
+from recording import metrics, process_manager, relay
+
+# Resolved once by the process manager (PTZ_FFMPEG_DIR, PATH, C:\ffmpeg\bin)
+FFPROBE = process_manager.FFPROBE
+
+# Default measurement duration (in seconds of stream time); most streams converge sooner
+DURATION = 5
+
+# Shortest window: enough packets for the frame rate, jitter and drops (seconds of stream time)
+MIN_DURATION = 1
+
+# Longest window, used only while a long-GOP stream has not shown MIN_KEYFRAMES yet
+MAX_DURATION = 30
+
+# Keyframes needed for a GOP estimate (two complete GOPs)
+MIN_KEYFRAMES = 3
+
+# Stop once the 95% confidence interval of the bitrate is within this fraction of its mean
+BITRATE_TOLERANCE = 0.1
+
+# Limit on the stream time ffprobe spends detecting the codec before printing packets (microseconds)
+PROBE_ANALYZE_DURATION = 1_000_000
+
+# Extra wall-clock time allowed for connecting before the probe is killed
+CONNECT_TIMEOUT = 10
+
+# Relay buffer for one analysis (in bytes)
+ANALYZER_BUFFER = 4 * 1024 * 1024
+
+# Keys returned to the frontend by /api/rtspStats
+STATS_KEYS = ["Video Codec", "Resolution", "Frame Rate", "GOP Interval",
+              "Latency", "Jitter", "Dropped Frames", "Video Bitrate"]
+
+PHASE_SECONDS = metrics.Histogram("ptz_stats_phase_seconds", "Time spent in each stats phase", ["phase"])
+WINDOW_SECONDS = metrics.Histogram("ptz_stats_window_seconds", "Stream time analyzed per measurement",
+                                   ["outcome"], buckets=(0.5, 1, 2, 3, 5, 10, 20, 30))
+
+# What earlier analyses learned about each source, to size the next window
+estimates = {}  # { source: {"gop_seconds", "gop_frames", "bitrate_bps" (floats or None), "updated"} }
+estimates_lock = threading.Lock()
+
+# Two-sided 95% Student-t quantiles by degrees of freedom; 1.96 (normal) beyond the table
+T_95 = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262,
+        10: 2.228, 12: 2.179, 15: 2.131, 20: 2.086, 25: 2.060, 30: 2.042, 40: 2.021, 60: 2.000, 120: 1.980}
+
+
+def t_quantile(df):
+    """Return the 95% two-sided t quantile for df degrees of freedom (the next smaller tabled df, so never too low)."""
+    tabled = [d for d in T_95 if d <= df]
+    return T_95[max(tabled)] if df <= 120 else 1.96
+
+
+def relative_interval(samples):
+    """
+    Return the half-width of the 95% confidence interval of the mean of
+    samples (Student-t, since a window holds only a few GOPs), as a
+    fraction of the mean. Returns None for fewer than two samples or a
+    zero mean.
+    """
+    n = len(samples)
+    if n < 2:
+        return None
+    mean = sum(samples) / n
+    if mean <= 0:
+        return None
+    variance = sum((x - mean) ** 2 for x in samples) / (n - 1)
+    return t_quantile(n - 1) * math.sqrt(variance / n) / mean
+
+
+def parse_rate(rate):
+    """
+    Parse an ffprobe rational such as "30000/1001" into a float.
+    Returns None if the rate is missing or zero.
+    """
+    try:
+        num, _, den = str(rate).partition("/")
+        value = float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return None
+    return value if value > 0 else None
+
+
+def parse_compact_line(line):
+    """
+    Parse one line of ffprobe "compact" output ("section|key=value|...").
+    Returns a tuple (section, fields) or (None, None) for unrelated lines.
+    """
+    parts = line.rstrip("\r\n").split("|")
+    if len(parts) < 2:
+        return None, None
+    fields = {}
+    for part in parts[1:]:
+        key, sep, value = part.partition("=")
+        if sep:
+            fields[key] = value
+    return parts[0], fields
+
+
+class StreamAnalysis:
+    """
+    Accumulates per-packet statistics for a single video stream.
+    Works on demuxed packets only: no frame is ever decoded.
+    """
+
+    def __init__(self):
+        self.codec = None
+        self.width = None
+        self.height = None
+        self.stream_fps = None
+        self.packet_count = 0
+        self.total_bytes = 0
+        self.keyframe_times = []    # timestamp in seconds of every keyframe
+        self.timestamps = []        # dts (or pts) in seconds per packet
+        self.arrivals = []          # wall-clock arrival (perf_counter) of each packet in timestamps
+        self.sizes = []             # packet size in bytes
+        self.gop_bitrates = []      # bits per second of every complete GOP
+        self.first_ts = None
+        self.last_ts = None
+        self._gop_start = None
+        self._gop_bytes = 0
+
+    def add_stream(self, fields):
+        """Record codec information from an ffprobe "stream" section."""
+        self.codec = fields.get("codec_name") or self.codec
+        self.width = fields.get("width") or self.width
+        self.height = fields.get("height") or self.height
+        fps = parse_rate(fields.get("avg_frame_rate")) or parse_rate(fields.get("r_frame_rate"))
+        if fps:
+            self.stream_fps = fps
+
+    def add_packet(self, fields, arrived=None):
+        """
+        Record one ffprobe "packet" section. arrived is the wall-clock time
+        the line was read (defaults to now).
+        """
+        arrived = time.perf_counter() if arrived is None else arrived
+        ts = fields.get("dts_time")
+        if ts in (None, "", "N/A"):
+            ts = fields.get("pts_time")
+        try:
+            ts = float(ts)
+        except (TypeError, ValueError):
+            ts = None
+        try:
+            size = int(fields.get("size", 0))
+        except ValueError:
+            size = 0
+
+        if "K" in fields.get("flags", "") and ts is not None:
+            self.keyframe_times.append(ts)
+            # Bitrate is sampled per whole GOP: the large keyframe skews any shorter slice
+            if self._gop_start is not None and ts > self._gop_start:
+                self.gop_bitrates.append(self._gop_bytes * 8 / (ts - self._gop_start))
+            self._gop_start, self._gop_bytes = ts, 0
+        self.packet_count += 1
+        self.total_bytes += size
+        self._gop_bytes += size
+        self.sizes.append(size)
+        if ts is not None:
+            self.timestamps.append(ts)
+            self.arrivals.append(arrived)
+            self.first_ts = ts if self.first_ts is None else min(self.first_ts, ts)
+            self.last_ts = ts if self.last_ts is None else max(self.last_ts, ts)
+
+    def elapsed(self):
+        """Return the stream time between the first and the last packet so far (seconds)."""
+        return self.last_ts - self.first_ts if self.first_ts is not None else 0.0
+
+    def converged(self, duration=DURATION, limit=MAX_DURATION, expected=None):
+        """
+        Return True once the window can end: MIN_KEYFRAMES keyframes were
+        seen and the per-GOP bitrate is known within BITRATE_TOLERANCE, or
+        duration has passed with enough keyframes, or limit has passed.
+        With the previous estimates of the source (expected), one complete
+        GOP that matches them is enough. Cheap enough to call after every packet.
+        """
+        elapsed = self.elapsed()
+        if elapsed < MIN_DURATION:
+            return False
+        keys = self.keyframe_times
+        if len(keys) >= MIN_KEYFRAMES:
+            spread = relative_interval(self.gop_bitrates)
+            return (spread is not None and spread <= BITRATE_TOLERANCE) or elapsed >= duration
+        if expected and expected.get("gop_seconds") and expected.get("bitrate_bps") and self.gop_bitrates:
+            fps = self.stream_fps or 30
+            same_gop = abs((keys[-1] - keys[-2]) - expected["gop_seconds"]) <= 1.0 / fps
+            same_rate = abs(self.gop_bitrates[-1] / expected["bitrate_bps"] - 1) <= BITRATE_TOLERANCE
+            if same_gop and same_rate:
+                return True
+        return elapsed >= limit
+
+    def frame_intervals(self):
+        """Return the positive inter-packet timestamp deltas in seconds (camera clock)."""
+        ts = self.timestamps
+        return [b - a for a, b in zip(ts, ts[1:]) if b > a]
+
+    def arrival_intervals(self):
+        """
+        Return the wall-clock intervals between packet arrivals in seconds,
+        which is where network jitter shows. Packets that ffprobe read
+        ahead while probing the stream arrive in one burst, so intervals
+        are only counted once the arrivals have caught up with the live
+        edge: the first packet whose transit time (arrival minus
+        timestamp) is within one frame time of the smallest seen.
+        """
+        if len(self.arrivals) < 3:
+            return []
+        fps = self.fps()
+        frame_time = 1.0 / fps if fps else 0.04
+        transit = [a - t for a, t in zip(self.arrivals, self.timestamps)]
+        floor = min(transit)
+        live = next(i for i, d in enumerate(transit) if d <= floor + frame_time)
+        arrivals = self.arrivals[live:]
+        return [b - a for a, b in zip(arrivals, arrivals[1:])]
+
+    def fps(self):
+        """
+        Return the stream frame rate, preferring the container value and
+        falling back to the median packet interval.
+        """
+        if self.stream_fps:
+            return self.stream_fps
+        intervals = sorted(self.frame_intervals())
+        if not intervals:
+            return None
+        return 1.0 / intervals[len(intervals) // 2]
+
+    def span(self):
+        """Return the stream time covered by the collected packets (seconds)."""
+        if len(self.timestamps) < 2:
+            return 0.0
+        fps = self.fps()
+        frame_time = 1.0 / fps if fps else 0.0
+        return max(self.timestamps) - min(self.timestamps) + frame_time
+
+    def summary(self):
+        """
+        Return the raw numeric measurements as a dictionary.
+        Values that could not be measured are None.
+        """
+        fps = self.fps()
+        intervals = self.frame_intervals()
+        nominal = 1.0 / fps if fps else None
+
+        # Interval and jitter as seen by the receiver; the camera timestamps
+        # are only used to find gaps, since a steady encoder hides network jitter
+        mean_interval = jitter = None
+        dropped = None
+        arrivals = self.arrival_intervals()
+        if arrivals:
+            mean_interval = sum(arrivals) / len(arrivals)
+            jitter = math.sqrt(sum((d - mean_interval) ** 2 for d in arrivals) / len(arrivals))
+        if intervals and nominal:
+            # A gap of more than 1.5 frame times means frames never arrived.
+            dropped = sum(round(d / nominal) - 1 for d in intervals if d > 1.5 * nominal)
+
+        gop = None
+        keys = self.keyframe_times
+        if len(keys) >= 2 and fps:
+            gop = (keys[-1] - keys[0]) / (len(keys) - 1) * fps
+
+        span = self.span()
+        bitrate = self.total_bytes * 8 / span if span > 0 else None
+
+        return {
+            "codec": self.codec,
+            "width": self.width,
+            "height": self.height,
+            "fps": fps,
+            "gop_frames": gop,
+            "keyframes": len(keys),
+            "frame_interval_ms": mean_interval * 1000 if mean_interval is not None else None,
+            "jitter_ms": jitter * 1000 if jitter is not None else None,
+            "dropped_frames": dropped,
+            "bitrate_bps": bitrate,
+            "packets": self.packet_count,
+            "bytes": self.total_bytes,
+            "span": span,
+        }
+
+
+def format_stats(summary):
+    """
+    Convert a raw summary into the display dictionary used by /api/rtspStats.
+    Returns a dictionary containing exactly the keys in STATS_KEYS.
+    """
+    stats = {k: "N/A" for k in STATS_KEYS}
+    if summary.get("codec"):
+        stats["Video Codec"] = summary["codec"]
+    if summary.get("width") and summary.get("height"):
+        stats["Resolution"] = f'{summary["width"]}x{summary["height"]}'
+    if summary.get("fps"):
+        stats["Frame Rate"] = f'{summary["fps"]:.2f} FPS'
+    if summary.get("gop_frames") is not None:
+        stats["GOP Interval"] = f'{int(round(summary["gop_frames"]))} frames'
+    if summary.get("frame_interval_ms") is not None:
+        stats["Latency"] = f'{summary["frame_interval_ms"]:.2f} ms'
+    if summary.get("jitter_ms") is not None:
+        stats["Jitter"] = f'{summary["jitter_ms"]:.2f} ms'
+    if summary.get("dropped_frames") is not None:
+        stats["Dropped Frames"] = summary["dropped_frames"]
+    if summary.get("bitrate_bps") is not None:
+        stats["Video Bitrate"] = f'{summary["bitrate_bps"] / 1_000_000:.2f} Mbps'
+    return stats
+
+
+def build_probe_cmd(source, duration=DURATION, from_relay=False):
+    """
+    Build the ffprobe command that demuxes (without decoding) the first
+    video stream of the source and prints one line per packet, for at
+    most duration seconds. With from_relay, the MPEG-TS is read from stdin instead.
+    """
+    cmd = [FFPROBE, "-v", "error", "-analyzeduration", str(PROBE_ANALYZE_DURATION)]
+    if from_relay:
+        cmd += ["-f", "mpegts"]
+        source = "pipe:0"
+    elif source.startswith("rtsp://"):
+        cmd += ["-rtsp_transport", "tcp"]
+    cmd += [
+        "-select_streams", "v:0",
+        "-show_entries",
+        "stream=codec_name,width,height,avg_frame_rate,r_frame_rate:"
+        "packet=pts_time,dts_time,size,flags",
+        "-of", "compact=p=1:nk=0",
+        "-read_intervals", f"%+{duration}",
+        source
+    ]
+    return cmd
+
+
+def window_limit(source, duration=DURATION):
+    """
+    Return the longest window worth waiting for on this source: long
+    enough for MIN_KEYFRAMES keyframes at the GOP measured last time,
+    MAX_DURATION while the GOP is unknown, and just duration when the
+    previous analysis found no GOP at all.
+    """
+    with estimates_lock:
+        known = estimates.get(source)
+    if known is None:
+        return MAX_DURATION
+    if not known.get("gop_seconds"):
+        return duration
+    # Starting mid-GOP, the third keyframe is up to MIN_KEYFRAMES GOPs away
+    return min(MAX_DURATION, max(duration, known["gop_seconds"] * MIN_KEYFRAMES + MIN_DURATION))
+
+
+def _remember(source, summary, analysis):
+    keys = analysis.keyframe_times
+    gop_seconds = (keys[-1] - keys[0]) / (len(keys) - 1) if len(keys) >= 2 else None
+    with estimates_lock:
+        known = estimates.setdefault(source, {"gop_seconds": None, "gop_frames": None, "bitrate_bps": None})
+        # Whole GOPs give an unbiased bitrate; fall back to the window average
+        bitrates = analysis.gop_bitrates
+        known["bitrate_bps"] = sum(bitrates) / len(bitrates) if bitrates else summary["bitrate_bps"]
+        if gop_seconds:
+            known["gop_seconds"] = gop_seconds
+            known["gop_frames"] = summary["gop_frames"]
+        elif known["gop_frames"] is not None:
+            # Too short a window for a GOP this time: report the last one measured on this source
+            summary["gop_frames"] = known["gop_frames"]
+        else:
+            known["gop_seconds"] = None
+        known["updated"] = time.time()
+
+
+def analyze_stream(source, duration=DURATION):
+    """
+    Analyze a stream through a single demux session. The window ends as
+    soon as the estimates converge (see StreamAnalysis.converged), after
+    duration seconds otherwise, and is stretched up to window_limit() for
+    long-GOP streams that have not shown enough keyframes yet.
+    Returns a tuple (summary, error) where summary is the raw numeric
+    dictionary from StreamAnalysis.summary() and error is None or a string.
+    """
+    analysis = StreamAnalysis()
+    started = time.perf_counter()
+    limit = window_limit(source, duration)
+    with estimates_lock:
+        expected = dict(estimates.get(source) or {})
+
+    def on_line(line):
+        section, fields = parse_compact_line(line)
+        if section == "packet":
+            arrived = time.perf_counter()
+            if analysis.packet_count == 0:
+                PHASE_SECONDS.labels("first_packet").observe(arrived - started)
+            analysis.add_packet(fields, arrived)
+            return analysis.converged(duration, limit, expected)  # True ends the probe
+        elif section == "stream":
+            analysis.add_stream(fields)
+
+    # Share the camera's single upstream connection with the recorder
+    from_relay = relay.ENABLED and source.startswith("rtsp://")
+    consumer = relay.attach(source, "analyzer", ANALYZER_BUFFER) if from_relay else None
+    try:
+        # Live sources can stall; never let a probe outlive its window
+        with PHASE_SECONDS.time("probe"):
+            result = process_manager.run(build_probe_cmd(source, max(duration, limit), from_relay), key=source,
+                                         timeout=max(duration, limit) + CONNECT_TIMEOUT, on_stdout_line=on_line,
+                                         stdin_consumer=consumer)
+    except OSError as e:
+        return analysis.summary(), f"FFprobe failed: {e}"
+
+    if analysis.packet_count == 0:
+        return analysis.summary(), "No packets received"
+    WINDOW_SECONDS.labels("converged" if result.stopped_early else "full").observe(analysis.elapsed())
+    with PHASE_SECONDS.time("summary"):
+        summary = analysis.summary()
+    _remember(source, summary, analysis)
+    return summary, None
+
+
+def collect_stats(source, duration=DURATION):
+    """
+    Run one single-session analysis and return the /api/rtspStats dictionary.
+    """
+    summary, _ = analyze_stream(source, duration)
+    return format_stats(summary)
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+    if len(sys.argv) > 1:
+        test_uri = sys.argv[1]
+    else:
+        test_uri = input("Enter RTSP URL or file: ")
+    start = time.time()
+    print(json.dumps(collect_stats(test_uri), indent=2))
+    print(f"Analyzed in {time.time() - start:.2f} s")
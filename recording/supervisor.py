@@ -0,0 +1,295 @@
+# recording/supervisor.py
+
+import collections
+import os
+import signal
+import subprocess
+import threading
+import time
+
+from recording import metrics
+
+# Restart delays grow from BACKOFF_BASE up to BACKOFF_MAX seconds
+BACKOFF_BASE = 1
+BACKOFF_MAX = 60
+
+# A process that ran this long without trouble resets the backoff (in seconds)
+HEALTHY_AFTER = 30
+
+# Flag a stall (and restart) when output stops growing for this long (in seconds)
+STALL_TIMEOUT = 15
+
+# Time allowed for a graceful stop before the process is killed (in seconds)
+STOP_TIMEOUT = 5
+
+# Number of stderr lines kept for the health report
+STDERR_LINES = 20
+
+# Progress keys reported by "ffmpeg -progress" that are kept as numbers
+PROGRESS_FIELDS = {
+    "frame": int,
+    "fps": float,
+    "total_size": int,
+    "out_time_us": int,
+    "dup_frames": int,
+    "drop_frames": int,
+}
+
+
+def parse_progress_value(key, value):
+    """
+    Convert one "ffmpeg -progress" value to a number where possible.
+    "bitrate" ("1234.5kbits/s") becomes kbit/s and "speed" ("1.01x") a float.
+    Returns None for "N/A" or unparsable values.
+    """
+    value = value.strip()
+    try:
+        if key in PROGRESS_FIELDS:
+            return PROGRESS_FIELDS[key](value)
+        if key == "bitrate":
+            return float(value.replace("kbits/s", ""))
+        if key == "speed":
+            return float(value.rstrip("x"))
+    except ValueError:
+        return None
+    return value
+
+
+def interrupt(process):
+    """
+    Ask ffmpeg to stop the way Ctrl+C does, so it writes the MP4 trailer
+    and closes the current segment. Windows cannot send SIGINT to a child
+    process, so there it gets terminate() instead.
+    """
+    if os.name == "nt":
+        process.terminate()
+    else:
+        process.send_signal(signal.SIGINT)
+
+
+BYTES_WRITTEN = metrics.Counter("ptz_recorder_bytes_written_total", "Bytes written by each recorder", ["recorder"])
+RESTARTS = metrics.Counter("ptz_recorder_restarts_total", "Recorder restarts", ["recorder"])
+STALLS = metrics.Counter("ptz_recorder_stalls_total", "Recorders restarted because output stopped growing",
+                         ["recorder"])
+
+
+class Recorder(threading.Thread):
+    """
+    Supervises one long-running ffmpeg process: drains its output, parses
+    progress, detects stalls and restarts it with exponential backoff.
+    build_cmd is called before every (re)start so each run can get fresh
+    output names. The command must include "-progress pipe:1 -nostats".
+    If feed_input is given, the process gets a stdin pipe and
+    feed_input(process) is called to start writing the input into it.
+    """
+
+    def __init__(self, name, build_cmd, on_start=None, on_exit=None, on_progress=None, feed_input=None):
+        super().__init__(name=f"recorder-{name}", daemon=True)
+        self.recorder_name = name
+        self.build_cmd = build_cmd
+        self.feed_input = feed_input
+        self.on_start = on_start
+        self.on_exit = on_exit
+        self.on_progress = on_progress
+        self.process = None
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.stderr_tail = collections.deque(maxlen=STDERR_LINES)
+        self.progress = {}
+        self.state = "starting"
+        self.restarts = 0
+        self.failures = 0
+        self.stalls = 0
+        self.started_at = None
+        self.last_growth = None
+        self.last_exit_code = None
+        self.next_retry = None
+        self._progress_mark = None
+        self._written = 0  # total_size already counted for the current process
+        self.bytes_written = 0  # bytes of finished output reported through count_written()
+
+    # -- output draining -------------------------------------------------
+
+    def _drain_stderr(self, process):
+        for line in iter(process.stderr.readline, b""):
+            self.stderr_tail.append(line.decode("utf-8", "replace").rstrip())
+
+    def _read_progress(self, process):
+        block = {}
+        for raw in iter(process.stdout.readline, b""):
+            key, sep, value = raw.decode("utf-8", "replace").partition("=")
+            if not sep:
+                continue
+            key = key.strip()
+            if key == "progress":
+                self._commit_progress(block)
+                block = {}
+            else:
+                block[key] = parse_progress_value(key, value)
+
+    def count_written(self, nbytes):
+        """
+        Account for output the owner saw reach the disk, e.g. a closed
+        segment. The segment muxer has no single output file, so its
+        -progress reports total_size=N/A and this is the only byte count.
+        """
+        with self.lock:
+            self.bytes_written += nbytes
+        BYTES_WRITTEN.labels(self.recorder_name).inc(nbytes)
+
+    def _commit_progress(self, block):
+        mark = (block.get("total_size"), block.get("out_time_us"))
+        size = block.get("total_size")
+        if isinstance(size, int) and size > self._written:
+            BYTES_WRITTEN.labels(self.recorder_name).inc(size - self._written)
+            self._written = size
+        with self.lock:
+            self.progress = block
+            if mark != self._progress_mark and any(isinstance(v, int) and v > 0 for v in mark):
+                self._progress_mark = mark
+                self.last_growth = time.time()
+                if self.state == "starting":
+                    self.state = "recording"
+        if self.on_progress:
+            self.on_progress(self, block)
+
+    # -- process lifecycle -------------------------------------------------
+
+    def _spawn(self):
+        cmd = self.build_cmd()
+        stdin = subprocess.PIPE if self.feed_input else subprocess.DEVNULL
+        process = subprocess.Popen(cmd, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if self.feed_input:
+            self.feed_input(process)
+        with self.lock:
+            self.process = process
+            self.started_at = time.time()
+            self.last_growth = self.started_at
+            self._progress_mark = None
+            self._written = 0
+            self.progress = {}
+            self.state = "starting"
+        for target in (self._drain_stderr, self._read_progress):
+            threading.Thread(target=target, args=(process,), daemon=True).start()
+        if self.on_start:
+            self.on_start(self)
+        return process
+
+    def _terminate(self, process, timeout=STOP_TIMEOUT):
+        """Ask ffmpeg to finish its current segment, then kill it if it hangs."""
+        if process.poll() is not None:
+            return process.returncode
+        interrupt(process)
+        try:
+            return process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            return process.wait()
+
+    def _backoff(self):
+        return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** max(0, self.failures - 1))
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                process = self._spawn()
+            except OSError as e:
+                self.stderr_tail.append(f"spawn failed: {e}")
+                process = None
+
+            reason = None
+            while process is not None and not self.stop_event.is_set():
+                code = process.poll()
+                if code is not None:
+                    reason = f"exited with code {code}"
+                    break
+                if time.time() - self.last_growth > STALL_TIMEOUT:
+                    self.stalls += 1
+                    STALLS.labels(self.recorder_name).inc()
+                    reason = "stalled"
+                    self._terminate(process, timeout=1)
+                    break
+                self.stop_event.wait(1)
+
+            if process is not None:
+                self.last_exit_code = self._terminate(process)
+                if self.on_exit:
+                    self.on_exit(self, reason)
+            if self.stop_event.is_set():
+                break
+
+            ran_for = time.time() - (self.started_at or time.time())
+            self.failures = 1 if ran_for > HEALTHY_AFTER else self.failures + 1
+            delay = self._backoff()
+            with self.lock:
+                self.state = "backoff"
+                self.next_retry = time.time() + delay
+            print(f"Recorder {self.recorder_name} {reason or 'failed to start'}; restarting in {delay} s")
+            if self.stop_event.wait(delay):
+                break
+            self.restarts += 1
+            RESTARTS.labels(self.recorder_name).inc()
+            self.next_retry = None
+
+        with self.lock:
+            self.state = "stopped"
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        """
+        Stop supervising and end the ffmpeg process gracefully.
+        Returns True once the supervisor thread has finished.
+        """
+        self.request_stop()
+        return self.wait_stopped(timeout)
+
+    def request_stop(self):
+        """
+        First half of stop(): signal ffmpeg and return at once, so many
+        recorders can be told to stop before waiting for any of them.
+        """
+        self.stop_event.set()
+        process = self.process
+        if process is not None and process.poll() is None:
+            interrupt(process)
+
+    def wait_stopped(self, timeout=STOP_TIMEOUT):
+        """
+        Second half of stop(): wait for ffmpeg to exit (killing it after
+        timeout seconds) and for the supervisor thread to finish.
+        Returns True once the supervisor thread has finished.
+        """
+        deadline = time.monotonic() + timeout
+        process = self.process
+        if process is not None:
+            try:
+                process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        self.join(max(1.0, deadline - time.monotonic()))  # on_exit still collects the last segment
+        return not self.is_alive()
+
+    def health(self):
+        """
+        Return a dictionary describing the recorder's current health.
+        """
+        now = time.time()
+        with self.lock:
+            process = self.process
+            return {
+                "state": self.state,
+                "pid": process.pid if process and process.poll() is None else None,
+                "uptime": now - self.started_at if self.started_at and self.state != "stopped" else None,
+                "seconds_since_growth": now - self.last_growth if self.last_growth else None,
+                "restarts": self.restarts,
+                "stalls": self.stalls,
+                "last_exit_code": self.last_exit_code,
+                "next_retry_in": max(0.0, self.next_retry - now) if self.next_retry else None,
+                "frame": self.progress.get("frame"),
+                "fps": self.progress.get("fps"),
+                "total_size": self.progress.get("total_size") or self.bytes_written or None,
+                "bitrate_kbps": self.progress.get("bitrate"),
+                "speed": self.progress.get("speed"),
+                "drop_frames": self.progress.get("drop_frames"),
+                "stderr": list(self.stderr_tail)[-5:],
+            }
@@ -16,9 +16,25 @@ document.addEventListener('DOMContentLoaded', () => {
     segmentation: 10
   };
 
+  // Keep the global settings in sync with the Recording Settings tab
+  const globalFormatEl = document.getElementById('global-format');
+  const globalLocationEl = document.getElementById('global-location-text');
+  const globalSegmentEl = document.getElementById('global-segment');
+  if (globalFormatEl) {
+    globalFormatEl.addEventListener('change', () => { globalSettings.format = globalFormatEl.value; });
+  }
+  if (globalLocationEl) {
+    globalLocationEl.addEventListener('input', () => { globalSettings.location = globalLocationEl.value; });
+  }
+  if (globalSegmentEl) {
+    globalSegmentEl.addEventListener('input', () => {
+      const minutes = parseFloat(globalSegmentEl.value);
+      if (!isNaN(minutes) && minutes > 0) globalSettings.segmentation = minutes;
+    });
+  }
+
   // Initialize the camera module with global settings and load the camera list
   camera.init(globalSettings);
-  camera.loadStreams();
 
   // If events.js is loaded, initialize events if needed
   if (window.loadEvents) {
@@ -52,7 +68,13 @@ document.addEventListener('DOMContentLoaded', () => {
     });
   };
 
-  loadCameras();
+  camera.fetchStreams().then(() => {
+    camera.loadStreams();
+    loadCameras();
+    highlights.init();
+    videos.init();
+    triggers.init();
+  });
   window.loadEvents(); // Assuming the window.loadEvents() already loads the event options
 
   // Show/hide scheduling forms based on selected mode
@@ -103,10 +125,50 @@ document.addEventListener('DOMContentLoaded', () => {
           <button onclick="editScheduledRecording('${scheduleId}')">Modify</button>
         `;
         scheduledRecordingsList.appendChild(li);
+      }
+    });
 
-        // You can also add a fetch call here to submit the schedule to the backend
-        // fetch('/api/start_recording', { ... });
+    // The backend scheduler starts and stops the recordings at these times
+    const streamIds = selectedStreamIds.map(id => parseInt(id));
+    const settings = {};
+    streamIds.forEach(id => { settings[id] = camera.getEffectiveSettings(id); });
+    fetch('/api/start_recording', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ streamIds, startTime: scheduleTime, endTime: endTime, settings })
+    })
+      .then(res => res.json())
+      .then(data => { if (data.error) alert(`Error: ${data.error}`); })
+      .catch(err => console.error(err));
+  });
+
+  // Start/stop/restart the selected streams now, listing each camera as it completes
+  document.querySelectorAll('.bulk-action').forEach(button => {
+    button.addEventListener('click', () => {
+      const action = button.dataset.action;
+      const streamIds = Array.from(selectStream.selectedOptions).map(option => parseInt(option.value));
+      if (streamIds.length === 0) {
+        alert('Please select at least one stream.');
+        return;
       }
+      const settings = {};
+      if (action === 'start') streamIds.forEach(id => { settings[id] = camera.getEffectiveSettings(id); });
+      const results = document.getElementById('bulk-results');
+      results.innerHTML = '';
+      recording.bulk(action, streamIds, result => {
+        const stream = camera.getStreams().find(s => s.id === result.streamId);
+        const li = document.createElement('li');
+        li.textContent = `${stream ? stream.name : `Camera ${result.streamId}`}: ` +
+                         `${result.ok ? `${action} done` : result.error} (${result.seconds} s)`;
+        results.appendChild(li);
+      }, action === 'start' ? settings : undefined)
+        .then(summary => {
+          if (!summary) return;
+          const li = document.createElement('li');
+          li.innerHTML = `<strong>${summary.ok} ok, ${summary.failed} failed in ${summary.seconds} s</strong>`;
+          results.appendChild(li);
+        })
+        .catch(err => alert(`Error: ${err.message}`));
     });
   });
 
@@ -124,7 +186,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
     selectedOptions.forEach(opt => {
       const evtId = parseInt(opt.value);
-      const evtObj = window.events.find(e => e.id === evtId);
+      const evtObj = window.scheduleEvents[evtId];
       if (evtObj) {
         // Add a new scheduled item to the list
         const li = document.createElement('li');
@@ -136,8 +198,17 @@ document.addEventListener('DOMContentLoaded', () => {
         `;
         scheduledRecordingsList.appendChild(li);
 
-        // You can also submit this schedule to the backend
-        // fetch('/api/schedule_event', { ... });
+        const cameraIds = selectedCameraIds.map(id => parseInt(id));
+        const settings = {};
+        cameraIds.forEach(id => { settings[id] = camera.getEffectiveSettings(id); });
+        fetch('/api/schedule_event', {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify({ eventId: evtObj.id, cameraIds, settings })
+        })
+          .then(res => res.json())
+          .then(data => { if (data.error) alert(`Error: ${data.error}`); })
+          .catch(err => console.error(err));
       }
     });
   });
@@ -149,8 +220,12 @@ document.addEventListener('DOMContentLoaded', () => {
     );
     if (itemToRemove) itemToRemove.remove();
 
-    // Send delete request to backend if needed
-    // fetch('/api/delete_recording', { ... });
+    // Deleting a running schedule stops its recordings
+    fetch('/api/delete_recording', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ scheduleId })
+    }).catch(err => console.error(err));
   };
 
   // Edit scheduled recording
@@ -1,13 +1,11 @@
 window.camera = (function() {
-  // Module-scoped data
-  let streams = [
-    { id: 1, name: 'Camera 1', uri: 'rtsp://192.168.12.111:554/1' },
-    { id: 2, name: 'Camera 2', uri: 'rtsp://192.168.12.9:554/1' }
-  ];
+  // Module-scoped data (cameras are loaded from /api/streams)
+  let streams = [];
   let cameraSettings = {};      // { streamId: { useGlobal, format, location, segmentation } }
   let previewIntervals = {};    // For live preview intervals
-  let statsIntervals = {};      // For periodic stats updates
+  let statsSubscriptions = {};  // { streamId: unsubscribe function } for pushed stats
   let pausedPreviews = {};      // { streamId: boolean }
+  let previewEtags = {};        // { streamId: ETag of the image shown }
   let statsFetching = {};       // Object to track stats fetching per stream
   let globalSettings = null;    // Set by app.js
 
@@ -26,9 +24,8 @@ window.camera = (function() {
     }
   }
 
-  // Update the live preview image for a camera.
-  // (This function is unchanged from before.)
-  function updateLivePreview(streamId, ip) {
+  // Update the live preview image for a camera from the server's keyframe cache.
+  function updateLivePreview(streamId) {
     if (pausedPreviews[streamId]) return;
     const previewDiv = document.getElementById(`preview-${streamId}`);
     if (!previewDiv) return;
@@ -40,13 +37,19 @@ window.camera = (function() {
       previewDiv.innerHTML = '';
       previewDiv.appendChild(imgEl);
     }
-    const snapshotUrl = `http://${ip}/snapshot.jpg`;
-    fetch(snapshotUrl, { method: 'GET', cache: 'no-store' })
+    // 'no-cache' revalidates with If-None-Match, so an unchanged frame costs a 304
+    fetch(`/api/preview/${streamId}`, { method: 'GET', cache: 'no-cache' })
       .then(res => {
+        if (res.status === 503) return null; // first keyframe not decoded yet
         if (!res.ok) throw new Error(`Failed: ${res.status}`);
+        const etag = res.headers.get('ETag');
+        if (etag && etag === previewEtags[streamId]) return null;
+        previewEtags[streamId] = etag;
         return res.blob();
       })
       .then(blob => {
+        if (!blob) return;
+        if (imgEl.src.startsWith('blob:')) URL.revokeObjectURL(imgEl.src);
         const objectURL = URL.createObjectURL(blob);
         imgEl.src = objectURL;
       })
@@ -89,10 +92,18 @@ window.camera = (function() {
         <div class="stat-row"><span class="stat-key">Jitter:</span><span class="stat-value">${stats["Jitter"] || "N/A"}</span></div>
         <div class="stat-row"><span class="stat-key">Dropped Frames:</span><span class="stat-value">${stats["Dropped Frames"] || "N/A"}</span></div>
         <div class="stat-row"><span class="stat-key">Video Bitrate:</span><span class="stat-value">${stats["Video Bitrate"] || "N/A"}</span></div>
+        ${renderStatsAge(stats.meta)}
       </div>
     `;
   }
 
+  // Show how old the server-side snapshot is (and flag it when stale).
+  function renderStatsAge(meta) {
+    if (!meta || meta.age === null || meta.age === undefined) return '';
+    const label = meta.stale ? ' (stale)' : '';
+    return `<div class="stat-row"><span class="stat-key">Updated:</span><span class="stat-value">${meta.age.toFixed(1)} s ago${label}</span></div>`;
+  }
+
   /**********************************
    * Public Methods for Camera Module
    **********************************/
@@ -111,23 +122,30 @@ window.camera = (function() {
         const nameVal  = cameraNameField.value.trim();
         const uriVal   = cameraUriField.value.trim();
         if (!nameVal || !uriVal) return;
-        if (hiddenId) {
-          // Edit mode
-          const camId = parseInt(hiddenId, 10);
-          const existing = streams.find(s => s.id === camId);
-          if (existing) {
-            existing.name = nameVal;
-            existing.uri  = uriVal;
-          }
-          cameraIdField.value = '';
-          cameraFormBtn.textContent = 'Add Camera';
-        } else {
-          const newId = streams.length ? Math.max(...streams.map(s => s.id)) + 1 : 1;
-          streams.push({ id: newId, name: nameVal, uri: uriVal });
-        }
-        cameraNameField.value = '';
-        cameraUriField.value  = '';
-        loadStreams();
+        const camId = hiddenId ? parseInt(hiddenId, 10) : null;
+        // Edit mode updates the existing camera, otherwise the server assigns a new ID
+        fetch(camId ? `/api/streams/${camId}` : '/api/streams', {
+          method: camId ? 'PUT' : 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify({ name: nameVal, uri: uriVal })
+        })
+          .then(res => res.json())
+          .then(saved => {
+            if (saved.error) throw new Error(saved.error);
+            const existing = streams.find(s => s.id === saved.id);
+            if (existing) {
+              existing.name = saved.name;
+              existing.uri  = saved.uri;
+            } else {
+              streams.push(saved);
+            }
+            cameraIdField.value = '';
+            cameraFormBtn.textContent = 'Add Camera';
+            cameraNameField.value = '';
+            cameraUriField.value  = '';
+            loadStreams();
+          })
+          .catch(err => alert(`Error saving camera: ${err.message}`));
       });
     }
   }
@@ -136,10 +154,38 @@ window.camera = (function() {
     return streams;
   }
 
+  // Load the camera list from the server
+  function fetchStreams() {
+    return fetch('/api/streams')
+      .then(res => res.json())
+      .then(data => { streams = data; return streams; })
+      .catch(err => {
+        console.error('Error loading cameras:', err);
+        return streams;
+      });
+  }
+
   function getCameraSettings() {
     return cameraSettings;
   }
 
+  // Settings the recorder should use for a camera (global unless overridden)
+  function getEffectiveSettings(streamId) {
+    const settings = cameraSettings[streamId];
+    if (!settings || settings.useGlobal) {
+      return {
+        format: globalSettings.format,
+        location: globalSettings.location,
+        segmentation: globalSettings.segmentation
+      };
+    }
+    return {
+      format: settings.format,
+      location: settings.location,
+      segmentation: settings.segmentation
+    };
+  }
+
   // Build (or rebuild) the camera list UI
   function loadStreams() {
     const streamList = document.getElementById('camera-list');
@@ -161,7 +207,8 @@ window.camera = (function() {
     cameraSettingsList.innerHTML = '';
 
     Object.keys(previewIntervals).forEach(id => clearInterval(previewIntervals[id]));
-    Object.keys(statsIntervals).forEach(id => clearInterval(statsIntervals[id]));
+    previewEtags = {};
+    Object.keys(statsSubscriptions).forEach(id => stopStats(id));
 
     streams.forEach(stream => {
       // Create a list item (3-column grid)
@@ -190,6 +237,7 @@ window.camera = (function() {
           <button onclick="camera.editCamera(${stream.id})">Edit</button>
           <button onclick="camera.removeStream(${stream.id})">Remove</button>
           <button onclick="camera.toggleStats(${stream.id})">Stats</button> <!-- Stats button to toggle visibility -->
+          <button onclick="liveView.open(${stream.id})">Enlarge</button> <!-- Low-latency live view -->
         </div>
       `;
       listItem.innerHTML = leftCol + midCol + rightCol;
@@ -299,7 +347,7 @@ window.camera = (function() {
       const ip = getCameraIPFromUri(stream.uri);
       if (ip) {
         const intervalId = setInterval(() => {
-          updateLivePreview(stream.id, ip);
+          updateLivePreview(stream.id);
         }, 1000);
         previewIntervals[stream.id] = intervalId;
       } else {
@@ -315,11 +363,11 @@ window.camera = (function() {
   function togglePreview(streamId) {
     if (pausedPreviews[streamId]) {
       pausedPreviews[streamId] = false;
+      delete previewEtags[streamId];  // the new <img> must be filled even if the frame is unchanged
       const stream = streams.find(s => s.id === streamId);
       if (!stream) return;
-      const ip = getCameraIPFromUri(stream.uri);
       const intervalId = setInterval(() => {
-        updateLivePreview(streamId, ip);
+        updateLivePreview(streamId);
       }, 1000);
       previewIntervals[streamId] = intervalId;
       const previewDiv = document.getElementById(`preview-${streamId}`);
@@ -342,8 +390,13 @@ window.camera = (function() {
   }
 
   function removeStream(streamId) {
-    streams = streams.filter(s => s.id !== streamId);
-    loadStreams();
+    fetch(`/api/streams/${streamId}`, { method: 'DELETE' })
+      .then(res => {
+        if (!res.ok) throw new Error(`Failed: ${res.status}`);
+        streams = streams.filter(s => s.id !== streamId);
+        loadStreams();
+      })
+      .catch(err => alert(`Error removing camera: ${err.message}`));
   }
 
   function editCamera(streamId) {
@@ -365,27 +418,19 @@ window.camera = (function() {
     renderStatsPlaceholder(streamId);
     const stream = streams.find(s => s.id === streamId);
     if (!stream) return;
-    // Start periodic stats updates
-    const intervalId = setInterval(async () => {
-      // Only fetch stats if the stats container is visible
-      if (window.getComputedStyle(statsContainer).display !== 'block') return;
-      try {
-        const stats = await rtspManager.getStats(stream.uri);
-        if (stats) {
-          renderStats(streamId, stats);
-        }
-      } catch (error) {
-        console.error(`Error fetching stats for stream ${streamId}:`, error);
-        statsContainer.innerHTML = `<div class="stat-error">Error fetching stats</div>`;
-      }
-    }, 2000);
-    statsIntervals[streamId] = intervalId;
+    stopStats(streamId);
+    // The server pushes changed fields over one shared stream
+    statsSubscriptions[streamId] = rtspManager.subscribe(stream.uri, (stats) => {
+      // Keep the placeholders until the server has a first measurement
+      if (stats.meta && stats.meta.pending) return;
+      renderStats(streamId, stats);
+    });
   }
 
   function stopStats(streamId) {
-    if (statsIntervals[streamId]) {
-      clearInterval(statsIntervals[streamId]);
-      delete statsIntervals[streamId];
+    if (statsSubscriptions[streamId]) {
+      statsSubscriptions[streamId]();
+      delete statsSubscriptions[streamId];
     }
   }
 
@@ -413,6 +458,8 @@ window.camera = (function() {
     removeStream,
     editCamera,
     getStreams,
-    getCameraSettings
+    fetchStreams,
+    getCameraSettings,
+    getEffectiveSettings
   };
 })();
@@ -1,8 +1,11 @@
 // events.js
 
 // We'll attach everything to 'window' so 'app.js' or other scripts can reference it.
-window.events = [];      // The main array of event objects: {id, name, start, end, imageUrl?}
-window.nextEventId = 1; // Auto-increment ID for new events
+window.events = [];      // Events loaded so far (pages of /api/events): {id, name, start, end, imageUrl?}
+let eventsNextOffset = null; // Offset of the next page, null once everything matching is loaded
+let eventsSearchTimer = null;
+window.scheduleEvents = {}; // Events offered by #select-events, by id (independent of the list above)
+let scheduleSearchTimer = null;
 
 // We'll store references to the new UI elements so we can do searching/sorting and date/time display
 let eventsSearchEl      = null;
@@ -20,25 +23,44 @@ function initEvents() {
   eventsSortOrderEl = document.getElementById('events-sort-order');
   eventsTitleEl     = document.getElementById('events-title'); // The <h3 id="events-title">Scheduled Events</h3>
 
-  // Listen for changes
+  // Listen for changes; the server searches and sorts, so wait for a pause in typing
   if (eventsSearchEl) {
     eventsSearchEl.addEventListener('input', () => {
-      loadEvents();
+      clearTimeout(eventsSearchTimer);
+      eventsSearchTimer = setTimeout(() => window.fetchEvents(), 250);
     });
   }
   if (eventsSortFieldEl && eventsSortOrderEl) {
-    eventsSortFieldEl.addEventListener('change', () => loadEvents());
-    eventsSortOrderEl.addEventListener('change', () => loadEvents());
+    eventsSortFieldEl.addEventListener('change', () => window.fetchEvents());
+    eventsSortOrderEl.addEventListener('change', () => window.fetchEvents());
   }
+  const moreBtn = document.getElementById('events-more');
+  if (moreBtn) moreBtn.addEventListener('click', () => window.fetchEvents(true));
+
+  // The scheduling tab searches the events on its own
+  const scheduleSearchEl = document.getElementById('select-events-search');
+  if (scheduleSearchEl) {
+    scheduleSearchEl.addEventListener('input', () => {
+      clearTimeout(scheduleSearchTimer);
+      scheduleSearchTimer = setTimeout(() => window.fetchScheduleEvents(), 250);
+    });
+  }
+}
+
+/** Search and sort of the event list as query parameters (also used by the exports) */
+function eventsQuery() {
+  const params = new URLSearchParams();
+  const search = eventsSearchEl ? eventsSearchEl.value.trim() : '';
+  if (search) params.set('search', search);
+  if (eventsSortFieldEl) params.set('sort', eventsSortFieldEl.value);
+  if (eventsSortOrderEl) params.set('order', eventsSortOrderEl.value);
+  return params;
 }
 
 /**
  * loadEvents():
  * 1) Displays current date/time in #events-title
- * 2) Filters by search
- * 3) Sorts by chosen field+order
- * 4) Updates the #events-list
- * 5) Also updates #select-events (for scheduling)
+ * 2) Updates the #events-list with the events loaded so far (already searched and sorted by the server)
  */
 window.loadEvents = function() {
   const eventsList = document.getElementById('events-list');
@@ -51,80 +73,59 @@ window.loadEvents = function() {
     eventsTitleEl.textContent = `Scheduled Events (${nowStr})`;
   }
 
-  // 2) Filter by search query
-  const query = eventsSearchEl ? eventsSearchEl.value.trim().toLowerCase() : '';
-  let filtered = window.events;
-  if (query) {
-    filtered = window.events.filter(evt => {
-      // Match name, start, or end ignoring case
-      const nameMatch  = evt.name.toLowerCase().includes(query);
-      const startMatch = evt.start.toLowerCase().includes(query);
-      const endMatch   = evt.end.toLowerCase().includes(query);
-      return (nameMatch || startMatch || endMatch);
-    });
-  }
-
-  // 3) Sort by chosen field & order
-  let sortField = 'start'; // default
-  let sortOrder = 'asc';   // default
-  if (eventsSortFieldEl && eventsSortOrderEl) {
-    sortField = eventsSortFieldEl.value; 
-    sortOrder = eventsSortOrderEl.value; 
-  }
-  filtered.sort((a,b) => eventCompare(a,b, sortField, sortOrder));
-
-  // 4) Clear & rebuild #events-list
+  // 2) Clear & rebuild #events-list
   eventsList.innerHTML = '';
-  filtered.forEach(evt => {
+  window.events.forEach(evt => {
     const li = document.createElement('li');
     li.innerHTML = renderEventItem(evt);
     eventsList.appendChild(li);
   });
+  const moreBtn = document.getElementById('events-more');
+  if (moreBtn) moreBtn.style.display = eventsNextOffset === null ? 'none' : 'inline';
+};
 
-  // 5) Update scheduling's <select> (#select-events)
+/**
+ * Fill scheduling's <select> (#select-events) from its own query: every event
+ * matching #select-events-search, soonest first, whatever the events tab shows.
+ * Selected events stay selected while the search changes.
+ */
+window.fetchScheduleEvents = function() {
   const selectEvents = document.getElementById('select-events');
-  if (selectEvents) {
-    selectEvents.innerHTML = '';
-    filtered.forEach(evt => {
-      const opt = document.createElement('option');
-      opt.value = evt.id;
-      opt.textContent = `${evt.name} (Start: ${evt.start}, End: ${evt.end})`;
-      selectEvents.appendChild(opt);
-    });
-  }
+  if (!selectEvents) return Promise.resolve();
+  const searchEl = document.getElementById('select-events-search');
+  const params = new URLSearchParams({ sort: 'start', order: 'asc', limit: 500 });
+  if (searchEl && searchEl.value.trim()) params.set('search', searchEl.value.trim());
+  return fetch(`/api/events?${params}`)
+    .then(res => res.json())
+    .then(page => {
+      if (page.error) throw new Error(page.error);
+      const selected = [...selectEvents.selectedOptions].map(opt => window.scheduleEvents[opt.value])
+        .filter(Boolean);
+      window.scheduleEvents = {};
+      selectEvents.innerHTML = '';
+      const shown = page.events.concat(selected.filter(evt => !page.events.some(e => e.id === evt.id)));
+      shown.forEach(evt => {
+        window.scheduleEvents[evt.id] = evt;
+        const opt = document.createElement('option');
+        opt.value = evt.id;
+        opt.textContent = `${evt.name} (Start: ${evt.start}, End: ${evt.end})`;
+        opt.selected = selected.some(e => e.id === evt.id);
+        selectEvents.appendChild(opt);
+      });
+      if (page.next !== null) {
+        const opt = document.createElement('option');
+        opt.disabled = true;
+        opt.textContent = `${page.total - page.events.length} more events, refine the search...`;
+        selectEvents.appendChild(opt);
+      }
+    })
+    .catch(err => console.error('Error loading events for scheduling:', err));
 };
 
-/** Compare two events by the given field & order for sorting. */
-function eventCompare(a,b, field, order) {
-  let valA, valB;
-  switch(field) {
-    case 'end':
-      valA = new Date(a.end).getTime() || 0;
-      valB = new Date(b.end).getTime() || 0;
-      break;
-    case 'name':
-      valA = a.name.toLowerCase();
-      valB = b.name.toLowerCase();
-      break;
-    case 'duration':
-      const aStart = new Date(a.start).getTime() || 0;
-      const aEnd   = new Date(a.end).getTime()   || 0;
-      valA = aEnd - aStart;
-
-      const bStart = new Date(b.start).getTime() || 0;
-      const bEnd   = new Date(b.end).getTime()   || 0;
-      valB = bEnd - bStart;
-      break;
-    default:
-      // "start" or fallback
-      valA = new Date(a.start).getTime() || 0;
-      valB = new Date(b.start).getTime() || 0;
-      break;
-  }
-
-  if (valA < valB) return (order === 'asc' ? -1 : 1);
-  if (valA > valB) return (order === 'asc' ? 1 : -1);
-  return 0;
+/** Reload both the events list and the scheduling choices after events changed */
+function refreshEvents() {
+  window.fetchEvents();
+  window.fetchScheduleEvents();
 }
 
 /** Build the HTML for a single event item. */
@@ -179,8 +180,27 @@ window.editEvent = function(id) {
 
 /** Remove event by ID */
 window.removeEvent = function(id) {
-  window.events = window.events.filter(e => e.id !== id);
-  window.loadEvents();
+  fetch(`/api/events/${id}`, { method: 'DELETE' })
+    .then(refreshEvents)
+    .catch(err => console.error('Error removing event:', err));
+};
+
+/** Load the first page of matching events (or the next page with more=true) and refresh the list */
+window.fetchEvents = function(more) {
+  const params = eventsQuery();
+  params.set('limit', 100);
+  if (more && eventsNextOffset !== null) params.set('offset', eventsNextOffset);
+  return fetch(`/api/events?${params}`)
+    .then(res => res.json())
+    .then(page => {
+      if (page.error) throw new Error(page.error);
+      window.events = more ? window.events.concat(page.events) : page.events;
+      eventsNextOffset = page.next;
+      const summary = document.getElementById('events-summary');
+      if (summary) summary.textContent = `${window.events.length} of ${page.total} events`;
+      window.loadEvents();
+    })
+    .catch(err => console.error('Error loading events:', err));
 };
 
 /** Convert file to Base64 */
@@ -197,6 +217,7 @@ function readFileAsBase64(file) {
 document.addEventListener('DOMContentLoaded', () => {
   // Initialize the new UI controls (search/sort) and date/time display logic
   initEvents();
+  refreshEvents();
 
   // Hook up the event form
   const addEventForm = document.getElementById('add-event-form');
@@ -217,26 +238,18 @@ document.addEventListener('DOMContentLoaded', () => {
         imageUrl = await readFileAsBase64(imageFileInput.files[0]);
       }
 
-      if (evtId) {
-        // Update existing
-        const existing = window.events.find(e => e.id === parseInt(evtId));
-        if (existing) {
-          existing.name  = name;
-          existing.start = start;
-          existing.end   = end;
-          if (imageUrl) {
-            existing.imageUrl = imageUrl;
-          }
-        }
-      } else {
-        // Add new
-        window.events.push({
-          id: window.nextEventId++,
-          name,
-          start,
-          end,
-          imageUrl
+      // Update existing or add new; the server keeps the canonical list
+      try {
+        const res = await fetch(evtId ? `/api/events/${parseInt(evtId)}` : '/api/events', {
+          method: evtId ? 'PUT' : 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify({ name, start, end, imageUrl })
         });
+        const saved = await res.json();
+        if (saved.error) throw new Error(saved.error);
+      } catch (err) {
+        alert(`Error saving event: ${err.message}`);
+        return;
       }
 
       // Clear form
@@ -247,18 +260,20 @@ document.addEventListener('DOMContentLoaded', () => {
       if (imageFileInput) imageFileInput.value = '';
       document.getElementById('save-event-btn').textContent = 'Add Event';
 
-      window.loadEvents();
+      refreshEvents();
     });
   }
 });
 
 /* ================================
-   Import/Export logic
+   Import/Export logic (parsing and formatting happen on the server)
 ================================ */
 window.importCsvBtn   = document.getElementById('import-csv-btn');
 window.importJsonBtn  = document.getElementById('import-json-btn');
+window.importIcsBtn   = document.getElementById('import-ics-btn');
 window.importCsvFile  = document.getElementById('import-csv-file');
 window.importJsonFile = document.getElementById('import-json-file');
+window.importIcsFile  = document.getElementById('import-ics-file');
 
 window.exportCsvBtn   = document.getElementById('export-csv-btn');
 window.exportJsonBtn  = document.getElementById('export-json-btn');
@@ -266,70 +281,41 @@ window.exportPdfBtn   = document.getElementById('export-pdf-btn');
 window.exportIcsBtn   = document.getElementById('export-ics-btn');
 
 if (window.exportCsvBtn) {
-  window.exportCsvBtn.addEventListener('click', exportEventsAsCSV);
+  window.exportCsvBtn.addEventListener('click', () => exportEvents('csv'));
 }
 if (window.exportJsonBtn) {
-  window.exportJsonBtn.addEventListener('click', exportEventsAsJSON);
+  window.exportJsonBtn.addEventListener('click', () => exportEvents('json'));
 }
 if (window.exportPdfBtn) {
   window.exportPdfBtn.addEventListener('click', exportEventsAsPDF);
 }
 if (window.exportIcsBtn) {
-  window.exportIcsBtn.addEventListener('click', exportEventsAsICS);
+  window.exportIcsBtn.addEventListener('click', () => exportEvents('ics'));
 }
 
-// CSV import
-if (window.importCsvBtn && window.importCsvFile) {
-  window.importCsvBtn.addEventListener('click', () => {
-    window.importCsvFile.click();
-  });
-  window.importCsvFile.addEventListener('change', (e) => {
-    if (e.target.files.length > 0) {
-      importEventsFromCSV(e.target.files[0]);
-      window.importCsvFile.value = '';
-    }
-  });
-}
-
-// JSON import
-if (window.importJsonBtn && window.importJsonFile) {
-  window.importJsonBtn.addEventListener('click', () => {
-    window.importJsonFile.click();
-  });
-  window.importJsonFile.addEventListener('change', (e) => {
+// CSV/JSON/iCal import: the button opens its hidden file input
+[
+  [window.importCsvBtn, window.importCsvFile, 'csv'],
+  [window.importJsonBtn, window.importJsonFile, 'json'],
+  [window.importIcsBtn, window.importIcsFile, 'ics']
+].forEach(([button, input, format]) => {
+  if (!button || !input) return;
+  button.addEventListener('click', () => input.click());
+  input.addEventListener('change', (e) => {
     if (e.target.files.length > 0) {
-      importEventsFromJSON(e.target.files[0]);
-      window.importJsonFile.value = '';
+      importEvents(e.target.files[0], format);
+      input.value = '';
     }
   });
-}
-
-/** Export to CSV */
-function exportEventsAsCSV() {
-  let csv = "data:text/csv;charset=utf-8," +
-    "id,name,start,end\n" +
-    window.events.map(evt =>
-      `${evt.id},"${(evt.name || '').replace(/"/g,'""')}",${evt.start || ''},${evt.end || ''}`
-    ).join("\n");
-  
-  const encodedUri = encodeURI(csv);
-  const link = document.createElement('a');
-  link.href = encodedUri;
-  link.download = "events.csv";
-  document.body.appendChild(link);
-  link.click();
-  document.body.removeChild(link);
-}
-
-/** Export to JSON */
-function exportEventsAsJSON() {
-  const json = JSON.stringify(window.events, null, 2);
-  const blob = new Blob([json], { type: "application/json" });
-  const url = URL.createObjectURL(blob);
+});
 
+/** Export every event matching the current search, in the current order (streamed download) */
+function exportEvents(format) {
+  const params = eventsQuery();
+  params.set('format', format);
   const link = document.createElement('a');
-  link.href = url;
-  link.download = "events.json";
+  link.href = `/api/events/export?${params}`;
+  link.download = `events.${format}`;
   document.body.appendChild(link);
   link.click();
   document.body.removeChild(link);
@@ -354,88 +340,17 @@ function exportEventsAsPDF() {
   alert("Placeholder PDF export. Use a real PDF library for an actual PDF!");
 }
 
-/** Export to ICS */
-function exportEventsAsICS() {
-  let ics = "BEGIN:VCALENDAR\nVERSION:2.0\nPRODID:-//MyApp//Events//EN\n";
-  window.events.forEach(evt => {
-    ics += "BEGIN:VEVENT\n";
-    ics += `UID:event-${evt.id}\n`;
-
-    // For real usage, parse and format times better
-    ics += `DTSTART:${(evt.start||'').replace(/[-:]/g,"").replace("T","")}Z\n`;
-    ics += `DTEND:${(evt.end||'').replace(/[-:]/g,"").replace("T","")}Z\n`;
-    ics += `SUMMARY:${evt.name}\n`;
-    ics += "END:VEVENT\n";
-  });
-  ics += "END:VCALENDAR";
-
-  const blob = new Blob([ics], { type: "text/calendar" });
-  const url = URL.createObjectURL(blob);
-  const link = document.createElement('a');
-  link.href = url;
-  link.download = "events.ics";
-  document.body.appendChild(link);
-  link.click();
-  document.body.removeChild(link);
-
-  alert("Exported ICS. Times might need better formatting for real iCalendar usage!");
-}
-
-/** CSV Import */
-function parseCsvLine(line) {
-  return line.split(",").map(l => l.trim());
-}
-function importEventsFromCSV(file) {
-  const reader = new FileReader();
-  reader.onload = (e) => {
-    const text = e.target.result;
-    const lines= text.split("\n").map(l => l.trim()).filter(l => l);
-    if (!lines.length) return;
-
-    // remove header
-    lines.shift(); // "id,name,start,end"
-    lines.forEach(line => {
-      const [idRaw, nameRaw, start, end] = parseCsvLine(line);
-      const id = parseInt(idRaw);
-      const evName = (nameRaw || '').replace(/^"|"$/g,"");
-      window.events.push({
-        id: isNaN(id) ? window.nextEventId++ : id,
-        name: evName,
-        start: start || '',
-        end: end || ''
-      });
-      if (!isNaN(id) && id >= window.nextEventId) {
-        window.nextEventId = id + 1;
-      }
-    });
-    window.loadEvents();
-    alert("Imported events from CSV.");
-  };
-  reader.readAsText(file);
-}
-
-/** JSON Import */
-function importEventsFromJSON(file) {
-  const reader = new FileReader();
-  reader.onload = (e) => {
-    try {
-      const arr = JSON.parse(e.target.result);
-      arr.forEach(evt => {
-        if (!evt.id) {
-          evt.id = window.nextEventId++;
-        } else if (evt.id >= window.nextEventId) {
-          window.nextEventId = evt.id + 1;
-        }
-        evt.name  = evt.name  || 'Untitled';
-        evt.start = evt.start || '';
-        evt.end   = evt.end   || '';
-        window.events.push(evt);
-      });
-      window.loadEvents();
-      alert("Imported events from JSON.");
-    } catch(err) {
-      alert("Failed to parse JSON file.");
-    }
-  };
-  reader.readAsText(file);
+/** Upload a CSV/JSON/ICS file as-is; the server parses and inserts it in batches */
+function importEvents(file, format) {
+  fetch(`/api/events/import?format=${format}`, { method: 'POST', body: file })
+    .then(res => res.json())
+    .then(report => {
+      if (report.imported === undefined) throw new Error(report.error);
+      let message = `Imported ${report.imported} events, skipped ${report.skipped}.`;
+      if (report.errors.length) message += `\n\n${report.errors.join('\n')}`;
+      if (report.error) message += `\n\nStopped early: ${report.error}`;
+      alert(message);
+      refreshEvents();
+    })
+    .catch(err => alert(`Import failed: ${err.message}`));
 }
@@ -0,0 +1,85 @@
+// highlights.js
+
+window.highlights = (function() {
+  let pollTimer = null;  // Polls /api/highlights while clips are being cut
+
+  // Fill the camera selector from the loaded camera list
+  function loadCameras() {
+    const select = document.getElementById('highlight-camera');
+    if (!select) return;
+    select.innerHTML = '';
+    camera.getStreams().forEach(stream => {
+      const option = document.createElement('option');
+      option.value = stream.id;
+      option.textContent = stream.name;
+      select.appendChild(option);
+    });
+  }
+
+  function renderJob(job) {
+    const li = document.createElement('li');
+    const percent = Math.round(job.progress * 100);
+    let status = job.state;
+    if (job.state === 'running') status = `cutting ${percent}%`;
+    if (job.state === 'failed') status = `failed: ${job.error}`;
+    li.innerHTML = `<strong>${job.name}</strong> (${job.start} - ${job.end}) <span>${status}</span>`;
+    if (job.state === 'done') {
+      const link = document.createElement('a');
+      link.href = `/api/highlights/${job.id}/download`;
+      link.textContent = ' Download';
+      li.appendChild(link);
+    }
+    return li;
+  }
+
+  function loadHighlights() {
+    return fetch('/api/highlights')
+      .then(res => res.json())
+      .then(jobs => {
+        const list = document.getElementById('highlights-list');
+        if (!list) return;
+        list.innerHTML = '';
+        jobs.forEach(job => list.appendChild(renderJob(job)));
+
+        // Keep polling only while something is still queued or running
+        const busy = jobs.some(job => job.state === 'queued' || job.state === 'running');
+        clearTimeout(pollTimer);
+        pollTimer = busy ? setTimeout(loadHighlights, 1000) : null;
+      })
+      .catch(err => console.error('Error loading highlights:', err));
+  }
+
+  function createHighlight(e) {
+    e.preventDefault();
+    const body = {
+      streamId: parseInt(document.getElementById('highlight-camera').value),
+      start: document.getElementById('highlight-start').value,
+      end: document.getElementById('highlight-end').value,
+      name: document.getElementById('highlight-name').value || null
+    };
+    fetch('/api/highlights', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(body)
+    })
+    .then(res => res.json())
+    .then(data => {
+      if (data.error) alert(`Error: ${data.error}`);
+      loadHighlights();
+    })
+    .catch(err => console.error(err));
+  }
+
+  function init() {
+    const form = document.getElementById('highlight-form');
+    if (form) form.addEventListener('submit', createHighlight);
+    loadCameras();
+    loadHighlights();
+  }
+
+  return {
+    init,
+    loadCameras,
+    loadHighlights
+  };
+})();
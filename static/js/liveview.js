@@ -0,0 +1,167 @@
+// liveview.js
+
+window.liveView = (function() {
+  let hls = null;       // hls.js instance of the open view
+  let latencyTimer = null;
+  let streamId = null;  // camera of the open view
+  let moveSending = false;  // a /move request is in flight
+  let pendingMove = null;   // newest joystick state not sent yet
+
+  function setStatus(text) {
+    const status = document.getElementById('live-status');
+    if (status) status.textContent = text;
+  }
+
+  // Open the enlarged LL-HLS view of a camera
+  function open(id) {
+    const stream = camera.getStreams().find(s => s.id === id);
+    const video = document.getElementById('live-video');
+    const url = `/live/${id}/index.m3u8`;
+    close();
+    streamId = id;
+    document.getElementById('live-title').textContent = stream ? stream.name : `Camera ${id}`;
+    document.getElementById('live-modal').style.display = 'flex';
+    setStatus('Connecting...');
+
+    if (window.Hls && Hls.isSupported()) {
+      hls = new Hls({ lowLatencyMode: true, backBufferLength: 10 });
+      hls.on(Hls.Events.ERROR, (event, data) => {
+        if (data.fatal) setStatus(`Live view error: ${data.details}`);
+      });
+      hls.loadSource(url);
+      hls.attachMedia(video);
+    } else if (video.canPlayType('application/vnd.apple.mpegurl')) {
+      video.src = url;  // Safari plays LL-HLS natively
+    } else if (!window.Hls) {
+      setStatus('hls.js could not be loaded: run test_tools/vendor_hls.py to serve it locally.');
+      return;
+    } else {
+      setStatus('This browser cannot play HLS.');
+      return;
+    }
+    video.play().catch(() => {});
+
+    // Show how far behind the live edge the picture is
+    latencyTimer = setInterval(() => {
+      if (hls && hls.latency) setStatus(`Latency: ${hls.latency.toFixed(1)} s`);
+    }, 1000);
+  }
+
+  function close() {
+    if (streamId !== null) ptz('stop');
+    streamId = null;
+    clearInterval(latencyTimer);
+    if (hls) {
+      hls.destroy();
+      hls = null;
+    }
+    const video = document.getElementById('live-video');
+    if (video) {
+      video.removeAttribute('src');
+      video.load();
+    }
+    const modal = document.getElementById('live-modal');
+    if (modal) modal.style.display = 'none';
+  }
+
+  function ptz(path, body, method = 'POST') {
+    return fetch(`/api/ptz/${streamId}/${path}`, {
+      method,
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(body || {})
+    })
+      .then(res => res.json().then(data => {
+        if (!res.ok) setStatus(`PTZ: ${data.error}`);
+        return data;
+      }))
+      .catch(err => setStatus(`PTZ error: ${err}`));
+  }
+
+  // Send the newest joystick state; updates made while a request is in flight replace each other
+  function move(state) {
+    pendingMove = state;
+    if (moveSending || streamId === null) return;
+    moveSending = true;
+    const next = pendingMove;
+    pendingMove = null;
+    ptz('move', next).finally(() => {
+      moveSending = false;
+      if (pendingMove) move(pendingMove);
+    });
+  }
+
+  function initJoystick() {
+    const pad = document.getElementById('ptz-pad');
+    const knob = document.getElementById('ptz-knob');
+    if (!pad) return;
+    const radius = pad.clientWidth / 2 || 60;
+
+    function update(e) {
+      const rect = pad.getBoundingClientRect();
+      let x = (e.clientX - rect.left - radius) / radius;
+      let y = (e.clientY - rect.top - radius) / radius;
+      const length = Math.hypot(x, y);
+      if (length > 1) {
+        x /= length;
+        y /= length;
+      }
+      knob.style.transform = `translate(${x * radius}px, ${y * radius}px)`;
+      move({ pan: +x.toFixed(2), tilt: +(-y).toFixed(2) });
+    }
+
+    function release() {
+      knob.style.transform = '';
+      move({ pan: 0, tilt: 0 });
+    }
+
+    pad.addEventListener('pointerdown', e => {
+      pad.setPointerCapture(e.pointerId);
+      update(e);
+    });
+    pad.addEventListener('pointermove', e => {
+      if (pad.hasPointerCapture(e.pointerId)) update(e);
+    });
+    pad.addEventListener('pointerup', release);
+    pad.addEventListener('pointercancel', release);
+
+    // Zoom/focus buttons move while held
+    document.querySelectorAll('#ptz-controls [data-axis]').forEach(button => {
+      const axis = button.dataset.axis;
+      button.addEventListener('pointerdown', () => move({ [axis]: Number(button.dataset.value) }));
+      button.addEventListener('pointerup', () => move({ [axis]: 0 }));
+      button.addEventListener('pointerleave', () => move({ [axis]: 0 }));
+    });
+  }
+
+  function presetNumber() {
+    return document.getElementById('ptz-preset').value;
+  }
+
+  document.addEventListener('DOMContentLoaded', () => {
+    const closeBtn = document.getElementById('live-close');
+    if (closeBtn) closeBtn.addEventListener('click', close);
+    if (!document.getElementById('ptz-controls')) return;
+    initJoystick();
+    document.getElementById('ptz-home').addEventListener('click', () => ptz('home'));
+    document.getElementById('ptz-autofocus').addEventListener('click', () => ptz('autofocus'));
+    document.getElementById('ptz-recall').addEventListener('click', () => {
+      setStatus(`Moving to preset ${presetNumber()}...`);
+      ptz(`preset/${presetNumber()}`).then(data => data && data.message && setStatus(data.message));
+    });
+    document.getElementById('ptz-save').addEventListener('click', () => {
+      ptz(`preset/${presetNumber()}`, {}, 'PUT').then(data => data && data.message && setStatus(data.message));
+    });
+    document.getElementById('ptz-record').addEventListener('click', () => {
+      setStatus(`Moving to preset ${presetNumber()} before recording...`);
+      ptz(`preset/${presetNumber()}/record`).then(data => data && data.message && setStatus(data.message));
+    });
+    document.getElementById('ptz-stop-record').addEventListener('click', () => {
+      ptz('stop_recording').then(data => data && data.message && setStatus(data.message));
+    });
+  });
+
+  return {
+    open,
+    close
+  };
+})();
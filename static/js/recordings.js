@@ -2,40 +2,61 @@
 
 window.recording = (function() {
 
-    // The public methods
-    function startRecording(streamId) {
-      fetch('/api/start_recording', {
+    // Start/stop/restart cameras now; onResult gets one result per camera as it finishes
+    async function bulk(action, streamIds, onResult, settings) {
+      const res = await fetch(`/api/recorders/${action}`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ streamId })
-      })
-      .then(res => res.json())
-      .then(data => {
-        if (data.error) alert(`Error: ${data.error}`);
-        else alert(data.message || 'Recording started');
-      })
-      .catch(err => console.error(err));
+        body: JSON.stringify({ streamIds, settings })
+      });
+      if (!res.ok) {
+        const data = await res.json();
+        throw new Error(data.error);
+      }
+      // The response is NDJSON: read it line by line as the cameras complete
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffered = '';
+      let summary = null;
+      for (;;) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffered += decoder.decode(value, { stream: true });
+        const lines = buffered.split('\n');
+        buffered = lines.pop();
+        lines.filter(line => line.trim()).forEach(line => {
+          const result = JSON.parse(line);
+          if (result.done) summary = result;
+          else if (onResult) onResult(result);
+        });
+      }
+      return summary;
+    }
+
+    // The public methods
+    function startRecording(streamId) {
+      // Send the camera's format, location and segment duration along
+      const settings = camera.getEffectiveSettings(streamId);
+      bulk('start', [streamId], result => {
+        if (result.ok) alert('Recording started');
+        else alert(`Error: ${result.error}`);
+      }, settings)
+        .catch(err => alert(`Error: ${err.message}`));
     }
   
     function stopRecording(streamId) {
-      fetch('/api/stop_recording', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ streamId })
-      })
-      .then(res => res.json())
-      .then(data => {
-        if (data.error) alert(`Error: ${data.error}`);
-        else alert(data.message || 'Recording stopped');
+      bulk('stop', [streamId], result => {
+        if (result.ok) alert('Recording stopped');
+        else alert(`Error: ${result.error}`);
       })
-      .catch(err => console.error(err));
+        .catch(err => alert(`Error: ${err.message}`));
     }
   
     // Return an object for public usage
     return {
+      bulk,
       startRecording,
       stopRecording
     };
   
   })();
-  
\ No newline at end of file
@@ -1,19 +1,21 @@
 // rtspmanager.js
 
 window.rtspManager = (function() {
+    // Live subscriptions share ONE Server-Sent Events connection
+    let subscribers = {};   // { streamUri: Set(callback) }
+    let latestStats = {};   // { streamUri: merged stats object }
+    let eventSource = null;
+    let reconnectTimer = null;
+
     /**
      * getStats(streamUri)
-     * For a real implementation, this function would connect to a backend or use a library
-     * to extract real statistics from the given RTSP URI.
-     *
-     * For now, we make a call to a hypothetical API endpoint and return the JSON response.
+     * Fetch the latest cached stats snapshot for the given RTSP URI once.
      *
      * @param {string} streamUri - The RTSP URI of the camera.
      * @returns {Promise<Object|null>} - A promise that resolves to a stats object, or null on failure.
      */
     async function getStats(streamUri) {
       try {
-        // Replace '/api/rtspStats' with your real backend endpoint.
         const response = await fetch(`/api/rtspStats?uri=${encodeURIComponent(streamUri)}`);
         if (!response.ok) {
           throw new Error(`RTSP stats request failed: ${response.status}`);
@@ -25,10 +27,83 @@ window.rtspManager = (function() {
         return null;
       }
     }
+
+    // Merge a delta pushed by the server and notify the URI's callbacks.
+    function applyDelta(streamUri, delta, serverTime) {
+      const stats = Object.assign(latestStats[streamUri] || {}, delta);
+      latestStats[streamUri] = stats;
+      if (stats.meta && stats.meta.updated) {
+        stats.meta.age = serverTime - stats.meta.updated;
+      }
+      (subscribers[streamUri] || []).forEach(callback => callback(stats));
+    }
+
+    // (Re)open the multiplexed stream for the current set of URIs.
+    function reconnect() {
+      reconnectTimer = null;
+      if (eventSource) {
+        eventSource.close();
+        eventSource = null;
+      }
+      const uris = Object.keys(subscribers);
+      if (!uris.length) return;
+
+      // Deltas restart from a full snapshot on every new connection
+      latestStats = {};
+      const query = uris.map(uri => `uri=${encodeURIComponent(uri)}`).join('&');
+      eventSource = new EventSource(`/api/stats/stream?${query}`);
+      eventSource.onmessage = (e) => {
+        try {
+          const message = JSON.parse(e.data);
+          Object.keys(message.stats).forEach(uri => applyDelta(uri, message.stats[uri], message.time));
+        } catch (err) {
+          console.error("rtspManager stream error:", err);
+        }
+      };
+    }
+
+    // Batch subscription changes made in the same tick into one reconnect.
+    function scheduleReconnect() {
+      if (!reconnectTimer) {
+        reconnectTimer = setTimeout(reconnect, 0);
+      }
+    }
+
+    /**
+     * subscribe(streamUri, callback)
+     * Receive pushed stats for the given RTSP URI.
+     *
+     * @param {string} streamUri - The RTSP URI of the camera.
+     * @param {Function} callback - Called with the full stats object on every change.
+     * @returns {Function} - Call to unsubscribe.
+     */
+    function subscribe(streamUri, callback) {
+      const isNew = !subscribers[streamUri];
+      if (isNew) subscribers[streamUri] = new Set();
+      subscribers[streamUri].add(callback);
+      if (isNew) {
+        scheduleReconnect();
+      } else if (latestStats[streamUri]) {
+        callback(latestStats[streamUri]);
+      }
+      return () => unsubscribe(streamUri, callback);
+    }
+
+    function unsubscribe(streamUri, callback) {
+      const callbacks = subscribers[streamUri];
+      if (!callbacks) return;
+      callbacks.delete(callback);
+      if (!callbacks.size) {
+        delete subscribers[streamUri];
+        delete latestStats[streamUri];
+        scheduleReconnect();
+      }
+    }
   
     // Return the public API
     return {
-      getStats
+      getStats,
+      subscribe,
+      unsubscribe
     };
   })();
-  
\ No newline at end of file
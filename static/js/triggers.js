@@ -0,0 +1,96 @@
+// triggers.js
+
+window.triggers = (function() {
+  let statusTimer = null;  // Refreshes the pre-roll status while the tab is in use
+
+  function selectedCameras() {
+    const select = document.getElementById('trigger-cameras');
+    return select ? Array.from(select.selectedOptions).map(o => parseInt(o.value)) : [];
+  }
+
+  // Fill the camera selector from the loaded camera list
+  function loadCameras() {
+    const select = document.getElementById('trigger-cameras');
+    if (!select) return;
+    select.innerHTML = '';
+    camera.getStreams().forEach(stream => {
+      const option = document.createElement('option');
+      option.value = stream.id;
+      option.textContent = stream.name;
+      select.appendChild(option);
+    });
+  }
+
+  function post(url, body) {
+    return fetch(url, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(body)
+    })
+    .then(res => res.json())
+    .then(data => {
+      if (data.error) alert(`Error: ${data.error}`);
+      loadStatus();
+      return data;
+    })
+    .catch(err => console.error(err));
+  }
+
+  function arm() {
+    const streamIds = selectedCameras();
+    if (!streamIds.length) return alert('Select at least one camera to arm.');
+    post('/api/triggers/arm', { streamIds });
+  }
+
+  function fire(label) {
+    const streamIds = selectedCameras();
+    if (!streamIds.length) return alert('Select at least one camera to trigger.');
+    const postRoll = parseFloat(document.getElementById('trigger-post-roll').value) || null;
+    post('/api/triggers/fire', { streamIds, label, postRoll });
+  }
+
+  function loadStatus() {
+    return fetch('/api/triggers')
+      .then(res => res.json())
+      .then(status => {
+        const list = document.getElementById('trigger-status');
+        if (!list) return;
+        list.innerHTML = '';
+        status.armed.forEach(buffer => {
+          const li = document.createElement('li');
+          const mb = (buffer.bytes / 1048576).toFixed(1);
+          const maxMb = (buffer.max_bytes / 1048576).toFixed(0);
+          li.textContent = `Camera ${buffer.stream_id}: ${buffer.seconds}s pre-roll, ${mb} / ${maxMb} MB`;
+          list.appendChild(li);
+        });
+        status.recordings.forEach(rec => {
+          const li = document.createElement('li');
+          const state = rec.error ? `failed: ${rec.error}` : rec.running ? `recording, ${rec.ends_in}s left` : 'saved';
+          li.textContent = `${rec.label || 'Trigger'} - Camera ${rec.stream_id}: ${state} (${rec.path || ''})`;
+          list.appendChild(li);
+        });
+      })
+      .catch(err => console.error('Error loading trigger status:', err));
+  }
+
+  function init() {
+    loadCameras();
+    const armBtn = document.getElementById('trigger-arm-btn');
+    if (armBtn) armBtn.addEventListener('click', arm);
+    document.querySelectorAll('.trigger-button').forEach(btn => {
+      btn.addEventListener('click', () => fire(btn.dataset.label));
+    });
+    loadStatus();
+    clearInterval(statusTimer);
+    statusTimer = setInterval(() => {
+      const tab = document.getElementById('triggers-tab');
+      if (tab && tab.style.display !== 'none') loadStatus();
+    }, 2000);
+  }
+
+  return {
+    init,
+    loadCameras,
+    loadStatus
+  };
+})();
@@ -0,0 +1,109 @@
+// videos.js
+
+window.videos = (function() {
+  let nextCursor = null;  // Cursor of the next catalog page, null on the last page
+
+  // Fill the camera selector from the loaded camera list
+  function loadCameras() {
+    const select = document.getElementById('recordings-camera');
+    if (!select) return;
+    select.innerHTML = '<option value="">All cameras</option>';
+    camera.getStreams().forEach(stream => {
+      const option = document.createElement('option');
+      option.value = stream.id;
+      option.textContent = stream.name;
+      select.appendChild(option);
+    });
+  }
+
+  function cameraName(streamId) {
+    const stream = camera.getStreams().find(s => s.id === streamId);
+    return stream ? stream.name : `Camera ${streamId}`;
+  }
+
+  function formatSize(bytes) {
+    if (bytes == null) return '?';
+    return bytes >= 1073741824 ? `${(bytes / 1073741824).toFixed(2)} GB` : `${(bytes / 1048576).toFixed(1)} MB`;
+  }
+
+  function renderSegment(segment) {
+    const li = document.createElement('li');
+    const minutes = Math.floor(segment.duration / 60);
+    const seconds = Math.round(segment.duration % 60).toString().padStart(2, '0');
+    const video = segment.codec ? `${segment.codec} ${segment.width}x${segment.height}` : 'not probed yet';
+    li.innerHTML = `<strong>${cameraName(segment.stream_id)}</strong> ${segment.start} - ${segment.end} ` +
+                   `(${minutes}:${seconds}, ${formatSize(segment.size)}, ${video})`;
+    const link = document.createElement('a');
+    link.href = `/api/recordings/${segment.id}/download`;
+    link.textContent = ' Download';
+    li.appendChild(link);
+    return li;
+  }
+
+  function query(cursor) {
+    const params = new URLSearchParams({ limit: 100 });
+    const streamId = document.getElementById('recordings-camera').value;
+    const start = document.getElementById('recordings-start').value;
+    const end = document.getElementById('recordings-end').value;
+    const codec = document.getElementById('recordings-codec').value;
+    if (streamId) params.set('streamId', streamId);
+    if (start) params.set('start', start);
+    if (end) params.set('end', end);
+    if (codec) params.set('codec', codec);
+    if (cursor) params.set('cursor', cursor);
+    return params;
+  }
+
+  function loadCodecs(codecs) {
+    const select = document.getElementById('recordings-codec');
+    const selected = select.value;
+    select.innerHTML = '<option value="">Any</option>';
+    codecs.forEach(codec => {
+      const option = document.createElement('option');
+      option.value = codec;
+      option.textContent = codec;
+      select.appendChild(option);
+    });
+    select.value = selected;
+  }
+
+  // Load the first page (append=false) or the next one
+  function loadRecordings(append) {
+    const list = document.getElementById('recorded-videos');
+    if (!list) return Promise.resolve();
+    return fetch(`/api/recordings?${query(append ? nextCursor : null)}`)
+      .then(res => res.json())
+      .then(page => {
+        if (page.error) return alert(`Error: ${page.error}`);
+        if (!append) list.innerHTML = '';
+        page.segments.forEach(segment => list.appendChild(renderSegment(segment)));
+        nextCursor = page.next;
+        loadCodecs(page.codecs);
+        if (page.total !== null) {
+          document.getElementById('recordings-summary').textContent = `${page.total} recordings`;
+        }
+        document.getElementById('recordings-more').style.display = nextCursor ? 'inline' : 'none';
+      })
+      .catch(err => console.error('Error loading recordings:', err));
+  }
+
+  function init() {
+    loadCameras();
+    const form = document.getElementById('recordings-filter');
+    if (form) {
+      form.addEventListener('submit', e => {
+        e.preventDefault();
+        loadRecordings(false);
+      });
+    }
+    const more = document.getElementById('recordings-more');
+    if (more) more.addEventListener('click', () => loadRecordings(true));
+    loadRecordings(false);
+  }
+
+  return {
+    init,
+    loadCameras,
+    loadRecordings
+  };
+})();
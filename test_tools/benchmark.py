@@ -0,0 +1,225 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+# Keep the benchmark's cameras and footage away from the real database and recordings
+WORKDIR = tempfile.mkdtemp(prefix="ptz-bench-")
+os.environ.setdefault("PTZ_DB_PATH", os.path.join(WORKDIR, "bench.db"))
+
+from werkzeug.serving import make_server
+
+import app as ptz_app
+import synthetic_rtsp
+from recording import relay, rtsp_manager, store
+
+HTTP_PORT = 5055
+FPS = 30
+
+
+# -- process sampling (Linux /proc) ---------------------------------------------
+
+def cpu_seconds(pid):
+    """Return user+system CPU seconds of a process, or None if unavailable."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return None
+
+def rss_bytes(pid):
+    """Return the resident set size of a process, or None if unavailable."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+def sample_processes(pids, interval):
+    """Return {pid: {"cpu_percent", "rss_bytes"}} measured over the interval."""
+    before = {pid: cpu_seconds(pid) for pid in pids}
+    time.sleep(interval)
+    result = {}
+    for pid in pids:
+        after = cpu_seconds(pid)
+        cpu = (after - before[pid]) / interval * 100 if after is not None and before[pid] is not None else None
+        result[pid] = {"cpu_percent": round(cpu, 1) if cpu is not None else None, "rss_bytes": rss_bytes(pid)}
+    return result
+
+
+# -- measurements -------------------------------------------------------------
+
+def http_get_json(url):
+    start = time.perf_counter()
+    with urllib.request.urlopen(url, timeout=30) as response:
+        body = json.loads(response.read())
+    return body, time.perf_counter() - start
+
+def measure_stats_api(base_url, uri, requests=20, timeout=60):
+    """Time /api/rtspStats: the cold call, time until real numbers arrive, then steady polling."""
+    url = f"{base_url}/api/rtspStats?uri={urllib.parse.quote(uri, safe='')}"
+    started = time.perf_counter()
+    _, cold = http_get_json(url)
+    first_stats = None
+    while time.perf_counter() - started < timeout:
+        body, _ = http_get_json(url)
+        if not body["meta"]["pending"]:
+            first_stats = time.perf_counter() - started
+            break
+        time.sleep(0.2)
+    latencies = sorted(http_get_json(url)[1] for _ in range(requests))
+    return {
+        "cold_ms": round(cold * 1000, 2),
+        "time_to_first_stats_s": round(first_stats, 2) if first_stats is not None else None,
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2),
+    }
+
+def start_camera(stream_id, uri, location, timeout=30):
+    """Start a recording and return the seconds until its first byte hits the disk (or None)."""
+    started = time.perf_counter()
+    if not rtsp_manager.start_recording(stream_id, uri, {"location": location, "segmentation": 1}):
+        return None
+    # The segment muxer reports total_size=N/A, so look for the segment itself
+    pattern = os.path.join(rtsp_manager.camera_directory(stream_id, location), "*-*-*", f"camera_{stream_id}_*")
+    while time.perf_counter() - started < timeout:
+        for path in glob.glob(pattern):
+            try:
+                if os.path.getsize(path) > 0:
+                    return round(time.perf_counter() - started, 3)
+            except OSError:
+                pass
+        time.sleep(0.05)
+    return None
+
+def measure_resources(cameras, interval=5):
+    """CPU and RSS of the recorder and relay ffmpeg of every camera."""
+    pids = {}
+    for stream_id, uri in cameras:
+        recorder = rtsp_manager.active_recordings.get(stream_id)
+        upstream = relay.relays.get(uri)
+        pids[stream_id] = {
+            "recorder": recorder.process.pid if recorder and recorder.process else None,
+            "relay": upstream.process.pid if upstream and upstream.process else None,
+        }
+    samples = sample_processes([p for kinds in pids.values() for p in kinds.values() if p], interval)
+    return [{"stream_id": stream_id, **{kind: samples.get(pid) for kind, pid in kinds.items()}}
+            for stream_id, kinds in pids.items()]
+
+def measure_frames(stream_ids, window):
+    """Return {stream_id: frames muxed per second} over the window, from ffmpeg's progress."""
+    def frames():
+        return {i: (rtsp_manager.active_recordings[i].progress.get("frame") or 0) for i in stream_ids}
+    before = frames()
+    time.sleep(window)
+    after = frames()
+    return {i: (after[i] - before[i]) / window for i in stream_ids}
+
+def ramp(cameras, location, window=10, warmup=5, threshold=0.95):
+    """
+    Add cameras in doubling steps until some camera records less than
+    `threshold` of the source frame rate. Returns the list of steps.
+    """
+    steps = []
+    running = 0
+    size = 1
+    while running < len(cameras):
+        size = min(size, len(cameras))
+        for stream_id, uri in cameras[running:size]:
+            start_camera(stream_id, uri, location)
+        running = size
+        time.sleep(warmup)
+        rates = measure_frames([i for i, _ in cameras[:running]], window)
+        dropped = sum(c.dropped for r in relay.relays.values() for c in list(r.consumers))
+        worst = min(rates.values()) / FPS
+        steps.append({"cameras": running, "min_frame_ratio": round(worst, 3),
+                      "fps": {str(k): round(v, 2) for k, v in rates.items()},
+                      "relay_dropped_chunks": dropped, "ok": worst >= threshold and dropped == 0})
+        print(f"  {running} cameras: worst camera at {worst:.1%} of {FPS} fps", file=sys.stderr)
+        if not steps[-1]["ok"]:
+            break
+        size *= 2
+    return steps
+
+
+# -- main -----------------------------------------------------------------------
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmark against synthetic local RTSP cameras")
+    parser.add_argument("--cameras", type=int, default=8, help="maximum number of cameras in the ramp")
+    parser.add_argument("--size", default="1280x720")
+    parser.add_argument("--bitrate", default="2M")
+    parser.add_argument("--window", type=float, default=10, help="measurement window per ramp step (s)")
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    print(f"Starting {args.cameras} synthetic cameras...", file=sys.stderr)
+    server, urls = synthetic_rtsp.start_sources(args.cameras, size=args.size, fps=FPS, bitrate=args.bitrate)
+    http = make_server("127.0.0.1", HTTP_PORT, ptz_app.app, threaded=True)
+    threading.Thread(target=http.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{HTTP_PORT}"
+    location = os.path.join(WORKDIR, "recordings")
+    cameras = [(store.add_stream(f"Bench {i + 1}", url)["id"], url) for i, url in enumerate(urls)]
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": git_commit(),
+        "host": {"platform": platform.platform(), "cpus": os.cpu_count(), "python": platform.python_version()},
+        "config": {"cameras": args.cameras, "size": args.size, "fps": FPS, "bitrate": args.bitrate,
+                   "relay": relay.ENABLED, "rtsp_server": "mediamtx" if synthetic_rtsp.MEDIAMTX else "python",
+                   "note": "synthetic sources are encoded on the same host"},
+    }
+    try:
+        print("Measuring /api/rtspStats...", file=sys.stderr)
+        results["stats_api"] = measure_stats_api(base_url, urls[0])
+
+        print("Measuring start-to-first-byte...", file=sys.stderr)
+        stream_id, uri = cameras[0]
+        results["start_to_first_byte_s"] = start_camera(stream_id, uri, location)
+        results["resources_single_camera"] = measure_resources(cameras[:1])
+
+        print("Ramping up cameras...", file=sys.stderr)
+        results["ramp"] = ramp(cameras, location, window=args.window)
+        passed = [step["cameras"] for step in results["ramp"] if step["ok"]]
+        results["max_cameras_without_drops"] = max(passed) if passed else 0
+        results["resources_at_max"] = measure_resources(cameras[:results["ramp"][-1]["cameras"]])
+    finally:
+        for stream_id in list(rtsp_manager.active_recordings):
+            rtsp_manager.stop_recording(stream_id)
+        http.shutdown()
+        server.close()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+VISCA_PORT = 5678
+
+
+class FakeCamera:
+    """
+    A VISCA-over-IP camera on localhost. Every command is ACKed on one of
+    two sockets and completed after command_delay (preset recalls after
+    preset_delay); a third concurrent command gets "buffer full", like a
+    real camera. Received packets are kept in .received as (time, bytes).
+    """
+
+    def __init__(self, port=VISCA_PORT, command_delay=0.02, preset_delay=0.5):
+        self.command_delay = command_delay
+        self.preset_delay = preset_delay
+        self.received = []
+        self.position = {"pan": 0, "tilt": 0, "zoom": 0}
+        self.server = socket.create_server(("127.0.0.1", port))
+        self.port = self.server.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        sockets = {1: False, 2: False}
+        lock = threading.Lock()
+        buffer = b""
+
+        def complete(number, delay):
+            time.sleep(delay)
+            with lock:
+                sockets[number] = False
+                conn.sendall(bytes([0x90, 0x50 | number, 0xFF]))
+
+        while True:
+            try:
+                data = conn.recv(4096)
+            except OSError:
+                return
+            if not data:
+                return
+            buffer += data
+            while b"\xff" in buffer:
+                packet, buffer = buffer.split(b"\xff", 1)
+                self.received.append((time.monotonic(), packet + b"\xff"))
+                preset = packet[2:4] == b"\x04\x3f"
+                with lock:
+                    free = [n for n, busy in sockets.items() if not busy]
+                    if not free:
+                        conn.sendall(b"\x90\x60\x03\xff")
+                        continue
+                    sockets[free[0]] = True
+                    conn.sendall(bytes([0x90, 0x40 | free[0], 0xFF]))
+                delay = self.preset_delay if preset else self.command_delay
+                threading.Thread(target=complete, args=(free[0], delay), daemon=True).start()
+
+    def close(self):
+        self.server.close()
+
+
+def joystick_burst(camera, updates=500, duration=1.0):
+    """Move a virtual joystick as fast as the browser would and report what reached the camera."""
+    from recording import ptz
+
+    controller = ptz.Controller(1, ptz.ViscaBackend("127.0.0.1", camera.port))
+    camera.received.clear()
+    started = time.monotonic()
+    for i in range(updates):
+        controller.move("pan_tilt", (i % 20 - 10) / 10, 0.5)
+        time.sleep(duration / updates)
+    controller.move("pan_tilt", 0, 0)
+    last = time.monotonic()
+    time.sleep(0.3)
+    stop = b"\x81\x01\x06\x01\x01\x01\x03\x03\xff"
+    stop_at = next((t for t, packet in camera.received if packet == stop), None)
+    print(f"{updates} joystick updates in {last - started:.2f} s -> {len(camera.received)} VISCA commands sent")
+    if stop_at is None:
+        print("FAIL: the final stop never reached the camera")
+    else:
+        print(f"Release-to-stop latency: {(stop_at - last) * 1000:.1f} ms")
+
+    before = time.monotonic()
+    controller.command("recall", 3).result(5)
+    print(f"Preset recall completed after {time.monotonic() - before:.2f} s")
+    controller.close()
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else VISCA_PORT
+    camera = FakeCamera(port)
+    if "--serve" in sys.argv:
+        print(f"Fake VISCA camera on 127.0.0.1:{camera.port}")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            camera.close()
+    else:
+        joystick_burst(camera)
+        camera.close()
@@ -0,0 +1,89 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from recording import motion
+
+# Path to ffmpeg (UPDATE TO YOUR ACTUAL PATH, falls back to ffmpeg on PATH)
+FFMPEG = shutil.which("ffmpeg") or r"C:\ffmpeg\bin\ffmpeg.exe"
+CAMERAS = 32
+CLIP_SECONDS = 20
+
+def make_test_clip(path):
+    """Encode a 1080p30 H.264 clip with a moving pattern, like a typical PTZ camera stream."""
+    cmd = [
+        FFMPEG, "-y", "-v", "error",
+        "-f", "lavfi", "-i", "testsrc2=size=1920x1080:rate=30",
+        "-t", str(CLIP_SECONDS),
+        "-c:v", "libx264", "-preset", "veryfast", "-g", "60", "-b:v", "6M",
+        "-f", "mpegts", path
+    ]
+    subprocess.run(cmd, check=True)
+
+def decode(clip):
+    """Decode a clip the way the motion engine does. Returns (frames, seconds)."""
+    cmd = motion.build_decode_cmd(clip)
+    cmd[0] = FFMPEG
+    start = time.time()
+    data = subprocess.run(cmd, stdout=subprocess.PIPE, check=True).stdout
+    return len(data) // motion.FRAME_BYTES, time.time() - start
+
+def bench_decoders(clip, cameras):
+    """Run one decoder per camera at once; every decoder must beat real time."""
+    with ThreadPoolExecutor(max_workers=cameras) as pool:
+        start = time.time()
+        results = list(pool.map(decode, [clip] * cameras))
+        wall = time.time() - start
+    frames = sum(f for f, _ in results)
+    slowest = max(s for _, s in results)
+    realtime = CLIP_SECONDS / slowest
+    print(f"{cameras} decoders: {frames} frames in {wall:.1f} s, slowest decoder at {realtime:.1f}x real time")
+    return realtime
+
+def bench_model(cameras, rounds=200):
+    """Time the batched NumPy analysis for all cameras. Returns seconds per batch."""
+    model = motion.MotionModel()
+    keys = list(range(cameras))
+    rng = np.random.default_rng(0)
+    frames = rng.integers(0, 255, (rounds, cameras, motion.FRAME_HEIGHT, motion.FRAME_WIDTH), np.uint8)
+    start = time.time()
+    for batch in frames:
+        model.update(keys, batch)
+    per_batch = (time.time() - start) / rounds
+    budget = 1.0 / motion.SAMPLE_FPS
+    print(f"Model: {per_batch * 1000:.2f} ms per batch of {cameras} cameras "
+          f"({per_batch / budget:.1%} of the {budget * 1000:.0f} ms budget)")
+    return per_batch
+
+def check_detection():
+    """A static scene must stay quiet and a moving square must trigger motion."""
+    model = motion.MotionModel()
+    scene = np.full((motion.FRAME_HEIGHT, motion.FRAME_WIDTH), 80, np.uint8)
+    for _ in range(5):
+        quiet = model.update([1], scene[None])[0]
+    assert quiet == 0, quiet
+    for x in range(0, 100, 10):
+        frame = scene.copy()
+        frame[30:60, x:x + 30] = 220
+        moving = model.update([1], frame[None])[0]
+    assert moving > motion.MOTION_RATIO, moving
+    print(f"✅ Motion detected (ratio {moving:.3f}), static scene quiet")
+
+if __name__ == "__main__":
+    cameras = int(sys.argv[1]) if len(sys.argv) > 1 else CAMERAS
+    check_detection()
+    bench_model(cameras)
+    with tempfile.TemporaryDirectory() as tmp:
+        clip = sys.argv[2] if len(sys.argv) > 2 else os.path.join(tmp, "testsrc.ts")
+        if len(sys.argv) <= 2:
+            make_test_clip(clip)
+        realtime = bench_decoders(clip, cameras)
+    print(f"{'✅' if realtime >= 1 else '❌'} {cameras} cameras on {os.cpu_count()} cores")
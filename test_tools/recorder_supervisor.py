@@ -0,0 +1,60 @@
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from recording import supervisor
+
+# Fake ffmpeg: prints "-progress" blocks, then either exits or stops growing.
+# Like the real segment muxer it has no single output file, so total_size is N/A.
+FAKE_FFMPEG = r'''
+import sys, time
+mode = sys.argv[1]
+for i in range(200):
+    if mode == "stall" and i >= 3:
+        time.sleep(0.2)
+        continue
+    print(f"frame={i}\nbitrate=N/A\ntotal_size=N/A\nout_time_us={i * 100000}\nspeed=1.00x\nprogress=continue", flush=True)
+    sys.stderr.write("x" * 1000 + "\n")
+    time.sleep(0.1)
+    if mode == "crash" and i == 5:
+        sys.exit(1)
+'''
+
+def run_case(mode, wait, on_progress=None):
+    """Start a supervised fake recorder and return its health after `wait` seconds."""
+    with tempfile.NamedTemporaryFile("w", suffix=".py", delete=False) as f:
+        f.write(FAKE_FFMPEG)
+    try:
+        recorder = supervisor.Recorder(mode, lambda: [sys.executable, f.name, mode], on_progress=on_progress)
+        recorder.start()
+        time.sleep(wait)
+        health = recorder.health()
+        assert recorder.stop(timeout=5)
+        return health
+    finally:
+        os.unlink(f.name)
+
+def check_supervisor():
+    supervisor.BACKOFF_BASE = 0.2
+    supervisor.STALL_TIMEOUT = 1
+
+    # Stand-in for rtsp_manager crediting each finished segment's size
+    health = run_case("steady", 1.5, on_progress=lambda r, block: r.count_written(1000))
+    assert health["state"] == "recording", health
+    assert health["frame"] > 0 and health["speed"] == 1.0 and health["bitrate_kbps"] is None, health
+    assert health["total_size"] >= 1000 * health["frame"], health
+    print(f"✅ Progress parsed: {health['frame']} frames, {health['total_size']} bytes from finished segments")
+
+    health = run_case("crash", 3)
+    assert health["restarts"] >= 1, health
+    print(f"✅ Crashed recorder restarted {health['restarts']} time(s)")
+
+    health = run_case("stall", 4)
+    assert health["stalls"] >= 1, health
+    print(f"✅ Stall detected {health['stalls']} time(s)")
+
+if __name__ == "__main__":
+    check_supervisor()
@@ -0,0 +1,109 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from recording.scheduler import Scheduler
+
+
+class FakeClock:
+    """A clock that only moves when told to."""
+
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def make_scheduler():
+    """Return (scheduler, clock, calls) where calls records ("start"/"stop", camera_id, schedule_id, time)."""
+    clock = FakeClock()
+    calls = []
+    scheduler = Scheduler(lambda camera_id, s: calls.append(("start", camera_id, s["schedule_id"], clock.now)),
+                          lambda camera_id, s: calls.append(("stop", camera_id, s["schedule_id"], clock.now)),
+                          clock=clock)
+    return scheduler, clock, calls
+
+
+def advance(scheduler, clock, seconds):
+    clock.now += seconds
+    scheduler.run_pending()
+
+
+def check_overlapping():
+    scheduler, clock, calls = make_scheduler()
+    t = clock.now
+    scheduler.add("a", [1, 2], t + 10, t + 30)
+    scheduler.add("b", [2, 3], t + 20, t + 40)
+    advance(scheduler, clock, 10)
+    advance(scheduler, clock, 10)
+    advance(scheduler, clock, 10)
+    advance(scheduler, clock, 10)
+    # Camera 2 is started by "a" and stopped by "b", the last schedule covering it
+    assert calls == [
+        ("start", 1, "a", t + 10), ("start", 2, "a", t + 10),
+        ("start", 3, "b", t + 20),
+        ("stop", 1, "a", t + 30),
+        ("stop", 2, "b", t + 40), ("stop", 3, "b", t + 40),
+    ], calls
+    # Finished schedules are dropped, so the table does not grow with history
+    assert scheduler.list_schedules() == [] and scheduler.active == {}, scheduler.list_schedules()
+    print("✅ Overlapping schedules start each camera once and stop it at the last end")
+
+
+def check_edited():
+    scheduler, clock, calls = make_scheduler()
+    t = clock.now
+    scheduler.add("a", [1], t + 10, t + 20)
+    scheduler.update("a", [1], t + 15, t + 25)  # moved before it started
+    advance(scheduler, clock, 10)
+    assert calls == [], calls
+    advance(scheduler, clock, 5)
+    assert calls == [("start", 1, "a", t + 15)], calls
+    # Extended while running: camera 1 keeps recording, camera 2 joins, nothing restarts
+    scheduler.update("a", [1, 2], t + 15, t + 40)
+    assert calls == [("start", 1, "a", t + 15), ("start", 2, "a", t + 15)], calls
+    advance(scheduler, clock, 10)  # the old end (t + 25) no longer fires
+    assert len(calls) == 2, calls
+    advance(scheduler, clock, 15)
+    assert calls[2:] == [("stop", 1, "a", t + 40), ("stop", 2, "a", t + 40)], calls
+    print("✅ Edited schedules fire only at their new times and hand running cameras over")
+
+
+def check_deleted():
+    scheduler, clock, calls = make_scheduler()
+    t = clock.now
+    scheduler.add("a", [1], t + 10, t + 20)
+    scheduler.add("b", [2], t + 10, t + 20)
+    scheduler.remove("a")  # before it started: never fires
+    advance(scheduler, clock, 10)
+    assert calls == [("start", 2, "b", t + 10)], calls
+    scheduler.remove("b")  # while running: stopped right away
+    assert calls[1:] == [("stop", 2, "b", t + 10)], calls
+    advance(scheduler, clock, 20)
+    assert len(calls) == 2 and scheduler.next_deadline() is None, calls
+    print("✅ Deleted schedules never fire and running ones stop immediately")
+
+
+def check_past():
+    scheduler, clock, calls = make_scheduler()
+    t = clock.now
+    for start, end in ((t - 20, t - 10), (t - 10, t)):
+        try:
+            scheduler.add("old", [1], start, end)
+        except ValueError:
+            continue
+        raise AssertionError(f"a schedule ending at {end - t:+} s was accepted")
+    scheduler.add("late", [1], t - 10, t + 10)  # started already: starts now, stops on time
+    scheduler.run_pending()
+    advance(scheduler, clock, 10)
+    assert calls == [("start", 1, "late", t), ("stop", 1, "late", t + 10)], calls
+    print("✅ Schedules that already ended are rejected")
+
+
+if __name__ == "__main__":
+    check_overlapping()
+    check_edited()
+    check_deleted()
+    check_past()
@@ -0,0 +1,48 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from recording import stream_analyzer
+
+# Path to ffmpeg (UPDATE TO YOUR ACTUAL PATH, falls back to ffmpeg on PATH)
+FFMPEG = shutil.which("ffmpeg") or r"C:\ffmpeg\bin\ffmpeg.exe"
+FPS = 30
+GOP = 60
+DURATION = 5
+
+def make_test_clip(path):
+    """Encode a synthetic H.264 clip with a known frame rate and GOP."""
+    cmd = [
+        FFMPEG, "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"testsrc=size=640x360:rate={FPS}",
+        "-t", str(DURATION + 2),
+        "-c:v", "libx264", "-g", str(GOP), "-keyint_min", str(GOP), "-sc_threshold", "0",
+        "-b:v", "1M", "-f", "mpegts", path
+    ]
+    subprocess.run(cmd, check=True)
+
+def check_local_clip():
+    """Run the single-session analyzer against a local file and check the results."""
+    with tempfile.TemporaryDirectory() as tmp:
+        clip = os.path.join(tmp, "testsrc.ts")
+        make_test_clip(clip)
+
+        summary, error = stream_analyzer.analyze_stream(clip, DURATION)
+        assert error is None, error
+        assert summary["codec"] == "h264", summary
+        assert f'{summary["width"]}x{summary["height"]}' == "640x360", summary
+        assert abs(summary["fps"] - FPS) < 0.5, summary
+        assert round(summary["gop_frames"]) == GOP, summary
+        assert summary["dropped_frames"] == 0, summary
+        assert summary["bitrate_bps"] > 0, summary
+
+        stats = stream_analyzer.format_stats(summary)
+        assert list(stats) == stream_analyzer.STATS_KEYS, stats
+        print(f"✅ Local clip analyzed: {stats}")
+
+if __name__ == "__main__":
+    check_local_clip()
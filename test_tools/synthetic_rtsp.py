@@ -0,0 +1,261 @@
+import os
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Path to ffmpeg (UPDATE TO YOUR ACTUAL PATH, falls back to ffmpeg on PATH)
+FFMPEG = shutil.which("ffmpeg") or r"C:\ffmpeg\bin\ffmpeg.exe"
+
+# mediamtx is used instead of the built-in server when it is on PATH
+MEDIAMTX = shutil.which("mediamtx")
+
+RTSP_PORT = 8554
+FIRST_RTP_PORT = 20000
+
+
+class Client:
+    """An RTSP connection; replies and interleaved media share one socket, so sends are serialized."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.lock = threading.Lock()
+
+    def sendall(self, data):
+        with self.lock:
+            self.conn.sendall(data)
+
+
+class TestSource:
+    """One ffmpeg testsrc encoder sending H.264 over RTP to a local UDP port."""
+
+    def __init__(self, name, rtp_port, workdir, size="1280x720", fps=30, gop=60, bitrate="2M"):
+        self.name = name
+        self.rtp_port = rtp_port
+        self.sdp_path = os.path.join(workdir, f"{name}.sdp")
+        self.clients = []
+        self.lock = threading.Lock()
+        self.sockets = []
+        for channel, port in enumerate((rtp_port, rtp_port + 1)):  # RTP, then RTCP
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind(("127.0.0.1", port))
+            self.sockets.append(sock)
+            threading.Thread(target=self._forward, args=(sock, channel), daemon=True).start()
+        self.process = subprocess.Popen([
+            FFMPEG, "-hide_banner", "-loglevel", "error", "-re",
+            "-f", "lavfi", "-i", f"testsrc2=size={size}:rate={fps}",
+            "-c:v", "libx264", "-preset", "ultrafast", "-tune", "zerolatency",
+            "-g", str(gop), "-keyint_min", str(gop), "-sc_threshold", "0",
+            "-b:v", bitrate, "-pix_fmt", "yuv420p",
+            "-f", "rtp", "-sdp_file", self.sdp_path,
+            f"rtp://127.0.0.1:{rtp_port}?rtcpport={rtp_port + 1}&pkt_size=1400"
+        ], stdin=subprocess.DEVNULL)
+
+    def sdp(self, timeout=10):
+        """Return the session description, once ffmpeg has written it."""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if os.path.exists(self.sdp_path) and os.path.getsize(self.sdp_path) > 0:
+                with open(self.sdp_path) as f:
+                    lines = [line.strip() for line in f if line.strip()]
+                lines = [("c=IN IP4 0.0.0.0" if line.startswith("c=") else line) for line in lines]
+                lines = [(" ".join(["m=video", "0"] + line.split()[2:]) if line.startswith("m=") else line)
+                         for line in lines]
+                return "\r\n".join(lines + ["a=control:trackID=0"]) + "\r\n"
+            time.sleep(0.1)
+        raise TimeoutError(f"ffmpeg did not start source {self.name}")
+
+    def _forward(self, sock, channel):
+        # Re-send every RTP/RTCP datagram to the PLAYing clients, interleaved on the RTSP connection
+        while True:
+            try:
+                packet, _ = sock.recvfrom(65536)
+            except OSError:
+                return
+            frame = b"$" + bytes([channel]) + struct.pack(">H", len(packet)) + packet
+            with self.lock:
+                clients = list(self.clients)
+            for client in clients:
+                try:
+                    client.sendall(frame)
+                except OSError:
+                    self.remove(client)
+
+    def add(self, client):
+        with self.lock:
+            self.clients.append(client)
+
+    def remove(self, client):
+        with self.lock:
+            if client in self.clients:
+                self.clients.remove(client)
+
+    def close(self):
+        self.process.kill()
+        self.process.wait()
+        for sock in self.sockets:
+            sock.close()
+
+
+class RtspServer:
+    """
+    Minimal RTSP server (OPTIONS, DESCRIBE, SETUP over TCP-interleaved,
+    PLAY, TEARDOWN) publishing each TestSource at rtsp://127.0.0.1:<port>/<name>.
+    Enough for ffmpeg/ffprobe clients using -rtsp_transport tcp.
+    """
+
+    def __init__(self, sources, port=RTSP_PORT):
+        self.sources = {source.name: source for source in sources}
+        self.port = port
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(("127.0.0.1", port))
+        self.listener.listen(64)
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def url(self, name):
+        return f"rtsp://127.0.0.1:{self.port}/{name}"
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            conn.settimeout(5)
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _read_request(self, conn, buffer):
+        while True:
+            # Interleaved RTCP receiver reports from the client are skipped
+            while buffer[:1] == b"$" and len(buffer) >= 4:
+                length = struct.unpack(">H", buffer[2:4])[0]
+                if len(buffer) < 4 + length:
+                    break
+                buffer = buffer[4 + length:]
+            end = buffer.find(b"\r\n\r\n")
+            if end >= 0 and buffer[:1] != b"$":
+                head, buffer = buffer[:end].decode("utf-8", "replace"), buffer[end + 4:]
+                lines = head.split("\r\n")
+                headers = {}
+                for line in lines[1:]:
+                    key, _, value = line.partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                body_length = int(headers.get("content-length", 0))
+                buffer = buffer[body_length:]
+                return lines[0].split(" "), headers, buffer
+            try:
+                data = conn.recv(65536)
+            except socket.timeout:
+                continue
+            if not data:
+                return None, None, buffer
+            buffer += data
+
+    def _serve(self, conn):
+        buffer = b""
+        source = None
+        client = Client(conn)
+        session = str(int(time.time() * 1000) % 100000000)
+        try:
+            while True:
+                request, headers, buffer = self._read_request(conn, buffer)
+                if request is None:
+                    return
+                method, url = request[0], request[1]
+                cseq = headers.get("cseq", "0")
+                extra, body = [], ""
+                name = url.split("/", 3)[-1].split("/")[0] if url.count("/") >= 3 else ""
+                if method == "OPTIONS":
+                    extra.append("Public: OPTIONS, DESCRIBE, SETUP, PLAY, TEARDOWN")
+                elif method == "DESCRIBE":
+                    if name not in self.sources:
+                        client.sendall(f"RTSP/1.0 404 Not Found\r\nCSeq: {cseq}\r\n\r\n".encode())
+                        continue
+                    body = self.sources[name].sdp()
+                    extra += ["Content-Type: application/sdp", f"Content-Base: {self.url(name)}/"]
+                elif method == "SETUP":
+                    source = self.sources.get(name)
+                    transport = headers.get("transport", "")
+                    if source is None or "TCP" not in transport.upper():
+                        client.sendall(f"RTSP/1.0 461 Unsupported Transport\r\nCSeq: {cseq}\r\n\r\n".encode())
+                        continue
+                    extra += ["Transport: RTP/AVP/TCP;unicast;interleaved=0-1", f"Session: {session};timeout=60"]
+                elif method == "PLAY":
+                    extra.append(f"Session: {session}")
+                elif method == "TEARDOWN":
+                    client.sendall(f"RTSP/1.0 200 OK\r\nCSeq: {cseq}\r\nSession: {session}\r\n\r\n".encode())
+                    return
+                response = ["RTSP/1.0 200 OK", f"CSeq: {cseq}"] + extra
+                if body:
+                    response.append(f"Content-Length: {len(body.encode())}")
+                client.sendall(("\r\n".join(response) + "\r\n\r\n" + body).encode())
+                if method == "PLAY" and source is not None:
+                    source.add(client)
+        except OSError:
+            pass
+        finally:
+            if source is not None:
+                source.remove(client)
+            conn.close()
+
+    def close(self):
+        self.listener.close()
+        for source in self.sources.values():
+            source.close()
+
+
+class MediaMtxServer:
+    """mediamtx with one ffmpeg testsrc publisher per camera."""
+
+    def __init__(self, names, port=RTSP_PORT, size="1280x720", fps=30, gop=60, bitrate="2M"):
+        self.port = port
+        self.server = subprocess.Popen([MEDIAMTX], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        time.sleep(1)
+        self.publishers = [subprocess.Popen([
+            FFMPEG, "-hide_banner", "-loglevel", "error", "-re",
+            "-f", "lavfi", "-i", f"testsrc2=size={size}:rate={fps}",
+            "-c:v", "libx264", "-preset", "ultrafast", "-tune", "zerolatency",
+            "-g", str(gop), "-b:v", bitrate, "-pix_fmt", "yuv420p",
+            "-f", "rtsp", "-rtsp_transport", "tcp", self.url(name)
+        ], stdin=subprocess.DEVNULL) for name in names]
+
+    def url(self, name):
+        return f"rtsp://127.0.0.1:{self.port}/{name}"
+
+    def close(self):
+        for process in self.publishers + [self.server]:
+            process.kill()
+            process.wait()
+
+
+def start_sources(count, port=RTSP_PORT, use_mediamtx=None, **encoder):
+    """
+    Start `count` synthetic H.264 cameras. Returns (server, urls); call
+    server.close() when done.
+    """
+    names = [f"cam{i + 1}" for i in range(count)]
+    if use_mediamtx if use_mediamtx is not None else MEDIAMTX:
+        server = MediaMtxServer(names, port, **encoder)
+    else:
+        workdir = tempfile.mkdtemp(prefix="synthetic-rtsp-")
+        sources = [TestSource(name, FIRST_RTP_PORT + 2 * i, workdir, **encoder) for i, name in enumerate(names)]
+        server = RtspServer(sources, port)
+    return server, [server.url(name) for name in names]
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    server, urls = start_sources(count)
+    print("Serving:")
+    for url in urls:
+        print(f"  {url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.close()
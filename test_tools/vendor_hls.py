@@ -0,0 +1,46 @@
+import base64
+import hashlib
+import io
+import json
+import os
+import sys
+import tarfile
+import urllib.request
+
+# hls.js release served by the live view; bump it together with HLS_VERSION in app.py
+HLS_VERSION = "1.5.20"
+
+REGISTRY = "https://registry.npmjs.org/hls.js/"
+TARGET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "static", "js", "vendor", "hls.min.js")
+
+
+def fetch(url):
+    with urllib.request.urlopen(url, timeout=30) as response:
+        return response.read()
+
+
+def vendor(version=HLS_VERSION, target=TARGET):
+    """
+    Download the pinned hls.js release from the npm registry, check the
+    tarball against the registry's published integrity hash and write
+    dist/hls.min.js to static/js/vendor/. Returns the file's sha384.
+    """
+    meta = json.loads(fetch(REGISTRY + version))
+    tarball = fetch(meta["dist"]["tarball"])
+    algorithm, _, expected = meta["dist"]["integrity"].partition("-")
+    actual = base64.b64encode(hashlib.new(algorithm, tarball).digest()).decode()
+    if actual != expected:
+        raise RuntimeError(f"hls.js {version} tarball does not match its {algorithm} integrity hash")
+    with tarfile.open(fileobj=io.BytesIO(tarball)) as archive:
+        script = archive.extractfile("package/dist/hls.min.js").read()
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, "wb") as f:
+        f.write(f"/* hls.js {version} (Apache-2.0) vendored by test_tools/vendor_hls.py */\n".encode() + script)
+    with open(target, "rb") as f:
+        return base64.b64encode(hashlib.sha384(f.read()).digest()).decode()
+
+
+if __name__ == "__main__":
+    version = sys.argv[1] if len(sys.argv) > 1 else HLS_VERSION
+    digest = vendor(version)
+    print(f"Wrote {os.path.normpath(TARGET)} (hls.js {version}, sha384-{digest})")